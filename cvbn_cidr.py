@@ -0,0 +1,219 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_cidr
+    :synopsis: CIDR overlap index of subnets of CVBN vSwitch instances and servers
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'CidrIndex' class that keeps IPv4 subnets (*networking.subnet*) of
+one switch or server and checks new CIDRs for overlaps before they are sent to the agent.
+
+Two CIDR blocks are either disjoint or one contains the other, so a new block overlaps
+an existing one if an existing block is its supernet (one dict lookup per prefix length)
+or starts inside it (bisect over sorted block starts). Both checks are O(log n).
+*suggest* returns the first free aligned block of the requested size.
+
+Once built with *vswitch.subnetIndex(uuid)* or *vbn.subnetIndex()*, *addSubnet* (and
+*addNetwork* of 'vswitch') raise CvbnApiFailure for invalid or overlapping CIDR without
+talking to the agent. The CIDR is claimed in the same step as it is checked and held
+until the agent answers, so concurrent adds of overlapping subnets can not both pass.
+
+>>> index = vswitch.subnetIndex("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+>>> print index.check("192.168.30.128/25")
+192.168.30.128/25 overlaps with 192.168.30.0/24
+>>> print index.suggest(24, "192.168.0.0/16")
+192.168.0.0/24
+
+"""
+
+import bisect
+import threading
+from cvbn_ipam import ip_to_int, int_to_ip
+
+def parse(cidr):
+    """Return tuple (start, prefix length) of IPv4 *cidr*; ValueError if not valid
+    """
+    try:
+        address, length = cidr.split('/')
+        length = int(length)
+        start = ip_to_int(address)
+    except Exception:
+        raise ValueError("invalid CIDR {}".format(cidr))
+    if length < 0 or length > 32 or address.count('.') != 3:
+        raise ValueError("invalid CIDR {}".format(cidr))
+    mask = (0xffffffff << (32 - length)) & 0xffffffff
+    return (start & mask, length)
+
+def _size(length):
+    return 1 << (32 - length)
+
+def _format(start, length):
+    return '{}/{}'.format(int_to_ip(start), length)
+
+class CidrIndex(object):
+    """Overlap index of subnets
+
+    :param subnets: iterable of networking.subnet objects (*id* and *cidr* attributes)
+    """
+    def __init__(self, subnets = ()):
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._starts = []
+        self._ends = {}
+        self._keys = {}
+        for subnet in subnets:
+            self.add(subnet['id'], subnet['cidr'])
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, cidr):
+        """Add subnet *key* (e.g. subnet id) with *cidr*; overlapping blocks are accepted
+        (the index reflects the agent's state), use *check* before
+        """
+        block = parse(cidr)
+        with self._lock:
+            self._add(key, block)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def claim(self, cidr):
+        """.. function:: claim(cidr)
+
+        Validate new subnet *cidr* and reserve it at once, so a concurrent add of an
+        overlapping subnet fails the check. The claim is held until *release*
+
+        :returns: None if *cidr* is valid and claimed, the reason otherwise
+
+        """
+        try:
+            block = parse(cidr)
+        except ValueError as error:
+            return str(error)
+        with self._lock:
+            other = self._overlaps(*block)
+            if other != None:
+                return "{} overlaps with {}".format(cidr, other)
+            self._add(('claim', block), block)
+        return None
+
+    def release(self, cidr, key = None):
+        """Drop claim of *cidr*; keep the block as subnet *key* if the subnet was created
+        """
+        block = parse(cidr)
+        with self._lock:
+            self._remove(('claim', block))
+            if key != None:
+                self._add(key, block)
+
+    def _add(self, key, block):
+        self._keys[key] = block
+        owners = self._blocks.setdefault(block, set())
+        owners.add(key)
+        if len(owners) == 1:
+            position = bisect.bisect_left(self._starts, block[0])
+            self._starts.insert(position, block[0])
+            end = block[0] + _size(block[1]) - 1
+            self._ends[block[0]] = max(self._ends.get(block[0], end), end)
+
+    def _remove(self, key):
+        block = self._keys.pop(key, None)
+        if block == None:
+            return
+        owners = self._blocks[block]
+        owners.discard(key)
+        if owners:
+            return
+        del self._blocks[block]
+        position = bisect.bisect_left(self._starts, block[0])
+        del self._starts[position]
+        # other blocks may start at the same address (nested prefixes)
+        ends = [start + _size(length) - 1 for start, length in self._blocks if start == block[0]]
+        if ends:
+            self._ends[block[0]] = max(ends)
+        else:
+            del self._ends[block[0]]
+
+    def _supernet(self, start, length):
+        for shorter in range(length, -1, -1):
+            mask = (0xffffffff << (32 - shorter)) & 0xffffffff
+            block = (start & mask, shorter)
+            if block in self._blocks:
+                return block
+        return None
+
+    def _inside(self, start, length):
+        position = bisect.bisect_left(self._starts, start)
+        if position < len(self._starts) and self._starts[position] <= start + _size(length) - 1:
+            return self._starts[position]
+        return None
+
+    def overlaps(self, cidr):
+        """Return existing CIDR overlapping *cidr*, None if there is none
+        """
+        start, length = parse(cidr)
+        with self._lock:
+            return self._overlaps(start, length)
+
+    def _overlaps(self, start, length):
+        block = self._supernet(start, length)
+        if block != None:
+            return _format(*block)
+        inside = self._inside(start, length)
+        if inside == None:
+            return None
+        # largest block starting at that address
+        size = self._ends[inside] - inside + 1
+        return _format(inside, 33 - size.bit_length())
+
+    def check(self, cidr):
+        """.. function:: check(cidr)
+
+        Validate new subnet *cidr*
+
+        :returns: None if *cidr* is valid and free, the reason otherwise
+
+        """
+        try:
+            parse(cidr)
+        except ValueError as error:
+            return str(error)
+        other = self.overlaps(cidr)
+        if other != None:
+            return "{} overlaps with {}".format(cidr, other)
+        return None
+
+    def suggest(self, length, within = '10.0.0.0/8'):
+        """.. function:: suggest(length, within = '10.0.0.0/8')
+
+        Return first free block with prefix *length* inside *within*, None if there is none
+
+        """
+        base, baseLength = parse(within)
+        if length < baseLength:
+            return None
+        size = _size(length)
+        last = base + _size(baseLength) - 1
+        with self._lock:
+            block = self._supernet(base, baseLength)
+            if block != None:
+                return None
+            candidate = base
+            # blocks are sorted by start and nested or disjoint, so a single pass finds the first gap
+            position = bisect.bisect_left(self._starts, base)
+            while position < len(self._starts):
+                start = self._starts[position]
+                if start > last or start > candidate + size - 1:
+                    break
+                end = self._ends[start]
+                if end >= candidate:
+                    # next block aligned to its size
+                    candidate = (end + size) // size * size
+                position = position + 1
+            if candidate + size - 1 <= last:
+                return _format(candidate, length)
+        return None
@@ -0,0 +1,159 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_clientpool
+    :synopsis: Pool of shared warm 'vbn', 'vswitch' and 'rcs' objects
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'ClientPool' class that hands out one shared, thread-safe client
+object per (kind, server, host, credentials), so worker threads stop building their own
+objects and paying autodiscovery and authentication each time.
+
+'vbn' and 'vswitch' objects of one server share one autodiscovery and one set of RPC
+method objects (see cvbn_multihost); 'rcs' objects are keyed by their whole definition
+(credentials are kept only as a digest in the key). With *warm* the connection or
+token is established when the object is created. *wrap* is applied once to each new
+object, e.g. to stack cvbn_retry or cvbn_ratelimit on it.
+
+>>> import cvbn_clientpool, cvbn_retry
+>>> pool = cvbn_clientpool.ClientPool(wrap = cvbn_retry.resilient)
+>>> vswitch = pool.vswitch("cvbb.example.com", "7d1c2ab0-2c1d-4a8e-9a57-0d3f1c9d4e11")
+>>> _rcs = pool.rcs(rcs_def)
+>>> print pool.stats()
+{'clients': 2, 'servers': 1, 'hits': 0, 'misses': 2}
+
+"""
+
+import hashlib
+import json
+import threading
+import cvbn_multihost
+import rcs_module
+
+VBN = 'vbn'
+VSWITCH = 'vswitch'
+RCS = 'rcs'
+
+def credentials(rcs_def):
+    """Return digest of RCS definition *rcs_def* used as the credentials part of the key
+    """
+    return hashlib.sha1(json.dumps(rcs_def, sort_keys = True).encode('utf-8')).hexdigest()
+
+class _Entry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.client = None
+
+class ClientPool(object):
+    """Pool of shared client objects
+
+    :param wrap: optional callable applied to every new client, returning the client
+    :param warm: connect/authenticate when the client is created. Default True
+    """
+    def __init__(self, wrap = None, warm = True):
+        self.wrap = wrap
+        self.warm = warm
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._servers = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _multi(self, server):
+        with self._lock:
+            multi = self._servers.get(server)
+            if multi == None:
+                multi = self._servers[server] = cvbn_multihost.MultiHost(server)
+            return multi
+
+    def _get(self, key, create):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry == None:
+                entry = self._entries[key] = _Entry()
+        # created outside of the pool lock, so a slow server does not block the others
+        with entry.lock:
+            if entry.client != None:
+                with self._lock:
+                    self.hits = self.hits + 1
+                return entry.client
+            client = create()
+            if self.wrap != None:
+                client = self.wrap(client)
+            entry.client = client
+            with self._lock:
+                self.misses = self.misses + 1
+            return client
+
+    def vbn(self, server, host):
+        """Return shared cvbn_server.vbn object of CvBN *host* behind *server*
+        """
+        def create():
+            multi = self._multi(server)
+            if self.warm:
+                multi._connect()
+            return multi.vbn(host)
+        return self._get((VBN, server, host, None), create)
+
+    def vswitch(self, server, host):
+        """Return shared cvbn_vswitch.vswitch object of CvBN *host* behind *server*
+        """
+        def create():
+            multi = self._multi(server)
+            if self.warm:
+                multi._connect()
+            return multi.vswitch(host)
+        return self._get((VSWITCH, server, host, None), create)
+
+    def rcs(self, rcs_def, http = None):
+        """Return shared rcs_module.rcs object of RCS definition *rcs_def*
+        """
+        def create():
+            client = rcs_module.rcs(rcs_def, http = http)
+            if self.warm:
+                client.warmup()
+            return client
+        return self._get((RCS, rcs_def.get('server'), rcs_def.get('port'), credentials(rcs_def)), create)
+
+    def get(self, kind, server, host = None, rcs_def = None):
+        """.. function:: get(kind, server, host = None, rcs_def = None)
+
+        Return shared client of *kind* ('vbn', 'vswitch' or 'rcs')
+
+        """
+        if kind == VBN:
+            return self.vbn(server, host)
+        if kind == VSWITCH:
+            return self.vswitch(server, host)
+        if kind == RCS:
+            return self.rcs(rcs_def)
+        raise ValueError("unknown client kind {}".format(kind))
+
+    def discard(self, kind, server, host = None, rcs_def = None):
+        """Drop pooled client, e.g. after its server was redeployed; next *get* creates new one
+        """
+        if kind == RCS:
+            key = (RCS, rcs_def.get('server'), rcs_def.get('port'), credentials(rcs_def))
+        else:
+            key = (kind, server, host, None)
+        with self._lock:
+            self._entries.pop(key, None)
+            multi = self._servers.get(server)
+        if multi != None and kind != RCS:
+            multi.forget(host)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._servers = {}
+
+    def stats(self):
+        with self._lock:
+            return {'clients': sum(1 for entry in self._entries.values() if entry.client != None),
+                    'servers': len(self._servers),
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+default_pool = ClientPool()
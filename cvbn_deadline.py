@@ -0,0 +1,331 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_deadline
+    :synopsis: Deadlines and per-call timeouts of CVBN RPC and RCS REST calls
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing time budgets propagated through nested operations. A top-level
+call is run inside *deadline(seconds)* context; every RPC and HTTP request issued by
+the current thread (and by pool workers of cvbn_pipeline, which inherit the context)
+is bounded by the remaining budget:
+
+* HTTP requests get *timeout* keyword of 'requests' set to the remaining budget,
+* RPC requests, which take no timeout, are run by shared worker threads (at most
+  *WORKERS* requests at a time) and abandoned when the budget runs out; a request
+  still queued for a worker at the deadline is not sent at all. The RPC methods give
+  no way to interrupt a request or to set its socket timeout, so an abandoned request
+  is left to finish in its thread, which no longer counts against *WORKERS* (another
+  thread takes over the queue) and exits when the request returns,
+* requests issued after the deadline are not sent at all.
+
+'DeadlineExceeded' carries the partial progress of the operation: writes (RPC set/delete,
+HTTP POST/PUT/DELETE) *completed* before the deadline and the request *abandoned* in
+flight, whose outcome is unknown. Clients wrapped with *bounded* also apply *timeout*
+to every request made outside of deadline context.
+
+'vbn', 'vswitch' and 'rcs' methods re-raise DeadlineExceeded unchanged (it is not
+turned into CvbnApiFailure/RcsApiFailure), so it reaches the caller.
+
+>>> import cvbn_deadline, cvbn_vswitch
+>>> vswitch = cvbn_deadline.bounded(cvbn_vswitch.vswitch("localhost","none"), timeout = 30)
+>>> try:
+...     with cvbn_deadline.deadline(10):
+...         vswitch.deleteSwitch("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+... except cvbn_deadline.DeadlineExceeded as error:
+...     print error.completed, error.abandoned
+[('delete', 'ea2db47c-1cbe-4846-9ba6-141c3ac59508', 'networking.port.gre')] ('delete', 'ea2db47c-1cbe-4846-9ba6-141c3ac59508', 'networking.domain')
+
+"""
+
+import collections
+import contextlib
+import threading
+import time
+from cvbn_transport import MethodWrapper, HttpWrapper, WRITE_METHODS, wrap_client
+
+# bounded RPC requests run at a time by the shared worker threads (abandoned ones not counted)
+WORKERS = 16
+
+_context = threading.local()
+_pool = None
+_poolLock = threading.Lock()
+
+class DeadlineExceeded(Exception):
+    """Exception raised when time budget of an operation runs out
+
+    :ivar completed: list of writes completed before the deadline
+    :ivar abandoned: request in flight when the deadline expired (outcome unknown), or None
+    :ivar elapsed: seconds since the start of the operation
+    """
+    def __init__(self, message, deadline, abandoned = None):
+        Exception.__init__(self, message)
+        self.completed = deadline.completed()
+        self.abandoned = abandoned
+        self.elapsed = time.time() - deadline.started
+
+class Deadline(object):
+    """Time budget of one operation, shared by its nested calls and worker threads
+
+    :param seconds: budget in seconds
+    :param callTimeout: optional cap of every single request in seconds
+    """
+    def __init__(self, seconds, callTimeout = None):
+        self.started = time.time()
+        self.expires = self.started + seconds
+        self.callTimeout = callTimeout
+        self._lock = threading.Lock()
+        self._completed = []
+
+    def remaining(self):
+        """Return seconds left (negative when expired)
+        """
+        return self.expires - time.time()
+
+    def timeout(self):
+        """Return timeout of the next request: the remaining budget capped by *callTimeout*
+        """
+        remaining = self.remaining()
+        if self.callTimeout != None:
+            return min(remaining, self.callTimeout)
+        return remaining
+
+    def done(self, step):
+        """Record completed write *step*
+        """
+        with self._lock:
+            self._completed.append(step)
+
+    def completed(self):
+        with self._lock:
+            return list(self._completed)
+
+    def check(self, step):
+        """Raise DeadlineExceeded if the budget is used up before *step* is sent
+        """
+        if self.remaining() <= 0:
+            raise DeadlineExceeded("deadline exceeded before {}".format(step), self)
+
+def current():
+    """Return Deadline of the current thread, None if there is none
+    """
+    return getattr(_context, 'deadline', None)
+
+@contextlib.contextmanager
+def deadline(seconds, callTimeout = None):
+    """.. function:: deadline(seconds, callTimeout = None)
+
+    Context manager bounding requests of the current thread to *seconds*. Nested
+    contexts can only shorten the budget of the outer one; progress is recorded
+    in the outermost deadline
+
+    :returns: Deadline object
+
+    """
+    outer = current()
+    if outer != None and outer.remaining() <= seconds and callTimeout == None:
+        yield outer
+        return
+    budget = Deadline(seconds, callTimeout)
+    if outer != None:
+        budget.expires = min(budget.expires, outer.expires)
+        budget.started = outer.started
+        budget._completed = outer._completed
+        budget._lock = outer._lock
+    _context.deadline = budget
+    try:
+        yield budget
+    finally:
+        _context.deadline = outer
+
+def bind(fn):
+    """.. function:: bind(fn)
+
+    Return *fn* running with the deadline of the calling thread, for functions
+    executed by other threads (thread pools)
+
+    """
+    budget = current()
+    if budget == None:
+        return fn
+
+    def bound(*args, **kwargs):
+        previous = current()
+        _context.deadline = budget
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _context.deadline = previous
+    return bound
+
+class _Task(object):
+    def __init__(self, fn):
+        self.fn = fn
+        self.started = False
+        self.finished = False
+        self.abandoned = False
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class _Workers(object):
+    '''daemon threads running bounded RPC requests, at most *size* at a time; threads of
+    abandoned requests are not counted and exit when their request returns'''
+    def __init__(self, size):
+        self.size = size
+        self._cond = threading.Condition()
+        self._tasks = collections.deque()
+        self._threads = 0
+        self._idle = 0
+        self._stuck = 0
+
+    def _spawn(self):
+        # called with _cond held, when a queued task has no idle thread to take it
+        if len(self._tasks) > self._idle and self._threads - self._stuck < self.size:
+            self._threads = self._threads + 1
+            thread = threading.Thread(target = self._loop)
+            thread.daemon = True
+            thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._idle = self._idle + 1
+                while not self._tasks:
+                    self._cond.wait()
+                self._idle = self._idle - 1
+                task = self._tasks.popleft()
+                task.started = True
+            try:
+                task.result = task.fn()
+            except BaseException as error:
+                task.error = error
+            surplus = False
+            with self._cond:
+                task.finished = True
+                if task.abandoned:
+                    self._stuck = self._stuck - 1
+                    # replaced by another thread meanwhile
+                    surplus = self._threads - self._stuck > self.size
+                    if surplus:
+                        self._threads = self._threads - 1
+            task.done.set()
+            if surplus:
+                return
+
+    def submit(self, task):
+        with self._cond:
+            self._tasks.append(task)
+            self._cond.notify()
+            self._spawn()
+
+    def cancel(self, task):
+        '''give up waiting for task: drop it if still queued, otherwise abandon it;
+        return (finished, started)'''
+        with self._cond:
+            if task.finished:
+                return (True, True)
+            if not task.started:
+                self._tasks.remove(task)
+                return (False, False)
+            task.abandoned = True
+            self._stuck = self._stuck + 1
+            self._spawn()
+            return (False, True)
+
+    def stats(self):
+        with self._cond:
+            return {'threads': self._threads, 'idle': self._idle, 'abandoned': self._stuck,
+                    'queued': len(self._tasks)}
+
+def _workers():
+    global _pool
+    with _poolLock:
+        if _pool == None:
+            _pool = _Workers(WORKERS)
+        return _pool
+
+def _run(fn, timeout):
+    '''run fn by the shared workers, return (finished, started, result, error); fn not
+    started by a worker within timeout is cancelled, fn still running is abandoned'''
+    task = _Task(fn)
+    workers = _workers()
+    workers.submit(task)
+    if not task.done.wait(max(timeout, 0)):
+        finished, started = workers.cancel(task)
+        if not finished:
+            return (False, started, None, None)
+    return (True, True, task.result, task.error)
+
+class DeadlineMethod(MethodWrapper):
+    """RPC method wrapper bounding requests by deadline of the calling thread
+    """
+    def __init__(self, name, method, timeout = None):
+        MethodWrapper.__init__(self, name, method)
+        self.timeout = timeout
+
+    def invoke(self, agent, cid, params):
+        budget = current()
+        step = (self.name, agent, params.get('tid'))
+        if budget == None:
+            if self.timeout == None:
+                return self.method.invoke(agent, cid, params)
+            timeout = self.timeout
+        else:
+            budget.check(step)
+            timeout = budget.timeout()
+        finished, started, result, error = _run(lambda: self.method.invoke(agent, cid, params), timeout)
+        if not finished:
+            if budget == None:
+                budget = Deadline(timeout)
+            if not started:
+                raise DeadlineExceeded("{} {} not sent, no free worker in {:.3f}s".format(self.name, agent, timeout), budget)
+            raise DeadlineExceeded("{} {} abandoned after {:.3f}s".format(self.name, agent, timeout), budget, step)
+        if error != None:
+            raise error
+        if budget != None and self.name in WRITE_METHODS:
+            budget.done(step)
+        return result
+
+class DeadlineHttp(HttpWrapper):
+    """HTTP layer wrapper passing remaining budget as *timeout* to 'requests'
+    """
+    def __init__(self, http, timeout = None):
+        HttpWrapper.__init__(self, http)
+        self.timeout = timeout
+
+    def request(self, method, url, *args, **kwargs):
+        budget = current()
+        step = (method, url)
+        timeout = self.timeout
+        if budget != None:
+            budget.check(step)
+            timeout = budget.timeout()
+        if timeout != None:
+            kwargs['timeout'] = min(timeout, kwargs.get('timeout') or timeout)
+        try:
+            response = HttpWrapper.request(self, method, url, *args, **kwargs)
+        except (IOError, OSError):
+            if budget != None and budget.remaining() <= 0:
+                raise DeadlineExceeded("{} {} abandoned at deadline".format(method, url), budget, step)
+            raise
+        if budget != None and method != 'get':
+            budget.done(step)
+        return response
+
+def bounded(client, timeout = None):
+    """.. function:: bounded(client, timeout = None)
+
+    Bound requests of already created client by the deadline of the calling thread
+
+    :param client: 'vbn', 'vswitch' or 'rcs' instance
+    :param timeout: timeout in seconds of requests made outside of deadline context,
+        None for unbounded
+    :returns: client
+
+    """
+    return wrap_client(client,
+                       rpc_wrapper = lambda name, method: DeadlineMethod(name, method, timeout),
+                       http_wrapper = lambda http: DeadlineHttp(http, timeout))
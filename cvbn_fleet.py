@@ -0,0 +1,246 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_fleet
+    :synopsis: Fleet-wide inventory scan of CvBN hosts behind CvBB
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'FleetScanner' class that walks *networking.network*,
+*networking.subnet* and *host.nat* of many CvBN hosts through one CvBB server
+(cvbn_multihost) concurrently, with bounded parallelism over (host, tid) pairs.
+
+Results are streamed into 'FleetInventory' - objects indexed by host, tid, id and
+name - together with per-host latency and failures. A failing host or walk is
+recorded and the scan goes on. Optionally every walk is also saved to persistent
+cvbn_inventory.Inventory.
+
+Reports are yielded in completion order, so a slow host does not hold back the others.
+With *hostTimeout* all walks of a host share one budget (cvbn_deadline) starting with
+its first walk; the clients are bounded (cvbn_deadline.bounded), so a hung walk is
+abandoned at the deadline and recorded as DeadlineExceeded of that tid.
+
+>>> import cvbn_fleet
+>>> scanner = cvbn_fleet.FleetScanner("cvbb.example.com", workers = 32)
+>>> fleet = scanner.scan(hosts)
+>>> print fleet.summary()
+{'hosts': 500, 'failed': 2, 'objects': 5120, 'elapsed': 41.7}
+>>> for host, report in fleet.failures().items():
+...     print host, report.errors
+
+"""
+
+import threading
+import time
+import cvbn_deadline
+import cvbn_multihost
+import cvbn_pipeline
+
+TIDS = ('networking.network', 'networking.subnet', 'host.nat')
+
+class HostReport(object):
+    """Scan result of one host
+
+    :ivar host: host UUID
+    :ivar latency: dict tid -> walk duration in seconds
+    :ivar counts: dict tid -> number of objects
+    :ivar errors: dict tid -> exception of failed walk
+    """
+    def __init__(self, host):
+        self.host = host
+        self.latency = {}
+        self.counts = {}
+        self.errors = {}
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def elapsed(self):
+        return sum(self.latency.values())
+
+    def __repr__(self):
+        return "HostReport(host={}, elapsed={:.3f}, counts={}, errors={})".format(
+            self.host, self.elapsed, self.counts, len(self.errors))
+
+class FleetInventory(object):
+    """Consolidated objects of all scanned hosts
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reports = {}
+        self._objects = {}
+        self._byTid = {}
+        self._byId = {}
+        self._byName = {}
+        self.started = time.time()
+        self.finished = None
+
+    def report(self, host):
+        with self._lock:
+            report = self.reports.get(host)
+            if report == None:
+                report = self.reports[host] = HostReport(host)
+            return report
+
+    def add(self, host, tid, objects, latency):
+        """Store complete walk of *tid* on *host*, replacing the previous one
+        """
+        report = self.report(host)
+        with self._lock:
+            self._unindex(host, tid, self._objects.pop((host, tid), []))
+            self._objects[(host, tid)] = objects
+            for obj in objects:
+                entry = (host, tid, obj)
+                self._byTid.setdefault(tid, []).append(entry)
+                if 'id' in obj:
+                    self._byId.setdefault(obj['id'], []).append(entry)
+                if obj.get('name') != None:
+                    self._byName.setdefault(obj['name'], []).append(entry)
+            report.latency[tid] = latency
+            report.counts[tid] = len(objects)
+            report.errors.pop(tid, None)
+
+    def _unindex(self, host, tid, objects):
+        '''remove entries of (host, tid) from the indexes, each affected key rebuilt once'''
+        if not objects:
+            return
+        keys = ((self._byTid, set([tid])),
+                (self._byId, set(obj['id'] for obj in objects if 'id' in obj)),
+                (self._byName, set(obj['name'] for obj in objects if obj.get('name') != None)))
+        for index, affected in keys:
+            for key in affected:
+                entries = [entry for entry in index.get(key, []) if entry[0] != host or entry[1] != tid]
+                if entries:
+                    index[key] = entries
+                else:
+                    index.pop(key, None)
+
+    def fail(self, host, tid, error, latency):
+        report = self.report(host)
+        with self._lock:
+            report.latency[tid] = latency
+            report.errors[tid] = error
+
+    def objects(self, host, tid):
+        """Return objects of *tid* walked on *host* (empty list if not scanned or failed)
+        """
+        with self._lock:
+            return list(self._objects.get((host, tid), []))
+
+    def find(self, tid = None, name = None, objId = None, host = None):
+        """.. function:: find(tid = None, name = None, objId = None, host = None)
+
+        Return list of (host, tid, object) matching all given criteria
+
+        """
+        with self._lock:
+            if objId != None:
+                entries = list(self._byId.get(objId, []))
+            elif name != None:
+                entries = list(self._byName.get(name, []))
+            elif tid != None:
+                entries = list(self._byTid.get(tid, []))
+            else:
+                entries = [(h, t, obj) for (h, t), objects in self._objects.items() for obj in objects]
+        return [(h, t, obj) for h, t, obj in entries
+                if (tid == None or t == tid) and (name == None or obj.get('name') == name)
+                and (host == None or h == host)]
+
+    def failures(self):
+        """Return dict host -> HostReport of hosts with at least one failed walk
+        """
+        return dict((host, report) for host, report in self.reports.items() if not report.ok)
+
+    def summary(self):
+        end = self.finished or time.time()
+        with self._lock:
+            objects = sum(len(objects) for objects in self._objects.values())
+        return {'hosts': len(self.reports),
+                'failed': len(self.failures()),
+                'objects': objects,
+                'elapsed': round(end - self.started, 3)}
+
+class FleetScanner(object):
+    """Concurrent scanner of CvBN hosts
+
+    :param server: FQDN/IP of CvBB server or cvbn_multihost.MultiHost object
+    :param tids: object types walked on every host
+    :param workers: max. number of concurrent walks. Default 16
+    :param store: optional cvbn_inventory.Inventory saving every successful walk
+    :param hostTimeout: optional time budget in seconds of all walks of one host
+    """
+    def __init__(self, server, tids = TIDS, workers = 16, store = None, hostTimeout = None):
+        if isinstance(server, cvbn_multihost.MultiHost):
+            self.multi = server
+        else:
+            self.multi = cvbn_multihost.MultiHost(server)
+        self.tids = tuple(tids)
+        self.workers = workers
+        self.store = store
+        self.hostTimeout = hostTimeout
+        self.inventory = None
+        self._lock = threading.Lock()
+        self._expires = {}
+
+    def _client(self, host):
+        client = self.multi.vbn(host)
+        if self.hostTimeout != None:
+            with self._lock:
+                if not isinstance(client._walk_method, cvbn_deadline.DeadlineMethod):
+                    cvbn_deadline.bounded(client)
+        return client
+
+    def _walk(self, unit):
+        host, tid = unit
+        start = time.time()
+        try:
+            client = self._client(host)
+            if self.hostTimeout == None:
+                objects = list(client._walk(tid))
+            else:
+                with self._lock:
+                    expires = self._expires.setdefault(host, start + self.hostTimeout)
+                with cvbn_deadline.deadline(max(expires - time.time(), 0)):
+                    objects = list(client._walk(tid))
+        except Exception as error:
+            return (host, tid, None, error, time.time() - start)
+        return (host, tid, objects, None, time.time() - start)
+
+    def iterScan(self, hosts, inventory = None):
+        """.. function:: iterScan(hosts, inventory = None)
+
+        Scan *hosts* and yield HostReport of every host as soon as all its walks are done,
+        in completion order. Objects are added to *inventory* (new FleetInventory if None,
+        available as *inventory* attribute of the scanner) as the walks complete
+
+        """
+        if inventory == None:
+            inventory = FleetInventory()
+        self.inventory = inventory
+        with self._lock:
+            self._expires = {}
+        hosts = list(hosts)
+        pending = dict((host, len(self.tids)) for host in hosts)
+        units = ((host, tid) for host in hosts for tid in self.tids)
+        for host, tid, objects, error, latency in cvbn_pipeline.unordered_map(self._walk, units, self.workers):
+            if error != None:
+                inventory.fail(host, tid, error, latency)
+            else:
+                inventory.add(host, tid, objects, latency)
+                if self.store != None:
+                    client = self._client(host)
+                    self.store.store('vbn:' + self.multi.server, client.agent, tid, objects)
+            pending[host] = pending[host] - 1
+            if pending[host] == 0:
+                yield inventory.report(host)
+        inventory.finished = time.time()
+
+    def scan(self, hosts, inventory = None):
+        """Scan *hosts* and return FleetInventory (see *iterScan*)
+        """
+        for report in self.iterScan(hosts, inventory):
+            pass
+        return self.inventory
@@ -0,0 +1,321 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_inventory
+    :synopsis: Persistent on-disk inventory of CVBN and RCS objects
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'Inventory' class - SQLite store of objects fetched by 'vswitch',
+'vbn' and 'rcs' clients (switches, networks, subnets, domains, ports, NAT, RCS devices
+and users).
+
+Every object is stored with *source* (client kind and server), *scope* (agent, switch
+instance id or RCS URL), *tid*, *id* and *name* columns (indexed), its JSON data,
+*version* (incremented on every content change), *updated* (time of the last change)
+and *seen* (time of the last sync that returned it).
+
+After restart the state is available immediately from the file; queries never talk to
+the clients. Registered clients are re-synced (*sync*) or revalidated in background
+thread (*revalidate*) only when their data is older than *maxAge*.
+
+>>> import cvbn_inventory, cvbn_vswitch
+>>> inventory = cvbn_inventory.Inventory("/var/tmp/cvbn.db", maxAge = 600)
+>>> inventory.addVswitch(cvbn_vswitch.vswitch("localhost","none"))
+>>> inventory.revalidate(background = True)
+>>> print [port['name'] for port in inventory.objects(tid = 'networking.port.gre')]
+[u'gre1', u'gre2']
+
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+VSWITCH_TIDS = (
+    'networking.network',
+    'networking.subnet',
+    'networking.vswitch.domain',
+    'networking.vswitch.domain.ports',
+    'networking.port.gre',
+    'networking.port.raw',
+)
+
+VBN_TIDS = (
+    'networking.network',
+    'networking.subnet',
+    'host.nat',
+)
+
+RCS_DEVICE = 'rcs.device'
+RCS_USER = 'rcs.user'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    source TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    tid TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    seen REAL NOT NULL,
+    PRIMARY KEY (source, scope, tid, id)
+);
+CREATE INDEX IF NOT EXISTS objects_tid_name ON objects (tid, name);
+CREATE INDEX IF NOT EXISTS objects_id ON objects (id);
+CREATE TABLE IF NOT EXISTS syncs (
+    source TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    tid TEXT NOT NULL,
+    synced REAL NOT NULL,
+    PRIMARY KEY (source, scope, tid)
+);
+"""
+
+def _plain(obj):
+    # records (cvbn_records) are stored as plain dicts
+    todict = getattr(obj, 'todict', None)
+    if todict != None:
+        return todict()
+    return obj
+
+def _objectId(obj):
+    if 'id' in obj:
+        return str(obj['id'])
+    # domain membership objects may come without own id
+    return json.dumps([obj['domain']['id'], obj['port']['tid'], obj['port']['id']])
+
+def _sync_switches(client, switches, uuids, tids, stale, save):
+    '''walk stale tids of running switches of vswitch client, save(uuid, tid, objects) complete
+    listings; stopped or failing switches are skipped (their data kept), return their errors'''
+    running = set(server['configuration']['id'] for server in client._walk(client.agent, 'compute.server')
+                  if server.get('configuration'))
+    errors = []
+    for switch in switches:
+        uuid = switch['id']
+        if (uuids != None and uuid not in uuids) or uuid not in running:
+            continue
+        pending = [tid for tid in tids if stale(uuid, tid)]
+        if not pending:
+            continue
+        try:
+            walks = [(tid, list(client._walk(uuid, tid))) for tid in pending]
+            # trusted client walks a switch stopped meanwhile as empty
+            if getattr(client, 'trusted', False) and client.getRunId(uuid) == None:
+                continue
+        except Exception as error:
+            errors.append(error)
+            continue
+        for tid, objects in walks:
+            save(uuid, tid, objects)
+    return errors
+
+class Inventory(object):
+    """Persistent inventory of objects
+
+    :param path: SQLite database file name (':memory:' for non-persistent store)
+    :param maxAge: seconds after which synced data is considered stale. Default 300
+    """
+    def __init__(self, path, maxAge = 300):
+        self.path = path
+        self.maxAge = maxAge
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread = False)
+        self._db.executescript(_SCHEMA)
+        self._jobs = []
+        self._thread = None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def store(self, source, scope, tid, objects, now = None):
+        """.. function:: store(source, scope, tid, objects, now = None)
+
+        Replace stored objects of (source, scope, tid) with *objects* (complete listing).
+        Version of changed objects is incremented, objects missing in *objects* are removed.
+
+        :returns: tuple (added, changed, removed) counts
+
+        """
+        if now == None:
+            now = time.time()
+        added = changed = 0
+        with self._lock:
+            # objects may be a lazy walk failing part-way: nothing of it must stay pending
+            try:
+                cursor = self._db.cursor()
+                cursor.execute("SELECT id, data FROM objects WHERE source=? AND scope=? AND tid=?",
+                               (source, scope, tid))
+                stored = dict(cursor.fetchall())
+                current = set()
+                for obj in objects:
+                    obj = _plain(obj)
+                    objId = _objectId(obj)
+                    data = json.dumps(obj, sort_keys = True, separators = (',', ':'))
+                    current.add(objId)
+                    if objId not in stored:
+                        added = added + 1
+                        cursor.execute("INSERT OR REPLACE INTO objects VALUES (?,?,?,?,?,?,1,?,?)",
+                                       (source, scope, tid, objId, obj.get('name'), data, now, now))
+                    elif stored[objId] != data:
+                        changed = changed + 1
+                        cursor.execute("UPDATE objects SET name=?, data=?, version=version+1, updated=?, seen=? "
+                                       "WHERE source=? AND scope=? AND tid=? AND id=?",
+                                       (obj.get('name'), data, now, now, source, scope, tid, objId))
+                    else:
+                        cursor.execute("UPDATE objects SET seen=? WHERE source=? AND scope=? AND tid=? AND id=?",
+                                       (now, source, scope, tid, objId))
+                removed = [objId for objId in stored if objId not in current]
+                cursor.executemany("DELETE FROM objects WHERE source=? AND scope=? AND tid=? AND id=?",
+                                   [(source, scope, tid, objId) for objId in removed])
+                cursor.execute("INSERT OR REPLACE INTO syncs VALUES (?,?,?,?)", (source, scope, tid, now))
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return (added, changed, len(removed))
+
+    def forget(self, source, scope = None):
+        """Remove all objects of *source* (and *scope* if given)
+        """
+        where, args = "source=?", (source,)
+        if scope != None:
+            where, args = "source=? AND scope=?", (source, scope)
+        with self._lock:
+            self._db.execute("DELETE FROM objects WHERE " + where, args)
+            self._db.execute("DELETE FROM syncs WHERE " + where, args)
+            self._db.commit()
+
+    def _select(self, columns, source, scope, tid, objId, name):
+        where, args = [], []
+        for column, value in (('source', source), ('scope', scope), ('tid', tid), ('id', objId), ('name', name)):
+            if value != None:
+                where.append(column + '=?')
+                args.append(value)
+        query = "SELECT " + columns + " FROM objects"
+        if where:
+            query = query + " WHERE " + " AND ".join(where)
+        with self._lock:
+            return self._db.execute(query, args).fetchall()
+
+    def objects(self, source = None, scope = None, tid = None, name = None):
+        """.. function:: objects(source = None, scope = None, tid = None, name = None)
+
+        Query stored objects, no RPC/HTTP is done. None means any value
+
+        :returns: list of objects (dict)
+
+        >>> print inventory.objects(tid = 'networking.network', name = 'external')
+        [{u'tid': u'networking.network', u'id': u'22eab8a1-...', u'name': u'external', ...}]
+
+        """
+        return [json.loads(row[0]) for row in self._select("data", source, scope, tid, None, name)]
+
+    def get(self, objId, tid = None, source = None, scope = None):
+        """Return stored object with *objId* or None
+        """
+        rows = self._select("data", source, scope, tid, objId, None)
+        if not rows:
+            return None
+        return json.loads(rows[0][0])
+
+    def version(self, objId, tid = None, source = None, scope = None):
+        """Return tuple (version, updated) of stored object with *objId* or None
+        """
+        rows = self._select("version, updated", source, scope, tid, objId, None)
+        if not rows:
+            return None
+        return rows[0]
+
+    def synced(self, source, scope, tid):
+        """Return time of the last sync of (source, scope, tid) or None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT synced FROM syncs WHERE source=? AND scope=? AND tid=?",
+                                   (source, scope, tid)).fetchone()
+        if row == None:
+            return None
+        return row[0]
+
+    def isStale(self, source, scope, tid):
+        synced = self.synced(source, scope, tid)
+        return synced == None or time.time() - synced > self.maxAge
+
+    def _vswitchJob(self, client, uuids, tids):
+        source = 'vswitch:' + client.server
+        def job(force):
+            switches = list(client.iterSwitches())
+            if force or self.isStale(source, client.agent, 'compute.vswitch'):
+                self.store(source, client.agent, 'compute.vswitch', switches)
+            return _sync_switches(client, switches, uuids, tids,
+                                  lambda uuid, tid: force or self.isStale(source, uuid, tid),
+                                  lambda uuid, tid, objects: self.store(source, uuid, tid, objects))
+        return job
+
+    def _vbnJob(self, client, tids):
+        source = 'vbn:' + client.server
+        def job(force):
+            for tid in tids:
+                if force or self.isStale(source, client.agent, tid):
+                    self.store(source, client.agent, tid, client._walk(tid))
+        return job
+
+    def _rcsJob(self, client):
+        source = 'rcs:' + client.server
+        def job(force):
+            if force or self.isStale(source, client.url, RCS_DEVICE):
+                self.store(source, client.url, RCS_DEVICE, client.iterAdminDevices())
+            if force or self.isStale(source, client.url, RCS_USER):
+                self.store(source, client.url, RCS_USER, client.iterAdminUsers())
+        return job
+
+    def addVswitch(self, client, uuids = None, tids = VSWITCH_TIDS):
+        """Register 'vswitch' client; objects of *tids* of running switches *uuids* (all if
+        None) are synced. Stored objects of a stopped switch are kept as they are
+        """
+        self._jobs.append(self._vswitchJob(client, uuids, tids))
+
+    def addVbn(self, client, tids = VBN_TIDS):
+        """Register 'vbn' client; objects of *tids* are synced
+        """
+        self._jobs.append(self._vbnJob(client, tids))
+
+    def addRcs(self, client):
+        """Register 'rcs' client; admin devices and users are synced
+        """
+        self._jobs.append(self._rcsJob(client))
+
+    def sync(self, force = False):
+        """.. function:: sync(force = False)
+
+        Sync stale (all if *force*) data of registered clients. A failing client (or switch)
+        does not stop the others; its stored data is kept as is.
+
+        :returns: list of exceptions raised by failed clients and switches
+
+        """
+        failures = []
+        for job in list(self._jobs):
+            try:
+                failures.extend(job(force) or [])
+            except Exception as error:
+                failures.append(error)
+        return failures
+
+    def revalidate(self, background = True):
+        """Sync stale data, in background thread if requested (the thread is returned)
+        """
+        if not background:
+            self.sync()
+            return None
+        if self._thread != None and self._thread.is_alive():
+            return self._thread
+        self._thread = threading.Thread(target = self.sync)
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
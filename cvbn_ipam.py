@@ -0,0 +1,315 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_ipam
+    :synopsis: Client-side GRE endpoint IP allocator for CVBN vSwitch subnets
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'GreIpam' class that learns CIDR, allocation pools and gateway of
+every subnet of the switch and the endpoints used by its GRE ports from one walk of
+*networking.subnet* and *networking.port.gre*.
+
+Free addresses of each subnet are kept as sorted list of free ranges (the allocation
+pools split by used addresses), so the size of a subnet costs nothing and memory grows
+with the number of used addresses only. Allocation is next-fit from a rotating cursor;
+reservation, release and validation of a given address are binary searches.
+
+Once built with *vswitch.greIpam(uuid)*, *addPortGre* validates and reserves requested
+endpoints locally (the same CvbnApiFailure is raised as the agent would) before any RPC,
+so concurrent adds of the same endpoint can not both pass, picks a free local endpoint
+if none is given, and *deletePortGre* releases the endpoints.
+
+>>> ipam = vswitch.greIpam("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+>>> print ipam.allocate("e67d8e96-f887-4217-9ca6-ccb52d101d92")
+192.168.30.11
+
+"""
+
+import bisect
+import socket
+import struct
+import threading
+
+NOT_IN_RANGE = "{} is not in available subnet address range"
+IN_USE = "inconsistent port usage"
+
+def ip_to_int(ip):
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+def parse_cidr(cidr):
+    """Return tuple (first, last) address (int) of IPv4 *cidr* (a.b.c.d/n)
+    """
+    address, length = cidr.split('/')
+    length = int(length)
+    if length < 0 or length > 32:
+        raise ValueError("invalid prefix length in {}".format(cidr))
+    mask = (0xffffffff << (32 - length)) & 0xffffffff
+    first = ip_to_int(address) & mask
+    return (first, first | (~mask & 0xffffffff))
+
+def _endpoint(port, attr):
+    endpoint = port.get(attr) or {}
+    return endpoint.get('ip_address')
+
+class SubnetPool(object):
+    """Free address ranges of allocation pools of one subnet
+
+    :param cidr: subnet CIDR
+    :param pools: list of {'start', 'end'} allocation pools; whole subnet without network,
+        broadcast and gateway address if not given
+    :param gateway: gateway IP, never allocated
+    :raises: ValueError if the allocation pools are invalid or overlap
+    """
+    def __init__(self, cidr, pools = None, gateway = None):
+        network, broadcast = parse_cidr(cidr)
+        if pools:
+            ranges = sorted((ip_to_int(pool['start']), ip_to_int(pool['end'])) for pool in pools)
+        elif broadcast - network > 1:
+            ranges = [(network + 1, broadcast - 1)]
+        else:
+            ranges = [(network, broadcast)]
+        for index, (start, end) in enumerate(ranges):
+            if start > end:
+                raise ValueError("invalid allocation pool {}-{} in {}".format(int_to_ip(start), int_to_ip(end), cidr))
+            if index > 0 and start <= ranges[index - 1][1]:
+                raise ValueError("overlapping allocation pools in {}".format(cidr))
+        self.cidr = cidr
+        self.first = ranges[0][0]
+        self.last = ranges[-1][1]
+        self._rangeStarts = [start for start, end in ranges]
+        self._rangeEnds = [end for start, end in ranges]
+        # free ranges [start, end], sorted and disjoint
+        self._starts = list(self._rangeStarts)
+        self._ends = list(self._rangeEnds)
+        self.free = sum(end - start + 1 for start, end in ranges)
+        if gateway:
+            self.reserve(gateway)
+        self._cursor = self.first
+
+    def _free(self, address):
+        '''index of free range holding address, None if address is not free'''
+        index = bisect.bisect_right(self._starts, address) - 1
+        if index >= 0 and address <= self._ends[index]:
+            return index
+        return None
+
+    def _contains(self, address):
+        index = bisect.bisect_right(self._rangeStarts, address) - 1
+        return index >= 0 and address <= self._rangeEnds[index]
+
+    def _take(self, index, address):
+        start, end = self._starts[index], self._ends[index]
+        if start == end:
+            del self._starts[index]
+            del self._ends[index]
+        elif address == start:
+            self._starts[index] = start + 1
+        elif address == end:
+            self._ends[index] = end - 1
+        else:
+            self._ends[index] = address - 1
+            self._starts.insert(index + 1, address + 1)
+            self._ends.insert(index + 1, end)
+        self.free = self.free - 1
+
+    def contains(self, ip):
+        """Check if *ip* is in allocation range of the subnet (free or not)
+        """
+        return self._contains(ip_to_int(ip))
+
+    def isFree(self, ip):
+        return self._free(ip_to_int(ip)) != None
+
+    def reserve(self, ip):
+        """Mark *ip* used, return False if it is out of range or already used
+        """
+        address = ip_to_int(ip)
+        index = self._free(address)
+        if index == None:
+            return False
+        self._take(index, address)
+        return True
+
+    def release(self, ip):
+        address = ip_to_int(ip)
+        if not self._contains(address) or self._free(address) != None:
+            return
+        index = bisect.bisect_right(self._starts, address)
+        left = index > 0 and self._ends[index - 1] == address - 1
+        right = index < len(self._starts) and self._starts[index] == address + 1
+        if left and right:
+            self._ends[index - 1] = self._ends[index]
+            del self._starts[index]
+            del self._ends[index]
+        elif left:
+            self._ends[index - 1] = address
+        elif right:
+            self._starts[index] = address
+        else:
+            self._starts.insert(index, address)
+            self._ends.insert(index, address)
+        self.free = self.free + 1
+
+    def allocate(self):
+        """Reserve and return next free address, None if the subnet is exhausted
+        """
+        if not self._starts:
+            return None
+        index = bisect.bisect_right(self._starts, self._cursor) - 1
+        if index >= 0 and self._cursor <= self._ends[index]:
+            address = self._cursor
+        else:
+            index = index + 1
+            if index >= len(self._starts):
+                index = 0
+            address = self._starts[index]
+        self._take(index, address)
+        self._cursor = address + 1
+        return int_to_ip(address)
+
+class GreIpam(object):
+    """GRE endpoint allocator of one switch
+
+    :param subnets: iterable of networking.subnet objects
+    :param ports: iterable of networking.port.gre objects
+    """
+    def __init__(self, subnets, ports):
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._ports = {}
+        for subnet in subnets:
+            self.addSubnet(subnet)
+        for port in ports:
+            self.addPort(port)
+
+    def addSubnet(self, subnet):
+        """Learn networking.subnet object; a subnet with invalid or overlapping allocation
+        pools is not managed (its endpoints are left to the agent to check)
+        """
+        try:
+            pool = SubnetPool(subnet['cidr'], subnet.get('allocation_pools'), subnet.get('gateway_ip'))
+        except ValueError:
+            pool = None
+        with self._lock:
+            if pool == None:
+                self._pools.pop(subnet['id'], None)
+            else:
+                self._pools[subnet['id']] = pool
+
+    def removeSubnet(self, subnetId):
+        with self._lock:
+            self._pools.pop(subnetId, None)
+
+    def subnet(self, subnetId):
+        """Return SubnetPool of *subnetId* or None if unknown
+        """
+        return self._pools.get(subnetId)
+
+    def _pool(self, subnetId, ip):
+        pool = self._pools.get(subnetId)
+        if pool != None and pool.contains(ip):
+            return pool
+        for pool in self._pools.values():
+            if pool.contains(ip):
+                return pool
+        return None
+
+    def addPort(self, port, claimed = ()):
+        """.. function:: addPort(port, claimed = ())
+
+        Mark endpoints of networking.port.gre object used. Only endpoints reserved now or
+        already reserved for this port (*claimed*, see *claim* and *allocate*) are
+        released by *removePort*; an endpoint used by another port is left to it
+
+        """
+        used = []
+        with self._lock:
+            for ip in (_endpoint(port, 'local_endpoint'), _endpoint(port, 'remote_endpoint')):
+                if ip == None:
+                    continue
+                pool = self._pool(port.get('local_subnet'), ip)
+                if pool != None and (pool, ip) not in used and (pool.reserve(ip) or ip in claimed):
+                    used.append((pool, ip))
+            self._ports[port['id']] = used
+
+    def removePort(self, portId):
+        """Release endpoints of deleted port *portId*
+        """
+        with self._lock:
+            for pool, ip in self._ports.pop(portId, []):
+                pool.release(ip)
+
+    def _check(self, subnetId, local_ip, remote_ip):
+        '''(reason, pools of endpoints to reserve)'''
+        pool = self._pools.get(subnetId)
+        if pool == None:
+            return (None, [])
+        claims = []
+        if local_ip != None:
+            if not pool.contains(local_ip):
+                return (NOT_IN_RANGE.format(local_ip), [])
+            if not pool.isFree(local_ip):
+                return (IN_USE, [])
+            claims.append((pool, local_ip))
+        if remote_ip != None and remote_ip != local_ip:
+            remote = self._pool(subnetId, remote_ip)
+            if remote != None:
+                if not remote.isFree(remote_ip):
+                    return (IN_USE, [])
+                claims.append((remote, remote_ip))
+        return (None, claims)
+
+    def check(self, subnetId, local_ip, remote_ip = None):
+        """.. function:: check(subnetId, local_ip, remote_ip = None)
+
+        Validate endpoints of new GRE port on subnet *subnetId* without reserving them
+
+        :returns: None if endpoints can be used, otherwise the reason as reported by the agent
+
+        """
+        with self._lock:
+            return self._check(subnetId, local_ip, remote_ip)[0]
+
+    def claim(self, subnetId, local_ip, remote_ip = None):
+        """.. function:: claim(subnetId, local_ip, remote_ip = None)
+
+        Validate endpoints of new GRE port on subnet *subnetId* and reserve them at once,
+        so a concurrent add of the same endpoint fails the check. Release the claimed
+        endpoints if the port is not created
+
+        :returns: tuple (reason, claimed): reason is None if endpoints can be used,
+            otherwise the reason as reported by the agent; claimed is list of reserved IPs
+
+        """
+        with self._lock:
+            reason, claims = self._check(subnetId, local_ip, remote_ip)
+            for pool, ip in claims:
+                pool.reserve(ip)
+            return (reason, [ip for pool, ip in claims])
+
+    def allocate(self, subnetId):
+        """Reserve and return free endpoint of subnet *subnetId*, None if unknown or exhausted
+        """
+        with self._lock:
+            pool = self._pools.get(subnetId)
+            if pool == None:
+                return None
+            return pool.allocate()
+
+    def reserve(self, subnetId, ip):
+        """Reserve *ip* (in range of subnet *subnetId* or any other known subnet)
+        """
+        with self._lock:
+            pool = self._pool(subnetId, ip)
+            return pool != None and pool.reserve(ip)
+
+    def release(self, subnetId, ip):
+        with self._lock:
+            pool = self._pool(subnetId, ip)
+            if pool != None:
+                pool.release(ip)
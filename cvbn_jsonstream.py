@@ -0,0 +1,154 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_jsonstream
+    :synopsis: Incremental JSON decoding of large walk and list responses
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing incremental decoding of JSON documents of the form::
+
+    {"meta": {...}, "devices": [{...}, {...}, ...]}
+    {"children": [{...}, {...}, ...]}
+
+Items of the selected top-level array are yielded one at a time as the data arrives,
+so the consumer can stop at the first match without the whole document being read
+and decoded.
+
+Full (non-incremental) decoding goes through *loads*, which uses the fastest codec
+available (ujson, simplejson, json). Other codec can be plugged with *set_codec*.
+
+>>> import cvbn_jsonstream
+>>> r = requests.get(url, headers = hdr, stream = True)
+>>> for device in cvbn_jsonstream.iter_array(r.iter_content(8192), 'devices'):
+...     print device['name']
+
+"""
+
+import codecs
+import json
+
+try:
+    import ujson as _codec
+except ImportError:
+    try:
+        import simplejson as _codec
+    except ImportError:
+        _codec = json
+
+CHUNK_SIZE = 65536
+
+_decoder = json.JSONDecoder()
+_loads = _codec.loads
+
+def set_codec(loads):
+    """Plug JSON decoding function used by *loads* (e.g. ujson.loads, orjson.loads)
+    """
+    global _loads
+    _loads = loads
+
+def loads(data):
+    """Decode complete JSON document *data* with the configured codec
+    """
+    if isinstance(data, bytes) and _loads is json.loads:
+        data = data.decode('utf-8')
+    return _loads(data)
+
+def _chunks(source):
+    if isinstance(source, (bytes, type(u''))):
+        return iter([source])
+    if hasattr(source, 'read'):
+        return iter(lambda: source.read(CHUNK_SIZE), source.read(0))
+    return iter(source)
+
+class _Reader(object):
+    def __init__(self, source):
+        self.chunks = _chunks(source)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = u''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        """Read next chunk into the buffer, False at the end of data
+        """
+        for chunk in self.chunks:
+            if isinstance(chunk, bytes):
+                chunk = self.utf8.decode(chunk)
+            if not chunk:
+                continue
+            # drop consumed part to keep the buffer small
+            self.buf = self.buf[self.pos:] + chunk
+            self.pos = 0
+            return True
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Return next non-whitespace character (not consumed), '' at the end of data
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos = self.pos + 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if char == '' or char not in chars:
+            raise ValueError("expected one of '{}' at offset {}, got '{}'".format(chars, self.pos, char))
+        self.pos = self.pos + 1
+        return char
+
+    def value(self):
+        """Decode next complete JSON value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.more():
+                    continue
+                raise
+            # value ending at the buffer end may be truncated (e.g. number)
+            if end == len(self.buf) and not self.eof and self.more():
+                continue
+            self.pos = end
+            return value
+
+def iter_array(source, key, required = False):
+    """.. function:: iter_array(source, key, required = False)
+
+    Yield items of array *key* of top-level JSON object one at a time
+
+    :param source: JSON text, file-like object or iterable of text/bytes chunks
+    :param key: name of the top-level attribute holding the array
+    :param required: raise ValueError if *key* is not present or not an array, e.g. for
+        error documents ({"errors": ...}) in place of a list. Default False - nothing is yielded
+    :returns: generator of decoded items
+    :raises: ValueError if data is not valid JSON (or has no array *key* if *required*)
+
+    """
+    reader = _Reader(source)
+    reader.expect('{')
+    if reader.peek() != '}':
+        while True:
+            name = reader.value()
+            reader.expect(':')
+            if name == key and reader.peek() == '[':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    return
+                while True:
+                    yield reader.value()
+                    if reader.expect(',]') == ']':
+                        return
+            reader.value()
+            if reader.expect(',}') == '}':
+                break
+    if required:
+        raise ValueError("no array '{}' in the document".format(key))
@@ -0,0 +1,130 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_multihost
+    :synopsis: Multi-host CvBB client sharing one RPC factory across CvBN hosts
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'MultiHost' class that talks to many CvBN hosts through one CvBB
+(or CvBN) server. Port autodiscovery is done once, and one RPC factory and one set of
+walk/get/set/delete method objects (i.e. one connection pool) is shared by lightweight
+per-host 'vbn' and 'vswitch' objects, which are created on first use and cached.
+
+The same operation can be fanned out to many hosts concurrently with bounded parallelism;
+a failing host does not stop the others.
+
+>>> import cvbn_multihost
+>>> multi = cvbn_multihost.MultiHost("cvbb.example.com")
+>>> print multi.vbn("7d1c2ab0-2c1d-4a8e-9a57-0d3f1c9d4e11").getSubnets()
+[{'tid': 'networking.subnet', 'id': '5f0c9e4a-...', 'name': 'tenant1', 'cidr': '192.168.30.0/24', ...}]
+>>> hosts = ["7d1c2ab0-2c1d-4a8e-9a57-0d3f1c9d4e11", "0b6f5d3e-8a41-4c55-b0d7-2e9a61f4c3a8"]
+>>> for host, subnets, error in multi.fanout(hosts, lambda server: server.getSubnets()):
+...     print host, error.category if error else len(subnets)
+7d1c2ab0-2c1d-4a8e-9a57-0d3f1c9d4e11 1
+0b6f5d3e-8a41-4c55-b0d7-2e9a61f4c3a8 agent_down
+
+"""
+
+import threading
+from cvbx_rpc_tools.method import RpcMethodFactory
+import cvbn_pipeline
+import cvbn_server
+import cvbn_vswitch
+
+class SharedFactory(object):
+    """Factory look-alike handing out one method object per RPC method name
+
+    :param connect: callable returning the real factory (called once, on first use)
+    """
+    def __init__(self, connect):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def method(self, name):
+        with self._lock:
+            method = self._methods.get(name)
+            if method == None:
+                method = self._methods[name] = self._connect().method(name)
+            return method
+
+class MultiHost(object):
+    """Client of many CvBN hosts behind one server
+
+    :param server: FQDN/IP of the server CvBB/CvBN
+    :param factory: optional RPC method factory; autodiscovery is skipped when given
+    :param workers: default parallelism of *fanout*. Default 8
+    """
+    def __init__(self, server, factory = None, workers = 8):
+        self.server = server
+        self.workers = workers
+        self._factory = factory
+        self._connectLock = threading.Lock()
+        self._clientsLock = threading.Lock()
+        self._clients = {}
+        self.factory = SharedFactory(self._connect)
+
+    def _connect(self):
+        '''autodiscovery and RPC factory setup, done once for all hosts'''
+        with self._connectLock:
+            if self._factory == None:
+                port = cvbn_server.vbn._determine_rpc_port(self.server)
+                self._factory = RpcMethodFactory.factory('{}:{}'.format(self.server, str(port)))
+        return self._factory
+
+    def _client(self, kind, host):
+        key = (kind, host)
+        with self._clientsLock:
+            client = self._clients.get(key)
+            if client == None:
+                if kind == 'vbn':
+                    client = cvbn_server.vbn(self.server, host, factory = self.factory)
+                else:
+                    client = cvbn_vswitch.vswitch(self.server, host, factory = self.factory)
+                self._clients[key] = client
+            return client
+
+    def vbn(self, host):
+        """Return cvbn_server.vbn object of CvBN *host* (UUID) sharing this client's connection
+        """
+        return self._client('vbn', host)
+
+    def vswitch(self, host):
+        """Return cvbn_vswitch.vswitch object of CvBN *host* (UUID) sharing this client's connection
+        """
+        return self._client('vswitch', host)
+
+    def hosts(self):
+        """Return list of hosts used so far
+        """
+        with self._clientsLock:
+            return sorted(set(host for kind, host in self._clients))
+
+    def forget(self, host):
+        """Drop cached per-host objects of *host*
+        """
+        with self._clientsLock:
+            for kind in ('vbn', 'vswitch'):
+                self._clients.pop((kind, host), None)
+
+    def fanout(self, hosts, fn, kind = 'vbn', workers = None):
+        """.. function:: fanout(hosts, fn, kind = 'vbn', workers = None)
+
+        Call *fn(client)* for per-host client of every host concurrently
+
+        :param hosts: iterable of host UUIDs (consumed lazily)
+        :param fn: callable taking 'vbn' (or 'vswitch') object
+        :param kind: 'vbn' or 'vswitch'
+        :param workers: max. number of concurrent calls; *workers* of the object if None
+        :returns: generator of tuples (host, result, error) in *hosts* order; *error* is the
+            exception raised for that host (result None) or None
+
+        """
+        def call(host):
+            try:
+                return (host, fn(self._client(kind, host)), None)
+            except Exception as error:
+                return (host, None, error)
+        return cvbn_pipeline.parallel_map(call, hosts, workers or self.workers)
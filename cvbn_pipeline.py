@@ -0,0 +1,164 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_pipeline
+    :synopsis: Helpers composing iter* generators of CVBN classes into pipelines
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module with small helpers to build streaming pipelines (filter -> map -> batched
+action) on top of *iterNetworks*, *iterSubnets*, *iterDomains*, *iterPortsGre*,
+*iterPortsVlan* generators of 'vswitch' (and *iterSubnets* of 'vbn'), and to run
+independent checks concurrently (*all_concurrent*).
+
+>>> import cvbn_pipeline
+>>> ports = (port['id'] for port in vswitch.iterPortsGre(uuid) if port['name'].startswith('gre'))
+>>> for batch in cvbn_pipeline.batched(ports, 50):
+...     results = list(cvbn_pipeline.parallel_map(lambda portId: vswitch.deletePortGre(uuid, portId), batch, 8))
+
+"""
+
+import collections
+import itertools
+import threading
+from multiprocessing.pool import ThreadPool
+import cvbn_deadline
+import cvbn_scheduler
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+_worker = threading.local()
+
+def batched(iterable, size):
+    """.. function:: batched(iterable, size)
+
+    Yield lists of up to *size* consecutive items of *iterable*
+
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def parallel_map(fn, iterable, workers = 4):
+    """.. function:: parallel_map(fn, iterable, workers = 4)
+
+    Apply *fn* to items of *iterable* in up to *workers* threads and yield results in input order.
+
+    *iterable* is consumed lazily (at most 2 x *workers* items ahead of the consumer), so work
+    starts before the source listing completes and memory stays flat. The first exception
+    raised by *fn* is re-raised to the consumer and outstanding work is abandoned. Workers
+    inherit the deadline (cvbn_deadline) and priority (cvbn_scheduler) of the calling thread.
+
+    """
+    fn = cvbn_scheduler.bind(cvbn_deadline.bind(fn))
+    pool = ThreadPool(workers)
+    window = collections.deque()
+    try:
+        for item in iterable:
+            window.append(pool.apply_async(fn, (item,)))
+            if len(window) >= workers * 2:
+                yield window.popleft().get()
+        while window:
+            yield window.popleft().get()
+    finally:
+        pool.terminate()
+
+def unordered_map(fn, iterable, workers = 4):
+    """.. function:: unordered_map(fn, iterable, workers = 4)
+
+    Variant of *parallel_map* yielding results in completion order, so one slow item does
+    not hold back the results of the items after it. At most 2 x *workers* items are in
+    progress or waiting for the consumer; every completed item makes room for the next one.
+
+    """
+    fn = cvbn_scheduler.bind(cvbn_deadline.bind(fn))
+    pool = ThreadPool(workers)
+    done = queue.Queue()
+
+    def call(item):
+        try:
+            done.put((True, fn(item)))
+        except Exception as error:
+            done.put((False, error))
+
+    def result():
+        completed, value = done.get()
+        if not completed:
+            raise value
+        return value
+
+    pending = 0
+    try:
+        for item in iterable:
+            pool.apply_async(call, (item,))
+            pending = pending + 1
+            if pending >= workers * 2:
+                pending = pending - 1
+                yield result()
+        while pending:
+            pending = pending - 1
+            yield result()
+    finally:
+        pool.terminate()
+
+def all_concurrent(checks, pool):
+    """.. function:: all_concurrent(checks, pool)
+
+    Concurrent variant of ``all(check() for check in checks)`` evaluated in ThreadPool *pool*.
+
+    Returns False as soon as any check returns false value, without waiting for the others
+    (they are left to finish in the pool). Exception raised by a check is re-raised once all
+    checks before it returned true, i.e. when sequential evaluation would have raised it too.
+    Called from a worker of *pool* (nested checks), checks are evaluated sequentially, so the
+    pool can not deadlock on itself. Checks inherit the deadline (cvbn_deadline) and priority
+    (cvbn_scheduler) of the caller.
+
+    :param checks: list of callables without arguments
+    :param pool: multiprocessing.pool.ThreadPool
+    :returns: True if all checks returned true value, False otherwise
+
+    """
+    checks = list(checks)
+    if len(checks) < 2 or getattr(_worker, 'pool', None) is pool:
+        return all(check() for check in checks)
+
+    checks = [cvbn_scheduler.bind(cvbn_deadline.bind(check)) for check in checks]
+    results = {}
+    done = threading.Condition()
+
+    def run(index):
+        _worker.pool = pool
+        try:
+            result = (True, checks[index]())
+        except Exception as error:
+            result = (False, error)
+        finally:
+            _worker.pool = None
+        with done:
+            results[index] = result
+            done.notify()
+
+    for index in range(len(checks)):
+        pool.apply_async(run, (index,))
+
+    with done:
+        while True:
+            for completed, value in results.values():
+                if completed and not value:
+                    return False
+            for index in range(len(checks)):
+                if index not in results:
+                    break
+                completed, value = results[index]
+                if not completed:
+                    raise value
+            else:
+                return True
+            done.wait()
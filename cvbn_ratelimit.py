@@ -0,0 +1,284 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_ratelimit
+    :synopsis: Client-side rate limiting and adaptive concurrency of CVBN RPC and RCS REST calls
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing request throttling stacked on the transport of 'vbn', 'vswitch'
+and 'rcs' objects (see cvbn_transport.wrap_client):
+
+* 'TokenBucket' per server and per (server, agent) - e.g. agent '0' polled by
+  *isConnectedToMux* - caps the request rate while allowing short bursts,
+* 'AdaptiveLimiter' per server caps the number of requests in flight. The limit grows
+  by one per round of fast responses (additive increase) and is cut by *backoff* when
+  latency rises above *tolerance* times the lowest latency seen for the same operation
+  (RPC method and tid, HTTP method and path), or the server reports a timeout or
+  unavailability (multiplicative decrease). Errors of one agent behind the server
+  (switch not running, object not found, ...) are not overload.
+
+The limits are shared by all clients throttled with the same 'Limits' object (module-wide
+*default_limits* by default), so fan-outs over many client objects still respect them.
+
+>>> import cvbn_ratelimit, cvbn_vswitch
+>>> limits = cvbn_ratelimit.Limits(serverRate = 100, agentRate = 10)
+>>> vswitch = cvbn_ratelimit.throttle(cvbn_vswitch.vswitch("localhost","none"), limits)
+>>> print limits.stats("localhost")
+{'limit': 9.1, 'inflight': 0, 'waited': 0.0}
+
+"""
+
+import threading
+import time
+from cvbx_rpc_tools.method import RpcMethodError
+from cvbn_transport import MethodWrapper, HttpWrapper, wrap_client, classify, TIMEOUT, UNAVAILABLE
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+class TokenBucket(object):
+    """Token bucket
+
+    :param rate: tokens added per second
+    :param burst: bucket size (max. requests sent at once). Default *rate*
+    """
+    def __init__(self, rate, burst = None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._stamp = time.time()
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def tryAcquire(self, tokens = 1):
+        """Take *tokens* if available, return True on success
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens = self._tokens - tokens
+                return True
+            return False
+
+    def acquire(self, tokens = 1):
+        """Take *tokens*, waiting for them if needed; return seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens = self._tokens - tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited = waited + delay
+
+class AdaptiveLimiter(object):
+    """Concurrency limiter adapting to latency (AIMD)
+
+    :param initial: initial limit of requests in flight. Default 8
+    :param minimum: lowest limit. Default 1
+    :param maximum: highest limit. Default 64
+    :param tolerance: latency above *tolerance* x lowest latency is overload. Default 2
+    :param backoff: factor applied to the limit on overload. Default 0.8
+
+    Lowest latency (*baselines*) is kept per operation, e.g. ('walk', 'networking.network'),
+    so a long walk of a large tid is not compared with quick gets. Operations beyond
+    *MAX_OPERATIONS* share one baseline.
+    """
+    MAX_OPERATIONS = 256
+
+    def __init__(self, initial = 8, minimum = 1, maximum = 64, tolerance = 2.0, backoff = 0.8):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.baselines = {}
+        self.inflight = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    def acquire(self):
+        """Wait for free slot, return seconds waited
+        """
+        start = time.time()
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                self._cond.wait()
+            self.inflight = self.inflight + 1
+        return time.time() - start
+
+    def release(self, latency, overload = False, operation = None):
+        """Free slot of request of *operation* that took *latency* seconds; *overload* is
+        True if the server reported transient failure
+        """
+        with self._cond:
+            self.inflight = self.inflight - 1
+            if operation not in self.baselines and len(self.baselines) >= self.MAX_OPERATIONS:
+                operation = None
+            baseline = self.baselines.get(operation)
+            if baseline == None or latency < baseline:
+                baseline = self.baselines[operation] = latency
+            if overload or latency > self.tolerance * baseline:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                # forget old minimum slowly, so a permanently slower server is learnt;
+                # overloaded responses never move it, so overload does not become normal
+                self.baselines[operation] = min(latency, baseline * 1.01)
+            self._cond.notify_all()
+
+class Limits(object):
+    """Rate and concurrency limits shared by throttled clients
+
+    :param serverRate: requests per second per server, None for unlimited. Default 50
+    :param serverBurst: burst per server. Default *serverRate*
+    :param agentRate: requests per second per (server, agent), None for unlimited. Default None
+    :param agentBurst: burst per agent. Default *agentRate*
+    :param adaptive: keyword arguments of AdaptiveLimiter per server, False to disable.
+        Default None (AdaptiveLimiter defaults)
+    """
+    def __init__(self, serverRate = 50, serverBurst = None, agentRate = None, agentBurst = None, adaptive = None):
+        self.serverRate = serverRate
+        self.serverBurst = serverBurst
+        self.agentRate = agentRate
+        self.agentBurst = agentBurst
+        self.adaptive = adaptive
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._limiters = {}
+        self._waited = {}
+
+    def _bucket(self, key, rate, burst):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket == None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+            return bucket
+
+    def limiter(self, endpoint):
+        """Return AdaptiveLimiter of *endpoint*, None if adaptive concurrency is disabled
+        """
+        if self.adaptive == False:
+            return None
+        with self._lock:
+            limiter = self._limiters.get(endpoint)
+            if limiter == None:
+                limiter = self._limiters[endpoint] = AdaptiveLimiter(**(self.adaptive or {}))
+            return limiter
+
+    def acquire(self, endpoint, agent = None):
+        """Wait until request to *agent* of *endpoint* may be sent
+        """
+        waited = 0.0
+        if self.serverRate != None:
+            waited = waited + self._bucket(endpoint, self.serverRate, self.serverBurst).acquire()
+        if self.agentRate != None and agent != None:
+            waited = waited + self._bucket((endpoint, agent), self.agentRate, self.agentBurst).acquire()
+        limiter = self.limiter(endpoint)
+        if limiter != None:
+            waited = waited + limiter.acquire()
+        if waited:
+            with self._lock:
+                self._waited[endpoint] = self._waited.get(endpoint, 0.0) + waited
+
+    def release(self, endpoint, latency, overload = False, operation = None):
+        limiter = self.limiter(endpoint)
+        if limiter != None:
+            limiter.release(latency, overload, operation)
+
+    def call(self, endpoint, agent, fn, overload, operation = None):
+        """Call *fn()* within the limits; *overload(exception or result)* tells if the
+        outcome signals server overload, *operation* selects the latency baseline
+        """
+        self.acquire(endpoint, agent)
+        start = time.time()
+        failed = True
+        try:
+            result = fn()
+            failed = overload(result)
+            return result
+        except Exception as error:
+            failed = overload(error)
+            raise
+        finally:
+            self.release(endpoint, time.time() - start, failed, operation)
+
+    def stats(self, endpoint):
+        """Return dict with current concurrency *limit*, requests *inflight* and total
+        seconds *waited* by requests to *endpoint*
+        """
+        limiter = self.limiter(endpoint)
+        with self._lock:
+            waited = round(self._waited.get(endpoint, 0.0), 3)
+        if limiter == None:
+            return {'limit': None, 'inflight': None, 'waited': waited}
+        return {'limit': round(limiter.limit, 1), 'inflight': limiter.inflight, 'waited': waited}
+
+default_limits = Limits()
+
+# RPC error categories signalling overloaded server
+OVERLOAD = (TIMEOUT, UNAVAILABLE)
+
+def _rpcOverload(outcome):
+    return isinstance(outcome, RpcMethodError) and classify(outcome) in OVERLOAD
+
+def _resource(path):
+    # /admin/devices/d-91ce97... -> /admin/devices/*, one operation for all objects
+    return '/'.join('*' if any(char.isdigit() for char in part) else part for part in path.split('/'))
+
+def _httpOverload(outcome):
+    if isinstance(outcome, Exception):
+        return isinstance(outcome, (IOError, OSError))
+    return getattr(outcome, 'status_code', None) in (429, 502, 503, 504)
+
+class RateLimitedMethod(MethodWrapper):
+    """RPC method wrapper sending requests within the limits
+    """
+    def __init__(self, name, method, limits, endpoint):
+        MethodWrapper.__init__(self, name, method)
+        self.limits = limits
+        self.endpoint = endpoint
+
+    def invoke(self, agent, cid, params):
+        return self.limits.call(self.endpoint, agent, lambda: self.method.invoke(agent, cid, params), _rpcOverload,
+                                (self.name, params.get('tid')))
+
+class RateLimitedHttp(HttpWrapper):
+    """HTTP layer wrapper sending requests within the limits of the URL host
+    """
+    def __init__(self, http, limits):
+        HttpWrapper.__init__(self, http)
+        self.limits = limits
+
+    def request(self, method, url, *args, **kwargs):
+        parsed = urlparse(url)
+        return self.limits.call(parsed.netloc, None,
+                                lambda: HttpWrapper.request(self, method, url, *args, **kwargs), _httpOverload,
+                                (method, _resource(parsed.path)))
+
+def throttle(client, limits = None):
+    """.. function:: throttle(client, limits = None)
+
+    Send requests of already created client within rate and concurrency limits
+
+    :param client: 'vbn', 'vswitch' or 'rcs' instance
+    :param limits: Limits object. Default module-wide *default_limits*
+    :returns: client
+
+    """
+    if limits == None:
+        limits = default_limits
+    endpoint = getattr(client, 'server', None)
+    return wrap_client(client,
+                       rpc_wrapper = lambda name, method: RateLimitedMethod(name, method, limits, endpoint),
+                       http_wrapper = lambda http: RateLimitedHttp(http, limits))
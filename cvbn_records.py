@@ -0,0 +1,196 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_records
+    :synopsis: Compact record types for walked CVBN objects
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing compact read-only records used instead of dicts returned by
+walks when record mode of 'vbn'/'vswitch' is enabled (*setRecords(True)*).
+
+Each tid gets its own record type with *__slots__* made of attribute names of the
+first object seen. Attributes not known to the type are kept in a small extra dict.
+*tid* values and extra attribute names are interned (in a table bounded by
+*MAX_INTERNED* entries), nested {'tid', 'id'} references become records, lists
+become tuples. Records keep dict-like read access::
+
+    >>> port['name'], port['local_endpoint'], port.get('mac_address'), 'id' in port
+    >>> port.name, port.todict()
+
+"""
+
+import re
+import threading
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+INTERNED = ('tid',)
+MAX_INTERNED = 4096
+
+_MISSING = object()
+_strings = {}
+_types = {}
+_lock = threading.Lock()
+
+def intern_string(value):
+    """Return canonical instance of string *value* (works for unicode too); once the
+    table holds *MAX_INTERNED* strings, new ones are returned as they are
+    """
+    canonical = _strings.get(value)
+    if canonical != None:
+        return canonical
+    if len(_strings) >= MAX_INTERNED:
+        return value
+    return _strings.setdefault(value, value)
+
+def _freeze(key, value):
+    if isinstance(value, dict):
+        if 'tid' in value and set(value.keys()) <= REF_FIELDS:
+            return Ref(value)
+        return dict((k, _freeze(k, v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(None, v) for v in value)
+    if key in INTERNED and isinstance(value, string_types):
+        return intern_string(value)
+    return value
+
+def _thaw(value):
+    if isinstance(value, Record):
+        return value.todict()
+    if isinstance(value, dict):
+        return dict((k, _thaw(v)) for k, v in value.items())
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+class Record(object):
+    """Base class of compact read-only records with dict-like read access
+    """
+    __slots__ = ('_extra',)
+    _fields = ()
+    _fieldset = frozenset()
+
+    def __init__(self, obj):
+        extra = None
+        for key, value in obj.items():
+            if key in self._fieldset:
+                object.__setattr__(self, key, _freeze(key, value))
+            else:
+                if extra == None:
+                    extra = {}
+                extra[intern_string(key)] = _freeze(key, value)
+        object.__setattr__(self, '_extra', extra)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("record is read-only")
+
+    def __getitem__(self, key):
+        if key in self._fieldset:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                return value
+        elif self._extra != None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self):
+        keys = [key for key in self._fields if hasattr(self, key)]
+        if self._extra != None:
+            keys.extend(self._extra.keys())
+        return keys
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def todict(self):
+        """Return the object as plain dict (JSON serializable)
+        """
+        return dict((key, _thaw(value)) for key, value in self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.todict() == _thaw(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.todict())
+
+    def __reduce__(self):
+        return (make, (self.todict(),))
+
+class Ref(Record):
+    """Reference to another object ({'tid', 'id'})
+    """
+    __slots__ = ('tid', 'id')
+    _fields = ('tid', 'id')
+    _fieldset = frozenset(_fields)
+
+REF_FIELDS = Ref._fieldset
+
+def _slot_name(field):
+    try:
+        field = str(field)
+    except UnicodeError:
+        return False
+    return re.match(r'^[A-Za-z][A-Za-z0-9_]*$', field) != None and not hasattr(Record, field)
+
+def record_type(tid, fields):
+    """.. function:: record_type(tid, fields)
+
+    Return record type for *tid*, created with *fields* slots if not defined yet
+
+    """
+    rtype = _types.get(tid)
+    if rtype == None:
+        with _lock:
+            rtype = _types.get(tid)
+            if rtype == None:
+                fields = tuple(sorted(str(field) for field in fields if _slot_name(field)))
+                name = str(''.join(part.capitalize() for part in tid.replace('_', '.').split('.')) + 'Record')
+                rtype = type(name, (Record,), {'__slots__': fields, '_fields': fields, '_fieldset': frozenset(fields)})
+                _types[tid] = rtype
+    return rtype
+
+def make(obj):
+    """Convert walked object *obj* (dict) to record
+    """
+    if obj == None or isinstance(obj, Record):
+        return obj
+    return record_type(obj.get('tid', ''), obj.keys())(obj)
+
+def records(iterable):
+    """Convert iterable of walked objects to iterator of records
+    """
+    for obj in iterable:
+        yield make(obj)
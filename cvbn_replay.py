@@ -0,0 +1,350 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_replay
+    :synopsis: Record/replay transport for CVBN RPC and RCS REST traffic
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing capture of walk/get/set/delete exchanges of 'vbn'/'vswitch'
+and HTTP exchanges of 'rcs' into compact on-disk log (one JSON object per line,
+gzip compressed if the file name ends with '.gz'), and replay of such log
+through the same client classes without live CvBN/CvBB or RCS.
+
+Replayed exchanges are matched by method, agent/URL and parameters/body. When the
+same request was recorded more than once, responses are returned in recorded order
+and the last one is repeated afterwards.
+
+Every exchange is logged with its start offset in the recording session (*t*) and
+its duration (*d*). Replay runs a clock from the first replayed request and answers
+an exchange not before its recorded start plus duration (scaled by *speed*), and not
+sooner than its duration after the request, so both the gaps between requests and
+the overlap of concurrent ones are reproduced.
+
+Credentials are never written to the log: values of *SECRET_FIELDS* in HTTP request
+bodies (form data or JSON, e.g. OAuth token request and new admin user) and in
+response texts (tokens) are replaced with *REDACTED*, and the Authorization header
+is dropped. Texts without credentials are logged byte for byte. Replay applies the
+same redaction to the request before lookup.
+
+>>> import cvbn_replay, cvbn_vswitch
+>>> log = cvbn_replay.ExchangeLog("switch.log.gz", "w")
+>>> vswitch = cvbn_replay.record(cvbn_vswitch.vswitch("localhost","none"), log)
+>>> vswitch.getSwitches()
+>>> log.close()
+>>> log = cvbn_replay.ExchangeLog("switch.log.gz")
+>>> vswitch = cvbn_vswitch.vswitch("localhost","none", factory = cvbn_replay.ReplayFactory(log, speed = 0))
+
+"""
+
+import gzip
+import json
+import threading
+import time
+from cvbx_rpc_tools.method import RpcMethodError
+from cvbn_transport import MethodWrapper, HttpWrapper, WrappedFactory, wrap_client
+
+# chunk size of replayed raw responses
+STREAM_CHUNK = 4096
+
+# HTTP body/response fields never written to the log
+SECRET_FIELDS = frozenset(('client_secret', 'username', 'password', 'access_token', 'refresh_token'))
+REDACTED = '***'
+
+class ReplayMiss(Exception):
+    """Exception raised when replayed request was never recorded
+    """
+    pass
+
+class ReplayedError(Exception):
+    """Exception raised on replay of HTTP request that failed when recorded
+    """
+    pass
+
+def _key(*parts):
+    return json.dumps(parts, sort_keys = True)
+
+def _http_headers(kwargs):
+    headers = dict(kwargs.get('headers') or {})
+    # Token differs between sessions, it must not be part of the key
+    headers.pop('Authorization', None)
+    return headers
+
+def _secrets(value):
+    '''tuple (copy of decoded value with SECRET_FIELDS replaced, True if any was replaced)'''
+    if isinstance(value, dict):
+        redacted = {}
+        found = False
+        for key, item in value.items():
+            if key in SECRET_FIELDS:
+                redacted[key] = REDACTED
+                found = True
+            else:
+                redacted[key], inner = _secrets(item)
+                found = found or inner
+        return (redacted, found)
+    if isinstance(value, list):
+        items = [_secrets(item) for item in value]
+        return ([item for item, inner in items], any(inner for item, inner in items))
+    return (value, False)
+
+def _redact(value):
+    '''value with SECRET_FIELDS replaced; JSON strings are redacted on a decoded copy and
+    returned unchanged (byte for byte) if they hold no credentials'''
+    if isinstance(value, (dict, list, tuple)):
+        return _secrets(list(value) if isinstance(value, tuple) else value)[0]
+    if isinstance(value, (str, type(u''))):
+        try:
+            decoded = json.loads(value)
+        except ValueError:
+            return value
+        redacted, found = _secrets(decoded)
+        if found:
+            return json.dumps(redacted, sort_keys = True)
+    return value
+
+def _http_body(args, kwargs):
+    if args:
+        return _redact(args[0])
+    return _redact(kwargs.get('data', kwargs.get('json')))
+
+class ExchangeLog(object):
+    """On-disk log of recorded exchanges
+
+    :param path: log file name; gzip compression is used for '.gz' suffix
+    :param mode: 'r' to load the log for replay, 'w' to record, 'a' to append
+    """
+    def __init__(self, path, mode = 'r'):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._exchanges = {}
+        self._fd = None
+        # recorded start of the first exchange and start of the replay clock
+        self._origin = None
+        self._replayStart = None
+        if mode == 'r':
+            self._load()
+        else:
+            self._fd = self._open(mode + 'b')
+
+    def _open(self, mode):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, mode)
+        return open(self.path, mode)
+
+    def _load(self):
+        fd = self._open('rb')
+        try:
+            for line in fd:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line.decode('utf-8'))
+                self._exchanges.setdefault(self._entryKey(entry), []).append(entry)
+                if 't' in entry and (self._origin == None or entry['t'] < self._origin):
+                    self._origin = entry['t']
+        finally:
+            fd.close()
+
+    @staticmethod
+    def _entryKey(entry):
+        if entry['k'] == 'rpc':
+            return _key('rpc', entry['m'], entry['a'], entry['p'])
+        return _key('http', entry['m'], entry['u'], entry['b'], entry['h'])
+
+    def write(self, entry):
+        """Append exchange *entry* (dict) to the log
+        """
+        entry['t'] = round(entry['t'] - self._start, 4)
+        line = json.dumps(entry, separators = (',', ':')) + '\n'
+        with self._lock:
+            self._fd.write(line.encode('utf-8'))
+
+    def lookup(self, key):
+        """Return next recorded exchange for *key*. Raises ReplayMiss if not recorded
+        """
+        with self._lock:
+            entries = self._exchanges.get(key)
+            if not entries:
+                raise ReplayMiss(key)
+            if len(entries) > 1:
+                return entries.pop(0)
+            return entries[0]
+
+    def offset(self, entry):
+        """Return tuple (recorded start of *entry*, time on the replay clock), both in
+        seconds from the start of the session; the replay clock starts with the first call
+        """
+        now = time.time()
+        with self._lock:
+            if self._replayStart == None:
+                self._replayStart = now
+            start = now - self._replayStart
+        if 't' not in entry or self._origin == None:
+            return (None, start)
+        return (entry['t'] - self._origin, start)
+
+    def close(self):
+        if self._fd != None:
+            self._fd.close()
+            self._fd = None
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._exchanges.values())
+
+class RecordingMethod(MethodWrapper):
+    """RPC method wrapper writing every exchange to the log
+    """
+    def __init__(self, name, method, log):
+        MethodWrapper.__init__(self, name, method)
+        self.log = log
+
+    def invoke(self, agent, cid, params):
+        entry = {'k': 'rpc', 'm': self.name, 'a': agent, 'p': params, 't': time.time()}
+        try:
+            result = self.method.invoke(agent, cid, params)
+        except RpcMethodError as error:
+            entry['d'] = round(time.time() - entry['t'], 4)
+            entry['e'] = str(error)
+            self.log.write(entry)
+            raise
+        entry['d'] = round(time.time() - entry['t'], 4)
+        entry['r'] = result
+        self.log.write(entry)
+        return result
+
+class RecordingHttp(HttpWrapper):
+    """HTTP layer wrapper writing every exchange to the log
+    """
+    def __init__(self, http, log):
+        HttpWrapper.__init__(self, http)
+        self.log = log
+
+    def request(self, method, url, *args, **kwargs):
+        entry = {'k': 'http', 'm': method, 'u': url, 'b': _http_body(args, kwargs),
+                 'h': _http_headers(kwargs), 't': time.time()}
+        try:
+            r = HttpWrapper.request(self, method, url, *args, **kwargs)
+        except Exception as error:
+            entry['d'] = round(time.time() - entry['t'], 4)
+            entry['e'] = str(error)
+            self.log.write(entry)
+            raise
+        entry['d'] = round(time.time() - entry['t'], 4)
+        entry['s'] = r.status_code
+        entry['x'] = _redact(r.text)
+        self.log.write(entry)
+        return r
+
+class _Replayer(object):
+    def __init__(self, log, speed):
+        self.log = log
+        self.speed = speed
+
+    def _wait(self, entry):
+        '''hold the response until the recorded start + duration on the replay clock, at
+        least the recorded duration'''
+        recorded, now = self.log.offset(entry)
+        if not self.speed:
+            return
+        speed = float(self.speed)
+        delay = entry.get('d', 0) / speed
+        if recorded != None:
+            delay = max(delay, (recorded + entry.get('d', 0)) / speed - now)
+        if delay > 0:
+            time.sleep(delay)
+
+class ReplayMethod(MethodWrapper, _Replayer):
+    """RPC method object answering from the log
+    """
+    def __init__(self, name, log, speed = 1.0):
+        MethodWrapper.__init__(self, name, None)
+        _Replayer.__init__(self, log, speed)
+
+    def invoke(self, agent, cid, params):
+        entry = self.log.lookup(_key('rpc', self.name, agent, params))
+        self._wait(entry)
+        if 'e' in entry:
+            raise RpcMethodError(entry['e'])
+        return entry['r']
+
+    def stream(self, agent, cid, params):
+        """Return recorded response as raw JSON chunks (see cvbn_walk)
+        """
+        data = json.dumps(self.invoke(agent, cid, params))
+        return (data[offset:offset + STREAM_CHUNK] for offset in range(0, len(data), STREAM_CHUNK))
+
+class ReplayFactory(object):
+    """RpcMethodFactory look-alike for 'vbn'/'vswitch' *factory* parameter
+
+    :param log: ExchangeLog opened for reading
+    :param speed: timing scale; 1.0 reproduces recorded timing, 2.0 is twice as fast, 0 or None - no delay
+    """
+    def __init__(self, log, speed = 1.0):
+        self.log = log
+        self.speed = speed
+
+    def method(self, name):
+        return ReplayMethod(name, self.log, self.speed)
+
+class ReplayResponse(object):
+    """Minimal *requests.Response* look-alike
+    """
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.ok = status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size = 1, decode_unicode = False):
+        data = self.text if decode_unicode else self.content
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+
+    def close(self):
+        pass
+
+class ReplayHttp(HttpWrapper, _Replayer):
+    """HTTP layer for 'rcs' *http* parameter answering from the log
+
+    :param log: ExchangeLog opened for reading
+    :param speed: timing scale; 1.0 reproduces recorded timing, 0 or None - no delay
+    """
+    def __init__(self, log, speed = 1.0):
+        HttpWrapper.__init__(self, None)
+        _Replayer.__init__(self, log, speed)
+
+    def request(self, method, url, *args, **kwargs):
+        entry = self.log.lookup(_key('http', method, url, _http_body(args, kwargs), _http_headers(kwargs)))
+        self._wait(entry)
+        if 'e' in entry:
+            raise ReplayedError(entry['e'])
+        return ReplayResponse(entry['s'], entry['x'])
+
+def recording_factory(factory, log):
+    """Return factory wrapper recording all exchanges of created methods to *log*
+    """
+    return WrappedFactory(factory, lambda name, method: RecordingMethod(name, method, log))
+
+def record(client, log):
+    """.. function:: record(client, log)
+
+    Start recording all exchanges of already created client to *log*.
+
+    For 'rcs' the authentication exchange is recorded only if it was not done yet
+    (authentication happens on the first request or *warmup()*).
+
+    :param client: 'vbn', 'vswitch' or 'rcs' instance
+    :param log: ExchangeLog opened for writing
+    :returns: client
+
+    """
+    return wrap_client(client,
+                       rpc_wrapper = lambda name, method: RecordingMethod(name, method, log),
+                       http_wrapper = lambda http: RecordingHttp(http, log))
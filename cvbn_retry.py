@@ -0,0 +1,283 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_retry
+    :synopsis: Retry with backoff and circuit breaker for CVBN RPC and RCS REST calls
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing resilience layer stacked on the transport of 'vbn', 'vswitch' and
+'rcs' objects (see cvbn_transport.wrap_client):
+
+* idempotent requests (RPC walk/get/delete, HTTP GET/PUT/DELETE) failing with transient
+  error (see cvbn_transport.classify; HTTP connection errors and 502/503/504 responses)
+  are repeated according to 'RetryPolicy' - exponential backoff with full jitter,
+* 'CircuitBreaker' per endpoint (server) fails requests fast with *CircuitOpen* after
+  *threshold* consecutive transient failures, lets one probe through after *reset*
+  seconds and closes again on its success,
+* retry and breaker counters are collected in 'RetryMetrics'.
+
+Errors caused by the request itself (object not found, conflict, invalid parameters)
+or by the state of one agent behind the server (switch not connected/not running) are
+never retried and do not count as endpoint failures, so one stopped switch does not
+open the breaker of the whole server; neither are unclassified errors retried. A repeated delete answered
+with 'not found' means the previous attempt succeeded, so it is reported as success.
+
+>>> import cvbn_retry, cvbn_vswitch
+>>> metrics = cvbn_retry.RetryMetrics()
+>>> vswitch = cvbn_retry.resilient(cvbn_vswitch.vswitch("localhost","none"), metrics = metrics)
+>>> print metrics.snapshot()
+{'calls': 12, 'retries': 1, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+"""
+
+import random
+import threading
+import time
+from cvbx_rpc_tools.method import RpcMethodError
+from cvbn_transport import MethodWrapper, HttpWrapper, wrap_client, classify, is_retryable
+import cvbn_transport
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+RETRY_RPC = ('walk', 'get', 'delete')
+RETRY_HTTP = ('get', 'put', 'delete')
+RETRY_STATUS = (502, 503, 504)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+class CircuitOpen(Exception):
+    """Exception raised without calling the server while its circuit breaker is open
+    """
+    pass
+
+class RpcCircuitOpen(CircuitOpen, RpcMethodError):
+    """CircuitOpen of RPC requests, handled by the clients as any other RPC error
+    """
+    pass
+
+class RetryPolicy(object):
+    """Retry policy
+
+    :param attempts: max. number of attempts (1 = no retry). Default 3
+    :param base: delay before the first retry in seconds. Default 0.1
+    :param cap: max. delay in seconds. Default 5
+    :param jitter: randomize delays (full jitter). Default True
+    """
+    def __init__(self, attempts = 3, base = 0.1, cap = 5.0, jitter = True):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+
+    def delay(self, retry):
+        """Return delay before retry number *retry* (0 based)
+        """
+        delay = min(self.cap, self.base * (2 ** retry))
+        if self.jitter:
+            return random.uniform(0, delay)
+        return delay
+
+class RetryMetrics(object):
+    """Thread-safe counters of the resilience layer, total and per endpoint
+
+    *calls* - requests, *retries* - repeated attempts, *failures* - requests failed after
+    all attempts, *rejected* - requests failed fast by open breaker, *opened* - breaker trips
+    """
+    FIELDS = ('calls', 'retries', 'failures', 'rejected', 'opened')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def count(self, endpoint, field):
+        with self._lock:
+            for key in (None, endpoint):
+                counters = self._counters.setdefault(key, dict.fromkeys(self.FIELDS, 0))
+                counters[field] = counters[field] + 1
+
+    def snapshot(self, endpoint = None):
+        """Return dict of counters of *endpoint* (all endpoints if None)
+        """
+        with self._lock:
+            return dict(self._counters.get(endpoint, dict.fromkeys(self.FIELDS, 0)))
+
+    def endpoints(self):
+        with self._lock:
+            return [key for key in self._counters if key != None]
+
+class CircuitBreaker(object):
+    """Circuit breaker of one endpoint
+
+    :param threshold: consecutive transient failures opening the breaker. Default 5
+    :param reset: seconds before a probe request is let through. Default 30
+    """
+    def __init__(self, threshold = 5, reset = 30.0):
+        self.threshold = threshold
+        self.reset = reset
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.openedAt = None
+
+    def allow(self):
+        """Return True if request may be sent
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.openedAt >= self.reset:
+                # one probe request
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        """Record transient failure, return True if the breaker has just opened
+        """
+        with self._lock:
+            self.failures = self.failures + 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                self.state = OPEN
+                self.openedAt = time.time()
+                return True
+            return False
+
+class Breakers(object):
+    """Registry of circuit breakers per endpoint
+    """
+    def __init__(self, threshold = 5, reset = 30.0):
+        self.threshold = threshold
+        self.reset = reset
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, endpoint):
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker == None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(self.threshold, self.reset)
+            return breaker
+
+    def states(self):
+        """Return dict endpoint -> breaker state
+        """
+        with self._lock:
+            return dict((endpoint, breaker.state) for endpoint, breaker in self._breakers.items())
+
+default_breakers = Breakers()
+
+class _Resilience(object):
+    def __init__(self, policy, breakers, metrics, sleep):
+        self.policy = policy or RetryPolicy()
+        self.breakers = breakers or default_breakers
+        self.metrics = metrics or RetryMetrics()
+        self.sleep = sleep
+
+    def _call(self, endpoint, retry, send, transient, rejected):
+        """Send request with retries; *send()* returns (ok, result or exception),
+        *transient(result or exception)* tells if it is worth retrying
+        """
+        breaker = self.breakers.get(endpoint)
+        self.metrics.count(endpoint, 'calls')
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.metrics.count(endpoint, 'rejected')
+                raise rejected("circuit open for {}: server unavailable".format(endpoint))
+            ok, result = send(attempt)
+            if ok and not transient(result):
+                breaker.success()
+                return result
+            if not transient(result):
+                # request error, endpoint is fine
+                breaker.success()
+                raise result
+            if breaker.failure():
+                self.metrics.count(endpoint, 'opened')
+            attempt = attempt + 1
+            if not retry or attempt >= self.policy.attempts:
+                self.metrics.count(endpoint, 'failures')
+                if ok:
+                    return result
+                raise result
+            self.metrics.count(endpoint, 'retries')
+            self.sleep(self.policy.delay(attempt - 1))
+
+class RetryingMethod(MethodWrapper, _Resilience):
+    """RPC method wrapper retrying transient failures of walk/get/delete
+    """
+    def __init__(self, name, method, endpoint, policy = None, breakers = None, metrics = None, sleep = time.sleep):
+        MethodWrapper.__init__(self, name, method)
+        _Resilience.__init__(self, policy, breakers, metrics, sleep)
+        self.endpoint = endpoint
+
+    def invoke(self, agent, cid, params):
+        def send(attempt):
+            try:
+                return (True, self.method.invoke(agent, cid, params))
+            except RpcMethodError as error:
+                if attempt > 0 and self.name == 'delete' and classify(error) == cvbn_transport.NOT_FOUND:
+                    # deleted by the previous attempt
+                    return (True, {})
+                return (False, error)
+
+        def transient(result):
+            return isinstance(result, RpcMethodError) and is_retryable(classify(result))
+
+        return self._call(self.endpoint, self.name in RETRY_RPC, send, transient, RpcCircuitOpen)
+
+class RetryingHttp(HttpWrapper, _Resilience):
+    """HTTP layer wrapper retrying connection errors and 502/503/504 of GET/PUT/DELETE
+    """
+    def __init__(self, http, policy = None, breakers = None, metrics = None, sleep = time.sleep):
+        HttpWrapper.__init__(self, http)
+        _Resilience.__init__(self, policy, breakers, metrics, sleep)
+
+    def request(self, method, url, *args, **kwargs):
+        def send(attempt):
+            try:
+                return (True, HttpWrapper.request(self, method, url, *args, **kwargs))
+            except Exception as error:
+                return (False, error)
+
+        def transient(result):
+            if isinstance(result, Exception):
+                # connection errors, timeouts (requests.exceptions are IOError)
+                return isinstance(result, (IOError, OSError)) or is_retryable(classify(result))
+            return getattr(result, 'status_code', None) in RETRY_STATUS
+
+        return self._call(urlparse(url).netloc, method in RETRY_HTTP, send, transient, CircuitOpen)
+
+def resilient(client, policy = None, breakers = None, metrics = None):
+    """.. function:: resilient(client, policy = None, breakers = None, metrics = None)
+
+    Add retries and circuit breaker to the transport of already created client
+
+    :param client: 'vbn', 'vswitch' or 'rcs' instance
+    :param policy: RetryPolicy. Default 3 attempts, 0.1s base delay
+    :param breakers: Breakers registry. Default module-wide *default_breakers*
+    :param metrics: RetryMetrics collecting counters
+    :returns: client
+
+    """
+    if breakers == None:
+        breakers = default_breakers
+    if metrics == None:
+        metrics = RetryMetrics()
+    client.retryMetrics = metrics
+    endpoint = getattr(client, 'server', None)
+    return wrap_client(client,
+                       rpc_wrapper = lambda name, method: RetryingMethod(name, method, endpoint, policy, breakers, metrics),
+                       http_wrapper = lambda http: RetryingHttp(http, policy, breakers, metrics))
@@ -0,0 +1,263 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_scheduler
+    :synopsis: Priority-aware scheduler of CVBN RPC and RCS REST requests
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'Scheduler' class stacked on the transport of 'vbn', 'vswitch'
+and 'rcs' objects (see cvbn_transport.wrap_client). Requests run in slots of a fixed
+*capacity*; a freed slot goes to a waiting request of the highest priority class
+(*INTERACTIVE* before *BULK*) whose class is below its own concurrency limit. Within
+a class waiting requests are served round-robin per fairness key (tenant, switch), so
+one switch with thousands of queued walks does not starve the others.
+
+The class of a request is taken from the calling thread's context (*priority* context
+manager), then from the default of the scheduled client. The fairness key is the key
+of the context, or the agent (switch/host UUID) of RPC requests and the URL host of
+HTTP requests.
+
+The default limits keep a quarter of the capacity out of reach of bulk traffic, so
+interactive requests start immediately even while bulk pipelines saturate the rest.
+
+A request waits for its slot at most until the deadline of the calling thread (see
+cvbn_deadline) and then raises DeadlineExceeded without being sent.
+
+>>> import cvbn_scheduler, cvbn_vswitch
+>>> vswitch = cvbn_scheduler.schedule(cvbn_vswitch.vswitch("localhost","none"))
+>>> with cvbn_scheduler.priority(cvbn_scheduler.BULK, "tenant-a"):
+...     switches = vswitch.getSwitches()
+>>> print cvbn_scheduler.default_scheduler.stats()
+{'running': {'interactive': 0, 'bulk': 0}, 'queued': {'interactive': 0, 'bulk': 0}, 'maxWait': {'interactive': 0.0, 'bulk': 0.0}}
+
+"""
+
+import collections
+import contextlib
+import threading
+import time
+import cvbn_deadline
+from cvbn_transport import MethodWrapper, HttpWrapper, wrap_client
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+CLASSES = (INTERACTIVE, BULK)
+
+_context = threading.local()
+
+@contextlib.contextmanager
+def priority(cls, key = None):
+    """.. function:: priority(cls, key = None)
+
+    Context manager running requests of the current thread in class *cls* with
+    fairness *key*; contexts nest. Workers of cvbn_pipeline inherit the context of the
+    calling thread; for other thread pools pass the function through *bind*
+
+    """
+    if cls not in CLASSES:
+        raise ValueError("unknown priority class {}".format(cls))
+    previous = getattr(_context, 'current', None)
+    _context.current = (cls, key)
+    try:
+        yield
+    finally:
+        _context.current = previous
+
+def current():
+    """Return tuple (class, key) set by *priority* in the current thread, (None, None) if none
+    """
+    return getattr(_context, 'current', None) or (None, None)
+
+def bind(fn):
+    """.. function:: bind(fn)
+
+    Return *fn* running with the priority context of the calling thread, for functions
+    executed by other threads (thread pools)
+
+    """
+    context = getattr(_context, 'current', None)
+    if context == None:
+        return fn
+
+    def bound(*args, **kwargs):
+        previous = getattr(_context, 'current', None)
+        _context.current = context
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _context.current = previous
+    return bound
+
+class _Ticket(object):
+    def __init__(self, cls, key):
+        self.cls = cls
+        self.key = key
+        self.granted = False
+        self.queued = time.time()
+
+class Scheduler(object):
+    """Priority scheduler of requests
+
+    :param capacity: max. number of requests running at once. Default 16
+    :param limits: dict class -> max. requests of that class running at once. Default
+        *capacity* for INTERACTIVE and 3/4 of *capacity* for BULK
+    """
+    def __init__(self, capacity = 16, limits = None):
+        self.capacity = capacity
+        self.limits = {INTERACTIVE: capacity, BULK: max(1, capacity * 3 // 4)}
+        self.limits.update(limits or {})
+        self._cond = threading.Condition(threading.Lock())
+        self._total = 0
+        self._running = dict.fromkeys(CLASSES, 0)
+        # class -> ordered dict key -> deque of tickets; the key order is the round-robin order
+        self._queues = dict((cls, collections.OrderedDict()) for cls in CLASSES)
+        self._queued = dict.fromkeys(CLASSES, 0)
+        self._maxWait = dict.fromkeys(CLASSES, 0.0)
+
+    def _next(self, cls):
+        queue = self._queues[cls]
+        key, tickets = queue.popitem(last = False)
+        ticket = tickets.popleft()
+        if tickets:
+            queue[key] = tickets
+        self._queued[cls] = self._queued[cls] - 1
+        return ticket
+
+    def _dispatch(self):
+        dispatched = False
+        while self._total < self.capacity:
+            for cls in CLASSES:
+                if self._queued[cls] and self._running[cls] < self.limits[cls]:
+                    ticket = self._next(cls)
+                    ticket.granted = True
+                    self._running[cls] = self._running[cls] + 1
+                    self._total = self._total + 1
+                    self._maxWait[cls] = max(self._maxWait[cls], time.time() - ticket.queued)
+                    dispatched = True
+                    break
+            else:
+                break
+        if dispatched:
+            self._cond.notify_all()
+
+    def _remove(self, ticket):
+        queue = self._queues[ticket.cls]
+        tickets = queue[ticket.key]
+        tickets.remove(ticket)
+        if not tickets:
+            del queue[ticket.key]
+        self._queued[ticket.cls] = self._queued[ticket.cls] - 1
+
+    def _release(self, cls):
+        self._running[cls] = self._running[cls] - 1
+        self._total = self._total - 1
+        self._dispatch()
+
+    def acquire(self, cls, key = None):
+        """Wait for slot of class *cls* with fairness *key*, at most until the deadline of
+        the current thread (DeadlineExceeded)
+        """
+        budget = cvbn_deadline.current()
+        ticket = _Ticket(cls, key)
+        with self._cond:
+            self._queues[cls].setdefault(key, collections.deque()).append(ticket)
+            self._queued[cls] = self._queued[cls] + 1
+            self._dispatch()
+            try:
+                while not ticket.granted:
+                    if budget == None:
+                        self._cond.wait()
+                        continue
+                    remaining = budget.remaining()
+                    if remaining <= 0:
+                        raise cvbn_deadline.DeadlineExceeded("no {} slot in {:.3f}s".format(cls, time.time() - ticket.queued), budget)
+                    self._cond.wait(remaining)
+            except BaseException:
+                # deadline, KeyboardInterrupt, ...: leave neither a queued ticket nor a granted slot
+                if ticket.granted:
+                    self._release(cls)
+                else:
+                    self._remove(ticket)
+                raise
+
+    def release(self, cls):
+        with self._cond:
+            self._release(cls)
+
+    def call(self, cls, key, fn):
+        """Call *fn()* in slot of class *cls* with fairness *key*
+        """
+        self.acquire(cls, key)
+        try:
+            return fn()
+        finally:
+            self.release(cls)
+
+    def stats(self):
+        """Return dict with requests *running* and *queued* and the longest *maxWait* in
+        queue (seconds) per class
+        """
+        with self._cond:
+            return {'running': dict(self._running),
+                    'queued': dict(self._queued),
+                    'maxWait': dict((cls, round(wait, 3)) for cls, wait in self._maxWait.items())}
+
+default_scheduler = Scheduler()
+
+class _Scheduled(object):
+    def __init__(self, scheduler, default):
+        self.scheduler = scheduler
+        self.default = default
+
+    def _call(self, key, fn):
+        cls, contextKey = current()
+        if contextKey != None:
+            key = contextKey
+        return self.scheduler.call(cls or self.default, key, fn)
+
+class ScheduledMethod(MethodWrapper, _Scheduled):
+    """RPC method wrapper running requests in scheduler slots
+    """
+    def __init__(self, name, method, scheduler, default):
+        MethodWrapper.__init__(self, name, method)
+        _Scheduled.__init__(self, scheduler, default)
+
+    def invoke(self, agent, cid, params):
+        return self._call(agent, lambda: self.method.invoke(agent, cid, params))
+
+class ScheduledHttp(HttpWrapper, _Scheduled):
+    """HTTP layer wrapper running requests in scheduler slots
+    """
+    def __init__(self, http, scheduler, default):
+        HttpWrapper.__init__(self, http)
+        _Scheduled.__init__(self, scheduler, default)
+
+    def request(self, method, url, *args, **kwargs):
+        return self._call(urlparse(url).netloc, lambda: HttpWrapper.request(self, method, url, *args, **kwargs))
+
+def schedule(client, scheduler = None, default = INTERACTIVE):
+    """.. function:: schedule(client, scheduler = None, default = INTERACTIVE)
+
+    Run requests of already created client through priority scheduler
+
+    :param client: 'vbn', 'vswitch' or 'rcs' instance
+    :param scheduler: Scheduler object. Default module-wide *default_scheduler*
+    :param default: class of requests sent outside of *priority* context, e.g. BULK for
+        clients used by audits and inventory sync. Default INTERACTIVE
+    :returns: client
+
+    """
+    if scheduler == None:
+        scheduler = default_scheduler
+    if default not in CLASSES:
+        raise ValueError("unknown priority class {}".format(default))
+    return wrap_client(client,
+                       rpc_wrapper = lambda name, method: ScheduledMethod(name, method, scheduler, default),
+                       http_wrapper = lambda http: ScheduledHttp(http, scheduler, default))
@@ -13,18 +13,45 @@ Module implementing 'vbn' class that controls all interactions with CVBN server
 
 import json
 import sys
+import threading
 from cvbx_rpc_tools.method import (
         RpcMethodFactory, RpcMethodError
 )
+from cvbn_transport import is_not_found, LazyMethod, classify, is_retryable
+from cvbn_deadline import DeadlineExceeded
+import cvbn_walk
+import cvbn_records
+import cvbn_cidr
 
 class CvbnApiFailure(Exception):
     """Exception raised when REST API execution fails
     """
     pass
 
+class CvbnRpcFailure(CvbnApiFailure):
+    """Exception raised when RPC to the agent fails
+
+    :ivar category: error class (see cvbn_transport.classify), e.g. 'not_found', 'unavailable'
+    :ivar retryable: True if the same request may succeed when repeated
+    :ivar tid: tid of the failed request
+    :ivar error: original RpcMethodError
+    """
+    def __init__(self, message, category, tid=None, error=None):
+        CvbnApiFailure.__init__(self, message)
+        self.category = category
+        self.retryable = is_retryable(category)
+        self.tid = tid
+        self.error = error
+
 class vbn(object):
-    def __init__(self, server, host):
-        """.. function:: init(server, host)
+    """Python class that controls all interactions with CVBN server (cvbn-guest-agent)
+
+    Thread safety: one object can be shared by many threads. Autodiscovery, RPC method
+    objects and *subnetIndex* are created once under a lock; *setRecords* is a setting
+    of the object (all threads), set it before sharing the object.
+    """
+    def __init__(self, server, host, factory=None):
+        """.. function:: init(server, host, factory=None)
 
         Setup communication channel for CRUD operations against cvbn-guest-agent via CvBB/CvBN.
         CvBB - HTTP protocol and REST syntax with default CvBB port (8280)
@@ -34,23 +61,50 @@ class vbn(object):
 
         There is no authentication.
 
+        Construction does not talk to the server. Autodiscovery is done on the first call
+        or by warmup().
+
         :param server: FQDN/IP of the server CvBB/CvBN
         :param host: if 'server' is CvBB, then 'host' must be UUID of the CvBN server. Otherwise it can be anything
+        :param factory: optional RPC method factory (e.g. cvbn_replay.ReplayFactory). Autodiscovery is skipped when given
 
 	>>> import cvbn_server
 	>>> server=cvbn_server.vbn("localhost","none")
 
         """
-        port = self._determine_rpc_port(server)
-        factory = RpcMethodFactory.factory(
-                '{}:{}'.format(server, str(port))
-        )
-        self._walk_method = factory.method('walk')
-        self._get_method = factory.method('get')
-        self._set_method = factory.method('set')
-        self._delete_method = factory.method('delete')
+        self._factory = factory
+        self._connectLock = threading.Lock()
+        self._walk_method = LazyMethod(self._connect, 'walk')
+        self._get_method = LazyMethod(self._connect, 'get')
+        self._set_method = LazyMethod(self._connect, 'set')
+        self._delete_method = LazyMethod(self._connect, 'delete')
+        self.server = server
         self.agent = host + '/cvbn-guest-agent'
         self.cid = 'magic'
+        self._filterSupport = cvbn_walk.FilterSupport()
+        self.records = False
+        self._subnetIndex = None
+        self._indexLock = threading.Lock()
+
+    def _connect(self):
+        '''autodiscovery and RPC factory setup, done once on first use'''
+        with self._connectLock:
+            if self._factory == None:
+                port = self._determine_rpc_port(self.server)
+                self._factory = RpcMethodFactory.factory(
+                        '{}:{}'.format(self.server, str(port))
+                )
+        return self._factory
+
+    def warmup(self, background=False):
+        ''' Pre-connect: run autodiscovery now (in background thread if requested, the thread is returned) '''
+        if not background:
+            self._connect()
+            return None
+        thread = threading.Thread(target=self._connect)
+        thread.daemon = True
+        thread.start()
+        return thread
 
     @staticmethod
     def _determine_rpc_port(server):
@@ -67,292 +121,305 @@ class vbn(object):
         else:
             return 8280
 
-    def create_network(self, prefix, network_type, interface):
-        ''' Creates networking object '''
-
-    params = {}
-    params['tid'] = 'networking.network'
-    params['name'] = prefix
-    params['network_type'] = network_type
-    params['host_interface'] = interface
-    try:
-        result = self._set_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        sys.exit(1)
-
-
-def is_networking(self):
-    ''' Check if there is any networking object created '''
-    params = {'tid': 'networking.network'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
+    def _failure(self, error, params):
+        ''' Log RPC error and return structured exception for it '''
         err = '{}\n{}'.format(sys.argv, error)
         print >> sys.stderr, err
-        sys.exit(1)
-    retValue = False
-    for instances in result['children']:
-        retValue = True
-    return retValue
-
-
-def find_network_type(self, name):
-    if name == "overlay":
-        return self.find_network("overlay-network")
-    if name == "vlan":
-        return self.find_network("vlan-network")
-    if name == "tap":
-        return self.find_network("wan-network")
-    return None
-
-
-def find_network(self, name):
-    ''' Find networking.network object with name '''
-    params = {'tid': 'networking.network'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        sys.exit(1)
-    for instances in result['children']:
-        if instances['name'] == name:
-            return instances['id']
-    return None
-
-
-def del_network(self, name):
-    ''' Delete network by name '''
-    uuid = self.find_network(name)
-    if not uuid == None:
-        self.del_network_uuid(uuid)
-
-
-def del_network_uuid(self, uuid):
-    ''' Delete network by uuid '''
-    params = {'tid': 'networking.network', 'id': uuid}
-    try:
-        result = self._delete_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        sys.exit(1)
+        return CvbnRpcFailure(err, classify(error), params.get('tid'), error)
 
+    def _get_object(self, tid, uuid):
+        '''get object by id with single RPC, None if object does not exist'''
+        params = {'tid': tid, 'id': uuid}
+        try:
+            result = self._get_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            if is_not_found(error):
+                return None
+            raise self._failure(error, params)
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
+        if not result or result.get('id', uuid) != uuid:
+            return None
+        if self.records:
+            return cvbn_records.make(result)
+        return result
+
+    def _walk(self, tid, filters=None):
+        '''walk tid, return iterator over objects matching filters (see cvbn_walk)'''
+        try:
+            instances = cvbn_walk.walk(self._walk_method, self.agent, self.cid, tid, filters, self._filterSupport,
+                                       lambda error: self._walkFailure(error, tid))
+        except RpcMethodError as error:
+            raise self._failure(error, {'tid': tid})
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
+        if self.records:
+            return cvbn_records.records(instances)
+        return instances
 
-def info_network(self):
-    params = {'tid': 'networking.network'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        sys.exit(1)
-    return json.dumps(result)
-
-
-def addSubnet(self, prefix, cidr, defgw, network, pool_start, pool_end):
-    ''' Create subnet object '''
-    params = {}
-    params['tid'] = 'networking.subnet'
-    params['name'] = prefix
-    params['cidr'] = cidr
-    params['network_id'] = network
-    if pool_start != 'none':
-        params['allocation_pools'] = [{'start': pool_start, 'end': pool_end}]
-    if not defgw == 'none':
-        params['gateway_ip'] = defgw
-    try:
-        result = self._set_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
+    def _walkFailure(self, error, tid):
+        '''exception of error hit while iterating over streamed walk of tid'''
+        if isinstance(error, RpcMethodError):
+            return self._failure(error, {'tid': tid})
+        err = "Invalid walk response of {}: {}".format(tid, error)
         print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    return result['id']
+        return CvbnApiFailure(err)
+
+    def setRecords(self, enabled):
+        ''' Return compact read-only records (cvbn_records) instead of dicts from getters '''
+        self.records = enabled
+
+    def subnetIndex(self, refresh=False):
+        ''' CIDR overlap index of server subnets (cvbn_cidr), built from one walk on first call.
+        From then on addSubnet rejects invalid/overlapping CIDR before any RPC '''
+        index = self._subnetIndex
+        if index == None or refresh:
+            with self._indexLock:
+                if self._subnetIndex == None or refresh:
+                    self._subnetIndex = cvbn_cidr.CidrIndex(self._walk('networking.subnet'))
+                index = self._subnetIndex
+        return index
 
+    def create_network(self, prefix, network_type, interface):
+        ''' Creates networking object. Raises CvbnRpcFailure if the agent fails '''
+        params = {}
+        params['tid'] = 'networking.network'
+        params['name'] = prefix
+        params['network_type'] = network_type
+        params['host_interface'] = interface
+        try:
+            result = self._set_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
 
-def getSubnets(self):
-    """
->>> print server.getSubnets()
-[]
-	"""
-    params = {'tid': 'networking.subnet'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+    def is_networking(self):
+        ''' Check if there is any networking object created '''
+        params = {'tid': 'networking.network'}
+        try:
+            result = self._walk_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
+        retValue = False
+        for instances in result['children']:
+            retValue = True
+        return retValue
+
+    def find_network_type(self, name):
+        if name == "overlay":
+            return self.find_network("overlay-network")
+        if name == "vlan":
+            return self.find_network("vlan-network")
+        if name == "tap":
+            return self.find_network("wan-network")
+        return None
 
-    return result['children']
+    def find_network(self, name):
+        ''' Find networking.network object with name '''
+        params = {'tid': 'networking.network'}
+        try:
+            result = self._walk_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
+        for instances in result['children']:
+            if instances['name'] == name:
+                return instances['id']
+        return None
 
+    def del_network(self, name):
+        ''' Delete network by name '''
+        uuid = self.find_network(name)
+        if not uuid == None:
+            self.del_network_uuid(uuid)
 
-def getSubnetId(self, subnetId):
-    params = {'tid': 'networking.subnet'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+    def del_network_uuid(self, uuid):
+        ''' Delete network by uuid '''
+        params = {'tid': 'networking.network', 'id': uuid}
+        try:
+            result = self._delete_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
 
-    for instances in result['children']:
-        if instances['id'] == subnetId:
-            return instances
+    def info_network(self):
+        params = {'tid': 'networking.network'}
+        try:
+            result = self._walk_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
+        return json.dumps(result)
+
+    def addSubnet(self, prefix, cidr, defgw, network, pool_start, pool_end):
+        ''' Create subnet object '''
+        index = self._subnetIndex
+        if index != None:
+            reason = index.claim(cidr)
+            if reason != None:
+                err = '{}\n{}'.format(sys.argv, reason)
+                print >> sys.stderr, err
+                raise CvbnApiFailure(err)
+
+        subnetId = None
+        try:
+            subnetId = self._addSubnet(prefix, cidr, defgw, network, pool_start, pool_end)
+        finally:
+            if index != None:
+                index.release(cidr, subnetId)
+        return subnetId
+
+    def _addSubnet(self, prefix, cidr, defgw, network, pool_start, pool_end):
+        ''' set RPC of addSubnet '''
+        params = {}
+        params['tid'] = 'networking.subnet'
+        params['name'] = prefix
+        params['cidr'] = cidr
+        params['network_id'] = network
+        if pool_start != 'none':
+            params['allocation_pools'] = [{'start': pool_start, 'end': pool_end}]
+        if not defgw == 'none':
+            params['gateway_ip'] = defgw
+        try:
+            result = self._set_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
+        return result['id']
+
+    def getSubnets(self):
+        """
+        >>> print server.getSubnets()
+        []
+        """
+        return list(self._walk('networking.subnet'))
 
-    return None
+    def iterSubnets(self):
+        """ Generator variant of getSubnets, yields subnets one at a time
 
+        >>> print [subnet['cidr'] for subnet in server.iterSubnets()]
+        []
+        """
+        for instances in self._walk('networking.subnet'):
+            yield instances
 
-def getSubnetName(self, subnetName):
-    params = {'tid': 'networking.subnet'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+    def getSubnetId(self, subnetId):
+        return self._get_object('networking.subnet', subnetId)
 
-    for instances in result['children']:
-        if instances['name'] == subnetName:
+    def getSubnetName(self, subnetName):
+        for instances in self._walk('networking.subnet', {'name': subnetName}):
             return instances
 
-    return None
-
-
-def get_network_subnet(self, uuid):
-    ''' Get first subnet for network 'uuid' '''
-    params = {'tid': 'networking.network', 'id': uuid}
-    try:
-        result = self._get_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        sys.exit(1)
-    return result['subnets'][0]
-
-
-def del_subnet(self, name):
-    ''' Delete subnet by name '''
-    uuid = self.find_subnet(name)
-    if not uuid == None:
-        self.del_subnet_uuid(uuid)
-
-
-def deleteSubnet(self, subnetId):
-    if self.getSubnetId(subnetId) == None:
-        return False
-
-    params = {'tid': 'networking.subnet', 'id': subnetId}
-    try:
-        result = self._delete_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        return None
 
-    return True
+    def get_network_subnet(self, uuid):
+        ''' Get first subnet for network 'uuid' '''
+        params = {'tid': 'networking.network', 'id': uuid}
+        try:
+            result = self._get_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
+        return result['subnets'][0]
+
+    def del_subnet(self, name):
+        ''' Delete subnet by name '''
+        uuid = self.find_subnet(name)
+        if not uuid == None:
+            self.del_subnet_uuid(uuid)
+
+    def deleteSubnet(self, subnetId):
+        if self.getSubnetId(subnetId) == None:
+            return False
+
+        params = {'tid': 'networking.subnet', 'id': subnetId}
+        try:
+            result = self._delete_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
 
+        if self._subnetIndex != None:
+            self._subnetIndex.remove(subnetId)
+        return True
 
-def enableNat(self, natInterface, subnetId):
-    """.. function:: enableNat(natInterface, natSubnet)
+    def enableNat(self, natInterface, subnetId):
+        """.. function:: enableNat(natInterface, natSubnet)
 
-	Enable NAT on the server
+        Enable NAT on the server
 
         :param natInterface: interface where NAT should be enabled
         :type natInterface: string
-	:param subnetId: subnet id
-	:type subnetId: string
+        :param subnetId: subnet id
+        :type subnetId: string
         :returns: NAT id if enabled, None otherwise
         :raises: CvbnApiFailure
 
-	>>> TODO
+        >>> TODO
 
         """
 
-    if not (self.getNat() == None):
-        return None
+        if not (self.getNat() == None):
+            return None
 
-    if self.getSubnetId(subnetId) == None:
-        return None
+        if self.getSubnetId(subnetId) == None:
+            return None
 
-    params = {}
-    params['tid'] = 'host.nat'
-    params['out_interface'] = natInterface
-    params['subnet_id'] = subnetId
-    try:
-        result = self._set_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    return None
-
-
-def getNat(self):
-    """
-	>>> print server.getNat()
-	None
-	"""
-    params = {'tid': 'host.nat'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    for instances in result['children']:
-        return instances
+        params = {}
+        params['tid'] = 'host.nat'
+        params['out_interface'] = natInterface
+        params['subnet_id'] = subnetId
+        try:
+            result = self._set_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
 
-    return None
+        return None
 
+    def getNat(self):
+        """
+        >>> print server.getNat()
+        None
+        """
+        for instances in self._walk('host.nat'):
+            return instances
 
-def disableNat(self):
-    natInfo = self.getNat()
-    if natInfo == None:
-        return False
+        return None
 
-    params = {'tid': 'host.nat', 'id': natInfo['id']}
-    try:
-        result = self._delete_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-        err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+    def disableNat(self):
+        natInfo = self.getNat()
+        if natInfo == None:
+            return False
 
-    return True
+        params = {'tid': 'host.nat', 'id': natInfo['id']}
+        try:
+            result = self._delete_method.invoke(self.agent, self.cid, params)
+        except RpcMethodError as error:
+            raise self._failure(error, params)
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
+
+        return True
@@ -0,0 +1,401 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_sidecar
+    :synopsis: Local sidecar daemon serving CVBN RPC and RCS REST calls over Unix socket
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing optional long-running local daemon ('Sidecar') that holds warm RPC
+factories (autodiscovery done once per server), HTTP sessions and a short-lived cache of
+read results, and the client side objects routing 'vbn', 'vswitch' and 'rcs' through it:
+
+* 'SidecarFactory' - RPC method factory for *factory* argument of 'vbn'/'vswitch',
+* 'SidecarHttp' - HTTP layer for *http* argument of 'rcs'.
+
+Protocol is line-delimited JSON over Unix stream socket, one request and one response
+line at a time per connection. Successful reads (RPC walk/get, HTTP GET with 2xx
+status) are answered from the cache for *ttl* seconds and identical concurrent reads
+share one request to the server (cvbn_singleflight); any write (RPC set/delete, HTTP POST/PUT/DELETE) goes straight
+through and drops cached reads of that server. RPC errors are returned to the client
+and raised there as RpcMethodError with the original message, so the clients and
+cvbn_transport.classify handle them as before.
+
+>>> # long-running: python cvbn_sidecar.py /var/run/cvbn.sock
+>>> import cvbn_sidecar, cvbn_vswitch, rcs_module
+>>> vswitch = cvbn_vswitch.vswitch("localhost", "none", factory = cvbn_sidecar.SidecarFactory("/var/run/cvbn.sock", "localhost"))
+>>> _rcs = rcs_module.rcs(rcs_def, http = cvbn_sidecar.SidecarHttp("/var/run/cvbn.sock"))
+
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from cvbx_rpc_tools.method import RpcMethodFactory, RpcMethodError
+from cvbn_transport import READ_METHODS
+import cvbn_singleflight
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+class SidecarFailure(IOError):
+    """Exception raised when the sidecar can not be reached or breaks the protocol
+    """
+    pass
+
+def _line(message):
+    return (json.dumps(message, separators = (',', ':')) + '\n').encode('utf-8')
+
+class _Cache(object):
+    '''encoded responses of reads per endpoint, valid for ttl seconds; expired entries
+    are removed on get and on put to their endpoint'''
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, endpoint, key):
+        with self._lock:
+            entries = self._entries.get(endpoint, {})
+            entry = entries.get(key)
+            if entry == None:
+                return None
+            if time.time() - entry[0] < self.ttl:
+                return entry[1]
+            del entries[key]
+            if not entries:
+                del self._entries[endpoint]
+        return None
+
+    def put(self, endpoint, key, line):
+        now = time.time()
+        with self._lock:
+            entries = self._entries.setdefault(endpoint, {})
+            for stale in [k for k, entry in entries.items() if now - entry[0] >= self.ttl]:
+                del entries[stale]
+            entries[key] = (now, line)
+
+    def drop(self, endpoint):
+        with self._lock:
+            self._entries.pop(endpoint, None)
+
+class Sidecar(object):
+    """Sidecar daemon
+
+    :param path: path of the Unix socket
+    :param ttl: seconds read results are served from the cache. Default 2
+    :param factory: optional callable server -> RPC method factory. Default autodiscovery
+        (cvbn_server.vbn._determine_rpc_port) and RpcMethodFactory
+    :param http: optional HTTP layer with *requests* interface. Default one requests.Session
+        (keep-alive connections)
+    """
+    def __init__(self, path, ttl = 2.0, factory = None, http = None):
+        self.path = path
+        self._connectFactory = factory or self._discover
+        self._http = http
+        self._lock = threading.Lock()
+        self._factories = {}
+        self._cache = _Cache(ttl)
+        self._group = cvbn_singleflight.SingleFlight(copyResults = False)
+        self.stats = {'requests': 0, 'cached': 0, 'errors': 0}
+        self._server = None
+
+    @staticmethod
+    def _discover(server):
+        import cvbn_server
+        port = cvbn_server.vbn._determine_rpc_port(server)
+        return RpcMethodFactory.factory('{}:{}'.format(server, str(port)))
+
+    def _factory(self, server):
+        with self._lock:
+            factory = self._factories.get(server)
+            if factory == None:
+                factory = self._factories[server] = self._connectFactory(server)
+            return factory
+
+    def _httpLayer(self):
+        with self._lock:
+            if self._http == None:
+                import requests
+                self._http = requests.Session()
+            return self._http
+
+    def _count(self, field):
+        with self._lock:
+            self.stats[field] = self.stats[field] + 1
+
+    def _rpc(self, request):
+        server = request['server']
+        method = request['method']
+        call = lambda: self._factory(server).method(method).invoke(request['agent'], request['cid'], request['params'])
+        if method not in READ_METHODS:
+            self._cache.drop(server)
+            self._group.forget(server)
+            try:
+                return _line({'result': call()})
+            finally:
+                self._cache.drop(server)
+        return self._read(server, (request['agent'], request['cid'], method,
+                                   json.dumps(request['params'], sort_keys = True)), lambda: (_line({'result': call()}), True))
+
+    def _httpRequest(self, request):
+        method = request['method']
+        url = request['url']
+        kwargs = request.get('kwargs', {})
+        endpoint = urlparse(url).netloc
+
+        def call():
+            response = getattr(self._httpLayer(), method)(url, **kwargs)
+            line = _line({'status': response.status_code, 'headers': dict(response.headers), 'body': response.text})
+            return (line, 200 <= response.status_code < 300)
+
+        if method != 'get':
+            self._cache.drop(endpoint)
+            self._group.forget(endpoint)
+            try:
+                return call()[0]
+            finally:
+                self._cache.drop(endpoint)
+        return self._read(endpoint, (url, json.dumps(kwargs, sort_keys = True)), call)
+
+    def _read(self, endpoint, key, call):
+        '''call returns (line, cacheable); only successful reads are cached, RPC errors
+        raise and HTTP responses other than 2xx are passed through'''
+        line = self._cache.get(endpoint, key)
+        if line != None:
+            self._count('cached')
+            return line
+
+        def fetch():
+            line, cacheable = call()
+            if cacheable:
+                self._cache.put(endpoint, key, line)
+            return line
+        return self._group.do(endpoint, key, fetch)
+
+    def handle(self, request):
+        """Return encoded response line of decoded *request*
+        """
+        self._count('requests')
+        op = request.get('op')
+        try:
+            if op == 'rpc':
+                return self._rpc(request)
+            if op == 'http':
+                return self._httpRequest(request)
+            if op == 'ping':
+                return _line({'result': 'pong'})
+            if op == 'stats':
+                with self._lock:
+                    return _line({'result': dict(self.stats)})
+            return _line({'error': "unknown op {}".format(op), 'type': 'protocol'})
+        except RpcMethodError as error:
+            self._count('errors')
+            return _line({'error': str(error), 'type': 'rpc'})
+        except Exception as error:
+            self._count('errors')
+            return _line({'error': str(error), 'type': 'io'})
+
+    def serve(self, background = False):
+        """.. function:: serve(background = False)
+
+        Listen on the Unix socket (replacing stale socket file) and serve clients, each
+        connection in own thread
+
+        :returns: the background thread if *background* is True, otherwise runs until *shutdown*
+
+        """
+        sidecar = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        request = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        self.wfile.write(_line({'error': 'invalid request', 'type': 'protocol'}))
+                        return
+                    self.wfile.write(sidecar.handle(request))
+                    self.wfile.flush()
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = Server(self.path, Handler)
+        if not background:
+            self._server.serve_forever()
+            return None
+        thread = threading.Thread(target = self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        if self._server != None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+class SidecarConnection(object):
+    """Client connection(s) to the sidecar, one persistent socket per thread
+
+    :param path: path of the sidecar Unix socket
+    :param timeout: socket timeout in seconds, None for none. Default None
+    """
+    def __init__(self, path, timeout = None):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except socket.error as error:
+            sock.close()
+            raise SidecarFailure("sidecar {} not reachable: {}".format(self.path, error))
+        self._local.sock = sock
+        self._local.rfile = sock.makefile('rb')
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock != None:
+            self._local.rfile.close()
+            sock.close()
+        self._local.sock = None
+
+    def call(self, request):
+        """Send *request* dict, return decoded response dict
+        """
+        line = _line(request)
+        for attempt in (0, 1):
+            sock = getattr(self._local, 'sock', None) or self._connect()
+            try:
+                sock.sendall(line)
+                response = self._local.rfile.readline()
+            except socket.error as error:
+                self._close()
+                raise SidecarFailure("sidecar {} failed: {}".format(self.path, error))
+            if response:
+                return json.loads(response.decode('utf-8'))
+            # sidecar closed idle connection (e.g. restarted), reconnect once
+            self._close()
+        raise SidecarFailure("sidecar {} closed connection".format(self.path))
+
+class SidecarMethod(object):
+    """RPC method object sending requests through the sidecar
+    """
+    def __init__(self, connection, server, name):
+        self.connection = connection
+        self.server = server
+        self.name = name
+
+    def invoke(self, agent, cid, params):
+        response = self.connection.call({'op': 'rpc', 'server': self.server, 'method': self.name,
+                                         'agent': agent, 'cid': cid, 'params': params})
+        if 'error' in response:
+            if response.get('type') == 'rpc':
+                raise RpcMethodError(response['error'])
+            raise SidecarFailure(response['error'])
+        return response['result']
+
+class SidecarFactory(object):
+    """RPC method factory for *factory* argument of 'vbn'/'vswitch' routing through the sidecar
+
+    :param path: path of the sidecar Unix socket (or SidecarConnection)
+    :param server: FQDN/IP of the server CvBB/CvBN the sidecar talks to
+    """
+    def __init__(self, path, server):
+        if isinstance(path, SidecarConnection):
+            self.connection = path
+        else:
+            self.connection = SidecarConnection(path)
+        self.server = server
+
+    def method(self, name):
+        return SidecarMethod(self.connection, self.server, name)
+
+class SidecarResponse(object):
+    """Response with the subset of *requests* Response interface used by 'rcs'
+    """
+    def __init__(self, status_code, headers, text):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    @property
+    def content(self):
+        return self.text.encode('utf-8')
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size = 1, decode_unicode = False):
+        # the whole body already came in one response line
+        data = self.text if decode_unicode else self.content
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+
+    def close(self):
+        pass
+
+class SidecarHttp(object):
+    """HTTP layer for *http* argument of 'rcs' routing through the sidecar
+
+    :param path: path of the sidecar Unix socket (or SidecarConnection)
+    """
+    def __init__(self, path):
+        if isinstance(path, SidecarConnection):
+            self.connection = path
+        else:
+            self.connection = SidecarConnection(path)
+
+    def request(self, method, url, *args, **kwargs):
+        if args:
+            # positional data, e.g. post(url, data)
+            kwargs['data'] = args[0]
+        response = self.connection.call({'op': 'http', 'method': method, 'url': url, 'kwargs': kwargs})
+        if 'error' in response:
+            raise SidecarFailure(response['error'])
+        return SidecarResponse(response['status'], response['headers'], response['body'])
+
+    def get(self, url, *args, **kwargs):
+        return self.request('get', url, *args, **kwargs)
+
+    def post(self, url, *args, **kwargs):
+        return self.request('post', url, *args, **kwargs)
+
+    def put(self, url, *args, **kwargs):
+        return self.request('put', url, *args, **kwargs)
+
+    def delete(self, url, *args, **kwargs):
+        return self.request('delete', url, *args, **kwargs)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.stderr.write("usage: cvbn_sidecar.py SOCKET [TTL]\n")
+        sys.exit(1)
+    Sidecar(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 2.0).serve()
@@ -0,0 +1,137 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_singleflight
+    :synopsis: Coalescing of identical concurrent CVBN read requests
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing in-flight request coalescing ("singleflight") for 'vbn' and
+'vswitch' classes. Concurrent identical reads (same server, agent, method and
+parameters) share one RPC and all callers receive its result. Writes (set, delete)
+bypass the group and invalidate reads in flight on the same server, so a read
+started after the write never joins a request issued before it.
+
+The group is shared by all clients coalesced with the default group, so threads
+holding their own client objects still share RPCs.
+
+>>> import cvbn_singleflight, cvbn_vswitch
+>>> vswitch = cvbn_singleflight.coalesce(cvbn_vswitch.vswitch("localhost","none"))
+
+"""
+
+import copy
+import json
+import sys
+import threading
+from cvbn_transport import MethodWrapper, WRITE_METHODS, wrap_client
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared = 0
+
+class SingleFlight(object):
+    """Group of in-flight read requests
+
+    :param copyResults: give each coalesced caller its own copy of the result. Default True
+    """
+    def __init__(self, copyResults = True):
+        self.copyResults = copyResults
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._generation = {}
+        self.stats = {'calls': 0, 'coalesced': 0, 'invalidations': 0}
+
+    def do(self, endpoint, key, fn):
+        """.. function:: do(endpoint, key, fn)
+
+        Execute *fn* unless identical call for *key* is already in flight, in which case
+        wait for it and return its result (or raise its exception)
+
+        """
+        with self._lock:
+            key = (self._generation.get(endpoint, 0), key)
+            call = self._calls.get(key)
+            leader = call == None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats['calls'] += 1
+            else:
+                call.shared += 1
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error != None:
+                raise call.error
+            if self.copyResults:
+                return copy.deepcopy(call.result)
+            return call.result
+
+        result = None
+        try:
+            call.result = fn()
+        except BaseException:
+            call.error = sys.exc_info()[1]
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                shared = call.shared
+            try:
+                result = call.result
+                if self.copyResults and shared and call.error == None:
+                    # own copy of the leader, made before followers wake up and copy theirs
+                    result = copy.deepcopy(call.result)
+            finally:
+                call.event.set()
+        return result
+
+    def forget(self, endpoint):
+        """Invalidate in-flight reads of *endpoint*; new reads will not join them
+        """
+        with self._lock:
+            self._generation[endpoint] = self._generation.get(endpoint, 0) + 1
+            self.stats['invalidations'] += 1
+
+default_group = SingleFlight()
+
+class CoalescingMethod(MethodWrapper):
+    """RPC method wrapper coalescing identical concurrent reads
+    """
+    def __init__(self, name, method, group, endpoint):
+        MethodWrapper.__init__(self, name, method)
+        self.group = group
+        self.endpoint = endpoint
+
+    def invoke(self, agent, cid, params):
+        if self.name in WRITE_METHODS:
+            self.group.forget(self.endpoint)
+            try:
+                return self.method.invoke(agent, cid, params)
+            finally:
+                self.group.forget(self.endpoint)
+
+        key = (agent, cid, self.name, json.dumps(params, sort_keys = True))
+        return self.group.do(self.endpoint, key, lambda: self.method.invoke(agent, cid, params))
+
+def coalesce(client, group = None):
+    """.. function:: coalesce(client, group = None)
+
+    Route reads of 'vbn'/'vswitch' client through singleflight group
+
+    :param client: 'vbn' or 'vswitch' instance
+    :param group: SingleFlight object. Default module-wide *default_group*
+    :returns: client
+
+    """
+    if group == None:
+        group = default_group
+    endpoint = getattr(client, 'server', None)
+    return wrap_client(client, rpc_wrapper = lambda name, method: CoalescingMethod(name, method, group, endpoint))
@@ -0,0 +1,434 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_snapshot
+    :synopsis: Cross-process snapshot store of walks in memory-mapped file
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'SnapshotStore' class sharing snapshots of walks - objects of one
+*tid* in one *scope* (switch, server, RCS instance) of one *source* (same keys as
+cvbn_inventory) - between processes of one box through a memory-mapped file. One
+process refreshes the snapshots ('SnapshotPublisher'), the others map the same file
+read-only and read them without any RPC.
+
+File layout (little endian)::
+
+    header   64 B   magic, format, number of slots, data start, size, tail, generation,
+                    last version
+    slots    64 B   seq, encoding, offset, length, version, updated, sha1 of the key
+    data            append-only area of encoded snapshots (compact JSON, zlib if large)
+
+A snapshot is written to the free end of the data area before its slot is switched to
+it, so bytes a reader is looking at are never overwritten, except by compaction when
+the area is full. Slots are updated under a sequence lock (odd *seq* while writing) and
+compaction runs under odd *generation*; readers retry when either changed while they
+read, and raise IOError after *READ_TIMEOUT* seconds if a writer died in the middle
+(the next writer repairs the file). Readers keep decoded snapshots and decode again
+only when the slot *version* (unique in the store) changed, so polling an unchanged
+snapshot costs one slot read. Writers are serialized by flock of the file. Slots of
+removed snapshots are reused by new ones.
+
+>>> import cvbn_snapshot
+>>> store = cvbn_snapshot.SnapshotStore("/dev/shm/cvbn.snap", writable = True)
+>>> publisher = cvbn_snapshot.SnapshotPublisher(store)
+>>> publisher.addVswitch(vswitch)
+>>> publisher.revalidate()
+>>> # any worker process
+>>> shared = cvbn_snapshot.SnapshotStore("/dev/shm/cvbn.snap")
+>>> print shared.get('vswitch:localhost', 'ea2db47c-1cbe-4846-9ba6-141c3ac59508', 'networking.subnet')
+[{u'cidr': u'192.168.30.0/24', u'id': u'e67d8e96-f887-4217-9ca6-ccb52d101d92', ...}]
+
+"""
+
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from cvbn_inventory import VSWITCH_TIDS, VBN_TIDS, RCS_DEVICE, RCS_USER, _plain, _sync_switches
+
+MAGIC = b'CVBNSNAP'
+FORMAT = 1
+
+_HEADER = struct.Struct('<8sIIQQQQ')
+HEADER_SIZE = 64
+_SLOT = struct.Struct('<IBxxxQIQd20s')
+SLOT_SIZE = 64
+_SEQ = struct.Struct('<I')
+_GENERATION_OFFSET = 40
+_VERSION_OFFSET = 48
+
+JSON = 0
+ZLIB = 1
+DELETED = 255
+COMPRESS_ABOVE = 4096
+
+# seconds a reader waits for a writer to finish a slot or compaction
+READ_TIMEOUT = 1.0
+
+def _digest(source, scope, tid):
+    return hashlib.sha1(json.dumps([source, scope, tid]).encode('utf-8')).digest()
+
+def encode(objects):
+    """Return (encoding, bytes) of list of *objects* in compact layout
+    """
+    data = json.dumps([_plain(obj) for obj in objects], separators = (',', ':')).encode('utf-8')
+    if len(data) > COMPRESS_ABOVE:
+        return (ZLIB, zlib.compress(data, 1))
+    return (JSON, data)
+
+def decode(encoding, data):
+    if encoding == ZLIB:
+        data = zlib.decompress(data)
+    return json.loads(data.decode('utf-8'))
+
+class SnapshotStore(object):
+    """Snapshot store in memory-mapped *path*
+
+    :param path: file path, preferably on tmpfs (/dev/shm)
+    :param writable: open for writing (creating the file if needed). Default False
+    :param size: file size in bytes when created. Default 64 MB
+    :param slots: max. number of snapshots when created. Default 4096
+    :raises: IOError if the file does not exist (read-only) or is not a snapshot store
+    """
+    def __init__(self, path, writable = False, size = 64 << 20, slots = 4096):
+        self.path = path
+        self.writable = writable
+        self._lock = threading.Lock()
+        self._cache = {}
+        if writable:
+            self._file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._file.fileno()).st_size == 0:
+                    self._create(size, slots)
+                self._map = mmap.mmap(self._file.fileno(), 0)
+                self._readHeader()
+                self._repair()
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+        else:
+            self._file = open(path, 'rb')
+            self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+            self._readHeader()
+
+    def _readHeader(self):
+        if len(self._map) < HEADER_SIZE:
+            raise IOError("{} is not a snapshot store".format(self.path))
+        magic, fmt, self.slots, self._dataStart, self.size, tail, generation = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or fmt != FORMAT:
+            raise IOError("{} is not a snapshot store".format(self.path))
+
+    def _create(self, size, slots):
+        dataStart = HEADER_SIZE + slots * SLOT_SIZE
+        if size <= dataStart:
+            raise ValueError("size {} too small for {} slots".format(size, slots))
+        self._file.truncate(size)
+        header = _HEADER.pack(MAGIC, FORMAT, slots, dataStart, size, dataStart, 0)
+        self._file.seek(0)
+        self._file.write(header)
+        self._file.flush()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _header(self):
+        return _HEADER.unpack_from(self._map, 0)
+
+    def _generation(self):
+        return struct.unpack_from('<Q', self._map, _GENERATION_OFFSET)[0]
+
+    def _wait(self, deadline, what):
+        '''deadline of a reader retry loop, IOError once it passed'''
+        now = time.time()
+        if deadline == None:
+            return now + READ_TIMEOUT
+        if now > deadline:
+            raise IOError("snapshot store {}: {} not finished in {}s".format(self.path, what, READ_TIMEOUT))
+        time.sleep(0)
+        return deadline
+
+    def _readSlot(self, index):
+        '''consistent copy of slot *index* (retried while the writer changes it)'''
+        offset = HEADER_SIZE + index * SLOT_SIZE
+        deadline = None
+        while True:
+            slot = _SLOT.unpack_from(self._map, offset)
+            if slot[0] & 1 == 0 and _SEQ.unpack_from(self._map, offset)[0] == slot[0]:
+                return slot
+            deadline = self._wait(deadline, "write of slot {}".format(index))
+
+    def _repair(self):
+        '''finish writes of a writer that died in the middle (under flock). Compaction moves
+        data down in offset order, so an interrupted one leaves every slot valid'''
+        generation = self._generation()
+        if generation & 1:
+            struct.pack_into('<Q', self._map, _GENERATION_OFFSET, generation + 1)
+        for index in range(self.slots):
+            position = HEADER_SIZE + index * SLOT_SIZE
+            seq = _SEQ.unpack_from(self._map, position)[0]
+            if seq & 1:
+                _SEQ.pack_into(self._map, position, seq + 1)
+
+    def _find(self, digest):
+        '''return (index of slot with *digest* or None, index of first free slot - removed
+        or never used - or None)'''
+        start = struct.unpack('<I', digest[:4])[0] % self.slots
+        free = None
+        for probe in range(self.slots):
+            index = (start + probe) % self.slots
+            slot = self._readSlot(index)
+            if slot[4] == 0:
+                # never used, end of the probe sequence
+                return (None, index if free == None else free)
+            if slot[6] == digest:
+                return (index, None)
+            if slot[1] == DELETED and free == None:
+                # removed snapshot (tombstone): reusable, but the probe goes on
+                free = index
+        return (None, free)
+
+    def _lookup(self, source, scope, tid):
+        digest = _digest(source, scope, tid)
+        index = self._find(digest)[0]
+        if index == None:
+            return (None, None)
+        return (index, self._readSlot(index))
+
+    def version(self, source, scope, tid):
+        """Return version of snapshot (increasing with every write), None if there is none
+        """
+        index, slot = self._lookup(source, scope, tid)
+        if slot == None or slot[1] == DELETED:
+            return None
+        return slot[4]
+
+    def updated(self, source, scope, tid):
+        """Return time of the last write of snapshot, None if there is none
+        """
+        index, slot = self._lookup(source, scope, tid)
+        if slot == None or slot[1] == DELETED:
+            return None
+        return slot[5]
+
+    def raw(self, source, scope, tid):
+        """.. function:: raw(source, scope, tid)
+
+        Return tuple (version, encoding, bytes) of snapshot, None if there is none
+
+        """
+        digest = _digest(source, scope, tid)
+        deadline = None
+        while True:
+            generation = self._generation()
+            if generation & 1:
+                deadline = self._wait(deadline, "compaction")
+                continue
+            index = self._find(digest)[0]
+            if index == None:
+                return None
+            seq, encoding, offset, length, version, updated, key = self._readSlot(index)
+            if encoding == DELETED:
+                return None
+            data = self._map[offset:offset + length]
+            if self._generation() == generation:
+                return (version, encoding, data)
+            deadline = self._wait(deadline, "compaction")
+
+    def get(self, source, scope, tid):
+        """.. function:: get(source, scope, tid)
+
+        Return list of objects of snapshot, None if there is none. Decoded snapshots are
+        kept per process and decoded again only when a newer version was written
+
+        """
+        key = (source, scope, tid)
+        version = self.version(source, scope, tid)
+        if version == None:
+            return None
+        cached = self._cache.get(key)
+        if cached != None and cached[0] == version:
+            return cached[1]
+        snapshot = self.raw(source, scope, tid)
+        if snapshot == None:
+            return None
+        objects = decode(snapshot[1], snapshot[2])
+        self._cache[key] = (snapshot[0], objects)
+        return objects
+
+    def _writeSlot(self, index, encoding, offset, length, version, updated, digest):
+        position = HEADER_SIZE + index * SLOT_SIZE
+        seq = _SEQ.unpack_from(self._map, position)[0]
+        # odd seq left by a dead writer is rounded up
+        seq = seq + (seq & 1)
+        _SEQ.pack_into(self._map, position, seq + 1)
+        _SLOT.pack_into(self._map, position, seq + 1, encoding, offset, length, version, updated, digest)
+        _SEQ.pack_into(self._map, position, seq + 2)
+
+    def _compact(self):
+        '''move live snapshots to the start of the data area; readers retry meanwhile'''
+        generation = self._generation()
+        struct.pack_into('<Q', self._map, _GENERATION_OFFSET, generation + 1)
+        live = []
+        for index in range(self.slots):
+            slot = self._readSlot(index)
+            if slot[4] != 0 and slot[1] != DELETED:
+                live.append((slot[2], index, slot))
+        tail = self._dataStart
+        # sorted by offset, so moving data down never overwrites data not moved yet
+        for offset, index, slot in sorted(live):
+            seq, encoding, offset, length, version, updated, digest = slot
+            self._map[tail:tail + length] = self._map[offset:offset + length]
+            self._writeSlot(index, encoding, tail, length, version, updated, digest)
+            tail = tail + length
+        struct.pack_into('<Q', self._map, _HEADER.size - 16, tail)
+        struct.pack_into('<Q', self._map, _GENERATION_OFFSET, generation + 2)
+        return tail
+
+    def _write(self, digest, encoding, data):
+        if not self.writable:
+            raise IOError("snapshot store {} is read-only".format(self.path))
+        with self._lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                if self._generation() & 1:
+                    self._repair()
+                index, free = self._find(digest)
+                if index == None:
+                    if encoding == DELETED:
+                        return None
+                    if free == None:
+                        raise ValueError("snapshot store {} has no free slot".format(self.path))
+                    index = free
+                # versions are unique in the store, so a reused slot never repeats one
+                version = max(self._readSlot(index)[4], struct.unpack_from('<Q', self._map, _VERSION_OFFSET)[0])
+                struct.pack_into('<Q', self._map, _VERSION_OFFSET, version + 1)
+                tail = self._header()[5]
+                if encoding != DELETED and tail + len(data) > self.size:
+                    tail = self._compact()
+                    if tail + len(data) > self.size:
+                        raise ValueError("snapshot store {} is full".format(self.path))
+                self._map[tail:tail + len(data)] = data
+                struct.pack_into('<Q', self._map, _HEADER.size - 16, tail + len(data))
+                self._writeSlot(index, encoding, tail, len(data), version + 1, time.time(), digest)
+                return version + 1
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def put(self, source, scope, tid, objects):
+        """.. function:: put(source, scope, tid, objects)
+
+        Write snapshot of *objects* (dicts or cvbn_records records)
+
+        :returns: new version of the snapshot
+        :raises: IOError (read-only store), ValueError (store full)
+
+        """
+        encoding, data = encode(objects)
+        return self._write(_digest(source, scope, tid), encoding, data)
+
+    def forget(self, source, scope, tid):
+        """Remove snapshot; its slot is kept as removed (with new version, so readers notice
+        the change) until reused by another snapshot
+        """
+        if self.version(source, scope, tid) != None:
+            self._write(_digest(source, scope, tid), DELETED, b'')
+
+    def stats(self):
+        header = self._header()
+        slots = [self._readSlot(index) for index in range(self.slots)]
+        return {'slots': self.slots,
+                'used': sum(1 for slot in slots if slot[4] != 0 and slot[1] != DELETED),
+                'removed': sum(1 for slot in slots if slot[1] == DELETED),
+                'size': self.size, 'data': header[5] - self._dataStart, 'generation': header[6]}
+
+class SnapshotPublisher(object):
+    """Refresher of snapshots of registered clients, run by one process
+
+    :param store: writable SnapshotStore
+    :param maxAge: seconds after which a snapshot is refreshed. Default 300
+    """
+    def __init__(self, store, maxAge = 300):
+        self.store = store
+        self.maxAge = maxAge
+        self._jobs = []
+        self._thread = None
+
+    def isStale(self, source, scope, tid):
+        updated = self.store.updated(source, scope, tid)
+        return updated == None or time.time() - updated > self.maxAge
+
+    def _put(self, force, source, scope, tid, walk):
+        if force or self.isStale(source, scope, tid):
+            self.store.put(source, scope, tid, walk())
+
+    def addVswitch(self, client, uuids = None, tids = VSWITCH_TIDS):
+        """Register 'vswitch' client; snapshots of *tids* of running switches *uuids* (all if
+        None) and of the switch list (*compute.vswitch* in scope of the agent) are published.
+        Snapshots of a stopped switch are kept as they are, those of a deleted switch are
+        removed
+        """
+        source = 'vswitch:' + client.server
+        def job(force):
+            switches = list(client.iterSwitches())
+            current = set(switch['id'] for switch in switches)
+            published = self.store.get(source, client.agent, 'compute.vswitch') or []
+            vanished = [switch['id'] for switch in published if switch['id'] not in current]
+            for uuid in vanished:
+                for tid in tids:
+                    self.store.forget(source, uuid, tid)
+            self._put(force or vanished or len(published) != len(current), source, client.agent,
+                      'compute.vswitch', lambda: switches)
+            return _sync_switches(client, switches, uuids, tids,
+                                  lambda uuid, tid: force or self.isStale(source, uuid, tid),
+                                  lambda uuid, tid, objects: self.store.put(source, uuid, tid, objects))
+        self._jobs.append(job)
+
+    def addVbn(self, client, tids = VBN_TIDS):
+        """Register 'vbn' client; snapshots of *tids* are published
+        """
+        source = 'vbn:' + client.server
+        def job(force):
+            for tid in tids:
+                self._put(force, source, client.agent, tid, lambda: client._walk(tid))
+        self._jobs.append(job)
+
+    def addRcs(self, client):
+        """Register 'rcs' client; snapshots of admin devices and users are published
+        """
+        source = 'rcs:' + client.server
+        def job(force):
+            self._put(force, source, client.url, RCS_DEVICE, client.iterAdminDevices)
+            self._put(force, source, client.url, RCS_USER, client.iterAdminUsers)
+        self._jobs.append(job)
+
+    def sync(self, force = False):
+        """Refresh stale (all if *force*) snapshots, return list of exceptions of failed clients
+        """
+        failures = []
+        for job in list(self._jobs):
+            try:
+                failures.extend(job(force) or [])
+            except Exception as error:
+                failures.append(error)
+        return failures
+
+    def revalidate(self, background = True):
+        """Refresh stale snapshots, in background thread if requested (the thread is returned)
+        """
+        if not background:
+            self.sync()
+            return None
+        if self._thread != None and self._thread.is_alive():
+            return self._thread
+        self._thread = threading.Thread(target = self.sync)
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
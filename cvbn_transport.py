@@ -0,0 +1,187 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_transport
+    :synopsis: Transport wrapper helpers for CVBN and RCS control classes
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module with the building blocks used to stack wrappers on top of the transport
+of 'vbn' (cvbn_server), 'vswitch' (cvbn_vswitch) and 'rcs' (rcs_module) classes.
+
+RPC based classes talk through method objects (*_walk_method*, *_get_method*,
+*_set_method*, *_delete_method*) exposing *invoke(agent, cid, params)*.
+The 'rcs' class talks through *_http* object exposing *requests* interface
+(*get*, *post*, *put*, *delete*).
+
+"""
+
+import threading
+
+RPC_METHODS = ('walk', 'get', 'set', 'delete')
+READ_METHODS = ('walk', 'get')
+WRITE_METHODS = ('set', 'delete')
+HTTP_METHODS = ('get', 'post', 'put', 'delete')
+
+class MethodWrapper(object):
+    """Base class of RPC method wrappers. Calls are passed to wrapped method
+    """
+    def __init__(self, name, method):
+        self.name = name
+        self.method = method
+
+    def invoke(self, agent, cid, params):
+        return self.method.invoke(agent, cid, params)
+
+class HttpWrapper(object):
+    """Base class of HTTP layer wrappers. All calls are funneled through *request*
+    """
+    def __init__(self, http):
+        self.http = http
+
+    def request(self, method, url, *args, **kwargs):
+        return getattr(self.http, method)(url, *args, **kwargs)
+
+    def get(self, url, *args, **kwargs):
+        return self.request('get', url, *args, **kwargs)
+
+    def post(self, url, *args, **kwargs):
+        return self.request('post', url, *args, **kwargs)
+
+    def put(self, url, *args, **kwargs):
+        return self.request('put', url, *args, **kwargs)
+
+    def delete(self, url, *args, **kwargs):
+        return self.request('delete', url, *args, **kwargs)
+
+class LazyMethod(object):
+    """RPC method object resolved from client's factory on first use
+
+    :param connect: callable returning the RPC method factory (connecting if needed)
+    :param name: RPC method name
+    """
+    def __init__(self, connect, name):
+        self.connect = connect
+        self.name = name
+        self.method = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        if self.method == None:
+            with self._lock:
+                if self.method == None:
+                    self.method = self.connect().method(self.name)
+        return self.method
+
+    def invoke(self, agent, cid, params):
+        return self.resolve().invoke(agent, cid, params)
+
+    def __getattr__(self, attr):
+        # optional capabilities (e.g. stream) of the real method object
+        if attr.startswith('__') or attr in ('connect', 'name', 'method', '_lock'):
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+class WrappedFactory(object):
+    """RpcMethodFactory look-alike returning wrapped method objects
+
+    :param factory: factory to be wrapped (must provide *method(name)*)
+    :param wrapper: callable(name, method) returning the wrapped method
+    """
+    def __init__(self, factory, wrapper):
+        self.factory = factory
+        self.wrapper = wrapper
+
+    def method(self, name):
+        return self.wrapper(name, self.factory.method(name))
+
+def wrap_client(client, rpc_wrapper = None, http_wrapper = None):
+    """.. function:: wrap_client(client, rpc_wrapper = None, http_wrapper = None)
+
+    Replace transport of already created client with wrapped one
+
+    :param client: 'vbn', 'vswitch' or 'rcs' instance
+    :param rpc_wrapper: callable(name, method) returning the wrapped RPC method
+    :param http_wrapper: callable(http) returning the wrapped HTTP layer
+    :returns: client
+
+    """
+    if rpc_wrapper != None:
+        for name in RPC_METHODS:
+            attr = '_{}_method'.format(name)
+            if hasattr(client, attr):
+                setattr(client, attr, rpc_wrapper(name, getattr(client, attr)))
+    if http_wrapper != None and hasattr(client, '_http'):
+        client._http = http_wrapper(client._http)
+    return client
+
+# Agent error messages meaning that the requested object does not exist
+NOT_FOUND_MESSAGES = ('not found', 'no such', 'does not exist', 'not exist', 'unknown id', 'no object')
+
+def is_not_found(error):
+    """Check if RPC error reports that the requested object does not exist
+    """
+    message = str(error).lower()
+    for text in NOT_FOUND_MESSAGES:
+        if text in message:
+            return True
+    return False
+
+# Agent (switch/host) behind the server is stopped or not connected
+AGENT_DOWN_MESSAGES = ('not connected', 'not running', 'unknown agent', 'no route')
+
+# agent refused the request because object/switch is missing, duplicate or in use
+REJECTED_MESSAGES = NOT_FOUND_MESSAGES + AGENT_DOWN_MESSAGES + ('already', 'duplicate', 'in use')
+
+def is_rejected(error):
+    """Check if RPC error reports a request rejected for a state reason (object or switch
+    missing, object already exists or is in use), as opposed to transport/agent failure
+    """
+    message = str(error).lower()
+    for text in REJECTED_MESSAGES:
+        if text in message:
+            return True
+    return False
+
+# error categories of classify(), checked in this order
+NOT_FOUND = 'not_found'
+CONFLICT = 'conflict'
+INVALID = 'invalid'
+TIMEOUT = 'timeout'
+# the agent (switch/host) behind the server is stopped or unreachable, the server is fine
+AGENT_DOWN = 'agent_down'
+UNAVAILABLE = 'unavailable'
+UNKNOWN = 'unknown'
+
+CATEGORY_MESSAGES = (
+    (NOT_FOUND, NOT_FOUND_MESSAGES),
+    (CONFLICT, ('already', 'duplicate', 'in use', 'inconsistent')),
+    (INVALID, ('invalid', 'not in available', 'malformed', 'bad request', 'missing', 'required')),
+    (AGENT_DOWN, AGENT_DOWN_MESSAGES),
+    (TIMEOUT, ('timeout', 'timed out')),
+    (UNAVAILABLE, ('connection', 'refused', 'reset', 'unreachable', 'unavailable', 'temporarily',
+                   'busy', 'broken pipe')),
+)
+
+# categories worth retrying: the server may answer the same request later. AGENT_DOWN
+# is a state of one agent, not of the server, and UNKNOWN errors are not retried blindly
+RETRYABLE = (TIMEOUT, UNAVAILABLE)
+
+def classify(error):
+    """.. function:: classify(error)
+
+    Classify RPC/transport error by its message
+
+    :returns: one of NOT_FOUND, CONFLICT, INVALID, AGENT_DOWN, TIMEOUT, UNAVAILABLE, UNKNOWN
+
+    """
+    message = str(error).lower()
+    for category, texts in CATEGORY_MESSAGES:
+        for text in texts:
+            if text in message:
+                return category
+    return UNKNOWN
+
+def is_retryable(category):
+    return category in RETRYABLE
@@ -0,0 +1,207 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_vlan
+    :synopsis: VLAN id allocator and conflict index of CVBN vSwitch host interfaces
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'VlanIndex' class that keeps a 4096-bit bitset of used VLAN ids
+per host interface of the switch, built from networks (*networking.network*, which
+carry the host interface) and VLAN ports (*networking.port.raw*).
+
+Once built with *vswitch.vlanIndex(uuid)*, *addPortVlan* validates and claims the
+requested VLAN locally before any RPC (CvbnApiFailure is raised as the agent would),
+picks a free VLAN if *vlan* is None, and VLAN port and network add/delete calls keep
+the index up to date. A claimed VLAN is held until the port is created or the add
+fails, so concurrent adds of the same VLAN on one interface can not both pass.
+
+>>> index = vswitch.vlanIndex("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+>>> print index.used("eth1")
+[666]
+>>> print index.allocate("33b97119-3d45-4790-b888-eb9e5e1c6430")
+1
+
+"""
+
+import threading
+
+VLAN_MIN = 1
+VLAN_MAX = 4094
+
+INVALID = "invalid VLAN id {}"
+IN_USE = "VLAN {} is already defined on interface {}"
+NO_FREE = "no free VLAN id on interface of network {}"
+
+def _vlans(port):
+    vlans = port.get('vlan_id')
+    if vlans == None:
+        vlans = port.get('vlan_ids')
+    if vlans == None:
+        return []
+    if not isinstance(vlans, (list, tuple)):
+        vlans = [vlans]
+    return [int(vlan) for vlan in vlans]
+
+class VlanSet(object):
+    """Bitset of VLAN ids 0-4095
+    """
+    def __init__(self):
+        self._bits = bytearray(512)
+
+    def __contains__(self, vlan):
+        return bool(self._bits[vlan >> 3] & (1 << (vlan & 7)))
+
+    def add(self, vlan):
+        self._bits[vlan >> 3] |= 1 << (vlan & 7)
+
+    def discard(self, vlan):
+        self._bits[vlan >> 3] &= ~(1 << (vlan & 7)) & 0xff
+
+    def first_free(self):
+        """Return lowest free VLAN id in VLAN_MIN-VLAN_MAX, None if all are used
+        """
+        for index in range(VLAN_MIN >> 3, (VLAN_MAX >> 3) + 1):
+            if self._bits[index] == 0xff:
+                continue
+            for vlan in range(index << 3, (index << 3) + 8):
+                if VLAN_MIN <= vlan <= VLAN_MAX and vlan not in self:
+                    return vlan
+        return None
+
+    def __iter__(self):
+        return (vlan for vlan in range(4096) if vlan in self)
+
+class VlanIndex(object):
+    """VLAN usage index of one switch
+
+    :param networks: iterable of networking.network objects
+    :param ports: iterable of networking.port.raw objects
+    """
+    def __init__(self, networks, ports):
+        self._lock = threading.Lock()
+        self._interfaces = {}
+        self._sets = {}
+        self._ports = {}
+        for network in networks:
+            self.addNetwork(network)
+        for port in ports:
+            self.addPort(port)
+
+    def addNetwork(self, network):
+        """Learn host interface of networking.network object
+        """
+        with self._lock:
+            if network.get('host_interface'):
+                self._interfaces[network['id']] = network['host_interface']
+
+    def removeNetwork(self, networkId):
+        with self._lock:
+            self._interfaces.pop(networkId, None)
+
+    def interface(self, networkId):
+        """Return host interface of network *networkId*, None if unknown
+        """
+        return self._interfaces.get(networkId)
+
+    def _set(self, interface):
+        vlans = self._sets.get(interface)
+        if vlans == None:
+            vlans = self._sets[interface] = VlanSet()
+        return vlans
+
+    def addPort(self, port):
+        """Mark VLANs of networking.port.raw object used
+        """
+        with self._lock:
+            interface = self._interfaces.get(port.get('network_id'))
+            if interface == None and port.get('host_interface'):
+                # eth1.666 -> eth1
+                interface = port['host_interface'].split('.')[0]
+            if interface == None:
+                return
+            vlans = _vlans(port)
+            for vlan in vlans:
+                self._set(interface).add(vlan)
+            self._ports[port['id']] = (interface, vlans)
+
+    def removePort(self, portId):
+        """Release VLANs of deleted port *portId*
+        """
+        with self._lock:
+            interface, vlans = self._ports.pop(portId, (None, []))
+            for vlan in vlans:
+                self._set(interface).discard(vlan)
+
+    def used(self, interface):
+        """Return sorted list of VLAN ids used on host *interface*
+        """
+        with self._lock:
+            return list(self._set(interface))
+
+    def check(self, networkId, vlan):
+        """.. function:: check(networkId, vlan)
+
+        Validate *vlan* for new VLAN port of network *networkId* without reserving it
+
+        :returns: None if *vlan* can be used (or the network is unknown), the reason otherwise
+
+        """
+        try:
+            vlan = int(vlan)
+        except (TypeError, ValueError):
+            return INVALID.format(vlan)
+        if vlan < VLAN_MIN or vlan > VLAN_MAX:
+            return INVALID.format(vlan)
+        with self._lock:
+            interface = self._interfaces.get(networkId)
+            if interface != None and vlan in self._set(interface):
+                return IN_USE.format(vlan, interface)
+        return None
+
+    def claim(self, networkId, vlan):
+        """.. function:: claim(networkId, vlan)
+
+        Validate and reserve *vlan* for new VLAN port of network *networkId*; release it
+        with *release* if the port is not created
+
+        :returns: tuple (reason, claimed): reason is None if *vlan* can be used, claimed is
+            the reserved VLAN id (None if nothing was reserved, e.g. the network is unknown)
+
+        """
+        try:
+            vlan = int(vlan)
+        except (TypeError, ValueError):
+            return (INVALID.format(vlan), None)
+        if vlan < VLAN_MIN or vlan > VLAN_MAX:
+            return (INVALID.format(vlan), None)
+        with self._lock:
+            interface = self._interfaces.get(networkId)
+            if interface == None:
+                return (None, None)
+            vlans = self._set(interface)
+            if vlan in vlans:
+                return (IN_USE.format(vlan, interface), None)
+            vlans.add(vlan)
+        return (None, vlan)
+
+    def allocate(self, networkId):
+        """Reserve and return lowest free VLAN id on interface of network *networkId*,
+        None if the network is unknown or all VLANs are used
+        """
+        with self._lock:
+            interface = self._interfaces.get(networkId)
+            if interface == None:
+                return None
+            vlans = self._set(interface)
+            vlan = vlans.first_free()
+            if vlan != None:
+                vlans.add(vlan)
+            return vlan
+
+    def release(self, networkId, vlan):
+        with self._lock:
+            interface = self._interfaces.get(networkId)
+            if interface != None:
+                self._set(interface).discard(int(vlan))
@@ -16,7 +16,18 @@ import sys
 from cvbx_rpc_tools.method import (
     RpcMethodFactory, RpcMethodError
 )
+from cvbn_transport import is_not_found, is_rejected, LazyMethod
+from cvbn_deadline import DeadlineExceeded
+import cvbn_walk
+import cvbn_records
+import cvbn_watch
+import cvbn_pipeline
+import cvbn_ipam
+import cvbn_vlan
+import cvbn_cidr
+import threading
 import time
+from multiprocessing.pool import ThreadPool
 
 class CvbnApiFailure(Exception):
     """Exception raised when REST API execution fails
@@ -25,36 +36,83 @@ class CvbnApiFailure(Exception):
 
 class vswitch(object):
     """Python class that controls all interactions with CVBN vSwitch instance
-    """
-    def __init__(self, server, host):
-    """.. function:: init(server, host)
-
-    Setup communication channel for CRUD operations against cvbn-switch-agent via CvBB/CvBN.
-    CvBB - HTTP protocol and REST syntax with default CvBB port (8280)
-    CvBN - HTTP protocol and RPC specific syntax with default CvBN port (26265)
-
-    Autodiscovery of CvBB vs. CvBN
-
-    There is no authentication.
-
-    :param server: FQDN/IP of the server CvBB/CvBN
-    :param host: if 'server' is CvBB, then 'host' must be UUID of the CvBN server. Otherwise it can be anything
-
-    >>> import cvbn_vswitch
-    >>> vswitch = cvbn_vswitch.vswitch("localhost","none")
 
+    Thread safety: one object can be shared by many threads. Autodiscovery, RPC method
+    objects and local indexes (*greIpam*, *vlanIndex*, *subnetIndex*) are created once
+    under a lock and indexes lock their own updates. Modes (*setRecords*, *setTrusted*,
+    *setConcurrentGuards*) are settings of the object, i.e. of all threads using it; set
+    them before sharing the object (cvbn_clientpool hands out shared warm objects).
+    Thread safety of concurrent RPCs is that of the RPC method factory.
     """
-
-    port = self._determine_rpc_port(server)
-        factory = RpcMethodFactory.factory(
-            '{}:{}'.format(server, str(port)) 
-        )
-        self._get_method = factory.method('get')
-        self._walk_method = factory.method('walk')
-        self._set_method = factory.method('set')
-        self._delete_method = factory.method('delete')
-    self.agent = host + '/cvbn-switch-agent'
-    self.cid = 'magic'
+    def __init__(self, server, host, factory = None):
+        """.. function:: init(server, host, factory = None)
+
+        Setup communication channel for CRUD operations against cvbn-switch-agent via CvBB/CvBN.
+        CvBB - HTTP protocol and REST syntax with default CvBB port (8280)
+        CvBN - HTTP protocol and RPC specific syntax with default CvBN port (26265)
+
+        Autodiscovery of CvBB vs. CvBN
+
+        There is no authentication.
+
+        Construction does not talk to the server. Autodiscovery is done on the first call
+        or by *warmup()*.
+
+        :param server: FQDN/IP of the server CvBB/CvBN
+        :param host: if 'server' is CvBB, then 'host' must be UUID of the CvBN server. Otherwise it can be anything
+        :param factory: optional RPC method factory (e.g. cvbn_replay.ReplayFactory). Autodiscovery is skipped when given
+
+        >>> import cvbn_vswitch
+        >>> vswitch = cvbn_vswitch.vswitch("localhost","none")
+
+        """
+
+        self._factory = factory
+        self._connectLock = threading.Lock()
+        self._get_method = LazyMethod(self._connect, 'get')
+        self._walk_method = LazyMethod(self._connect, 'walk')
+        self._set_method = LazyMethod(self._connect, 'set')
+        self._delete_method = LazyMethod(self._connect, 'delete')
+        self.server = server
+        self.agent = host + '/cvbn-switch-agent'
+        self.cid = 'magic'
+        self._filterSupport = cvbn_walk.FilterSupport()
+        self.records = False
+        self.trusted = False
+        self._guardPool = None
+        self._indexes = {}
+        self._stateLock = threading.Lock()
+
+    def _connect(self):
+        '''autodiscovery and RPC factory setup, done once on first use'''
+        with self._connectLock:
+            if self._factory == None:
+                port = self._determine_rpc_port(self.server)
+                self._factory = RpcMethodFactory.factory(
+                    '{}:{}'.format(self.server, str(port))
+                )
+        return self._factory
+
+    def warmup(self, background = False):
+        """.. function:: warmup(background = False)
+
+        Pre-connect: run autodiscovery now instead of on the first call
+
+        :param background: run autodiscovery in background thread and return immediately
+        :type background: boolean
+        :returns: the background thread if *background* is True, None otherwise
+
+        >>> vswitch = cvbn_vswitch.vswitch("localhost","none")
+        >>> vswitch.warmup(background = True)
+
+        """
+        if not background:
+            self._connect()
+            return None
+        thread = threading.Thread(target = self._connect)
+        thread.daemon = True
+        thread.start()
+        return thread
 
     @staticmethod
     def _determine_rpc_port(server):
@@ -71,1028 +129,1099 @@ class vswitch(object):
         else:
             return 8280
 
+    def _get_object(self, agent, tid, objId, preflight = False):
+        '''get object by id with single RPC, None if object does not exist (or, for *preflight*
+        lookups of mutators in trusted mode, if rejected by the agent)'''
+        params = {'tid':tid, 'id':objId}
+        try:
+            result = self._get_method.invoke(agent, self.cid, params)
+        except RpcMethodError as error:
+            if is_not_found(error) or (preflight and self.trusted and is_rejected(error)):
+                return None
+            err = '{}\n{}'.format(sys.argv, error)
+            print >> sys.stderr, err
+            raise CvbnApiFailure(err)
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
+        if not result or result.get('id', objId) != objId:
+            return None
+        if self.records:
+            return cvbn_records.make(result)
+        return result
+
+    def _walk(self, agent, tid, filters = None, preflight = False):
+        '''walk tid on agent, return iterator over objects matching filters (see cvbn_walk);
+        empty for *preflight* walks of mutators in trusted mode rejected by the agent'''
+        try:
+            instances = cvbn_walk.walk(self._walk_method, agent, self.cid, tid, filters, self._filterSupport,
+                                       self._walkFailure)
+        except RpcMethodError as error:
+            if preflight and self.trusted and is_rejected(error):
+                return iter([])
+            raise self._walkFailure(error)
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
+        if self.records:
+            return cvbn_records.records(instances)
+        return instances
+
+    def _walkFailure(self, error):
+        '''exception of failed walk; errors of streamed walk hit while iterating are
+        raised also in trusted mode, as part of the objects was already returned'''
+        err = '{}\n{}'.format(sys.argv, error)
+        print >> sys.stderr, err
+        return CvbnApiFailure(err)
+
+    def _set(self, agent, params):
+        '''create object, return its id or None if rejected by the agent in trusted mode'''
+        try:
+            result = self._set_method.invoke(agent, self.cid, params)
+        except RpcMethodError as error:
+            if self.trusted and is_rejected(error):
+                return None
+            err = '{}\n{}'.format(sys.argv, error)
+            print >> sys.stderr, err
+            raise CvbnApiFailure(err)
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
+        return result['id']
+
+    def _delete(self, agent, params):
+        '''delete object, return True or False if rejected by the agent in trusted mode'''
+        try:
+            self._delete_method.invoke(agent, self.cid, params)
+        except RpcMethodError as error:
+            if self.trusted and is_rejected(error):
+                return False
+            err = '{}\n{}'.format(sys.argv, error)
+            print >> sys.stderr, err
+            raise CvbnApiFailure(err)
+        except DeadlineExceeded:
+            raise
+        except:
+            err = "Unknown reason for CVBN API execution failure"
+            print >> sys.stderr, err
+            raise CvbnApiFailure("reason unknown")
+        return True
+
+    def _guard(self, *checks):
+        '''preflight checks of mutators (callables returning True if OK); skipped in trusted mode,
+        concurrent if setConcurrentGuards() was called'''
+        if self.trusted:
+            return True
+        pool = self._guardPool
+        if pool != None:
+            return cvbn_pipeline.all_concurrent(checks, pool)
+        for check in checks:
+            if not check():
+                return False
+        return True
+
+    def _checkSubnet(self, uuid, ipv4Subnet, claim = False):
+        '''reject invalid or overlapping subnet locally if subnetIndex() was built; with *claim*
+        the subnet is also reserved in the index, returned for release once the agent answered'''
+        index = self._indexes.get(('cidr', uuid))
+        if index == None:
+            return None
+        if claim:
+            reason = index.claim(ipv4Subnet)
+        else:
+            reason = index.check(ipv4Subnet)
+        if reason != None:
+            err = '{}\n{}'.format(sys.argv, reason)
+            print >> sys.stderr, err
+            raise CvbnApiFailure(err)
+        return index
+
+    def _isDomainPort(self, uuid, domainId, portTid, portId):
+        '''domain membership lookup without preflight checks'''
+        filters = {'domain.id':domainId, 'port.tid':portTid, 'port.id':portId}
+        for instances in self._walk(uuid, 'networking.vswitch.domain.ports', filters):
+            return True
+        return False
+
+    def setRecords(self, enabled):
+        """.. function:: setRecords(enabled)
+
+        Enable/disable record mode. In record mode getters return compact read-only records
+        (see cvbn_records) with dict-like read access instead of dicts. Default disabled
+
+        :param enabled: True to return records, False to return dicts
+        :type enabled: boolean
+
+        >>> vswitch.setRecords(True)
+        >>> print vswitch.getSwitches()[0]['name']
+        demo
+
+        """
+        self.records = enabled
+
+    def setTrusted(self, enabled):
+        """.. function:: setTrusted(enabled)
+
+        Enable/disable trusted (optimistic) mode. In trusted mode mutators skip preflight
+        lookups (switch running, objects exist, port not in domain, ...) and send the
+        set/delete directly. Requests rejected by the agent (object or switch missing,
+        object already exists or in use) return None/False as the guards would; other
+        errors raise CvbnApiFailure. Getters are not affected and raise CvbnApiFailure
+        on rejected requests as in default mode. Default disabled
+
+        :param enabled: True to skip preflight lookups
+        :type enabled: boolean
+
+        >>> vswitch.setTrusted(True)
+        >>> print vswitch.deletePortVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
+        False
+
+        """
+        self.trusted = enabled
+
+    def setConcurrentGuards(self, workers):
+        """.. function:: setConcurrentGuards(workers)
+
+        Run independent preflight lookups of mutators (switch running, domain exists, port
+        exists, port not in domain, ...) concurrently in up to *workers* threads. The first
+        failing lookup decides the result without waiting for the others. Default 0 (sequential)
+
+        :param workers: number of threads; 0 to run lookups sequentially
+        :type workers: integer
+
+        >>> vswitch.setConcurrentGuards(4)
+        >>> print vswitch.addPortGreDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785","f1739786-38e0-4158-b337-9fd25aae3eb8")
+        True
+
+        """
+        with self._stateLock:
+            pool = self._guardPool
+            self._guardPool = None
+            if workers > 0:
+                self._guardPool = ThreadPool(workers)
+        if pool != None:
+            pool.close()
+
+    def _index(self, key, build, refresh):
+        '''return local index *key*, built by *build()* once even if many threads ask for it'''
+        index = self._indexes.get(key)
+        if index != None and not refresh:
+            return index
+        with self._stateLock:
+            index = self._indexes.get(key)
+            if index == None or refresh:
+                index = self._indexes[key] = build()
+            return index
+
+    def greIpam(self, uuid, refresh = False):
+        """.. function:: greIpam(uuid, refresh = False)
+
+        Get GRE endpoint allocator (see cvbn_ipam) of switch *uuid*, built from one walk of
+        subnets and GRE ports on the first call (or if *refresh*). From then on *addPortGre*
+        validates endpoints locally and picks free local endpoint if none is given, and
+        subnet and GRE port add/delete calls keep the allocator up to date
+
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param refresh: rebuild the allocator from the switch
+        :type refresh: boolean
+        :returns: cvbn_ipam.GreIpam
+        :raises: CvbnApiFailure
+
+        >>> ipam = vswitch.greIpam("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        >>> print ipam.check("e67d8e96-f887-4217-9ca6-ccb52d101d92", "192.168.30.10")
+        inconsistent port usage
+
+        """
+        return self._index(('gre', uuid), lambda: cvbn_ipam.GreIpam(self._walk(uuid, 'networking.subnet'),
+                                                                   self._walk(uuid, 'networking.port.gre')), refresh)
+
+    def vlanIndex(self, uuid, refresh = False):
+        """.. function:: vlanIndex(uuid, refresh = False)
+
+        Get VLAN index (see cvbn_vlan) of switch *uuid*, built from one walk of networks and
+        VLAN ports on the first call (or if *refresh*). From then on *addPortVlan* rejects
+        VLAN already used on the host interface before any RPC and picks free VLAN if *vlan*
+        is None, and VLAN port and network add/delete calls keep the index up to date
+
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param refresh: rebuild the index from the switch
+        :type refresh: boolean
+        :returns: cvbn_vlan.VlanIndex
+        :raises: CvbnApiFailure
+
+        >>> index = vswitch.vlanIndex("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        >>> print index.check("33b97119-3d45-4790-b888-eb9e5e1c6430", "666")
+        VLAN 666 is already defined on interface eth1
+
+        """
+        return self._index(('vlan', uuid), lambda: cvbn_vlan.VlanIndex(self._walk(uuid, 'networking.network'),
+                                                                      self._walk(uuid, 'networking.port.raw')), refresh)
+
+    def subnetIndex(self, uuid, refresh = False):
+        """.. function:: subnetIndex(uuid, refresh = False)
+
+        Get CIDR overlap index (see cvbn_cidr) of switch *uuid*, built from one walk of subnets
+        on the first call (or if *refresh*). From then on *addSubnet* and *addNetwork* raise
+        CvbnApiFailure for invalid or overlapping subnet before any RPC (so *addNetwork* does
+        not have to roll back), and subnet add/delete calls keep the index up to date
+
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param refresh: rebuild the index from the switch
+        :type refresh: boolean
+        :returns: cvbn_cidr.CidrIndex
+        :raises: CvbnApiFailure
+
+        >>> index = vswitch.subnetIndex("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        >>> print index.suggest(24, "192.168.0.0/16")
+        192.168.0.0/24
+
+        """
+        return self._index(('cidr', uuid), lambda: cvbn_cidr.CidrIndex(self._walk(uuid, 'networking.subnet')), refresh)
+
+    def dropIndexes(self, uuid = None):
+        """Forget local indexes (*greIpam*, *vlanIndex*, *subnetIndex*) of switch *uuid* or of all switches
+        """
+        with self._stateLock:
+            for key in list(self._indexes):
+                if uuid == None or key[1] == uuid:
+                    del self._indexes[key]
+
+    def watch(self, uuids = None, tids = cvbn_watch.DEFAULT_TIDS, **kwargs):
+        """.. function:: watch(uuids = None, tids = DEFAULT_TIDS, **kwargs)
+
+        Create topology watcher (see cvbn_watch) keeping the last snapshot per (switch, tid)
+        and emitting only added, removed and changed objects
+
+        :param uuids: list of switch instance ids; None to watch all switches (incl. new ones)
+        :param tids: object types to watch on every switch
+        :param kwargs: *minInterval*, *maxInterval*, *backoff*, *initial* of TopologyWatcher
+        :returns: cvbn_watch.TopologyWatcher (not started)
+
+        >>> watcher = vswitch.watch(['7ee373eb-8aa7-4a24-8c76-c4fa52022624'], ['networking.port.gre'])
+        >>> for diff in watcher.poll():
+        ...     print diff
+        Diff(switch=7ee373eb-8aa7-4a24-8c76-c4fa52022624, tid=networking.port.gre, added=2, removed=0, changed=0)
+
+        """
+        return cvbn_watch.TopologyWatcher(self, uuids, tids, **kwargs)
+
     def getSwitches(self):
-    """.. function:: getSwitches()
+        """.. function:: getSwitches()
 
-    Get the list of switches defined on the server with *id* and *name* attributes
+        Get the list of switches defined on the server with *id* and *name* attributes
 
-    :returns: List of switches defined on the server (JSON)
-    :raises: CvbnApiFailure
+        :returns: List of switches defined on the server (JSON)
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.getSwitches()
-    [{u'tid': u'compute.vswitch', u'id': u'7ee373eb-8aa7-4a24-8c76-c4fa52022624', u'name': u'demo'}]
+        >>> print vswitch.getSwitches()
+        [{u'tid': u'compute.vswitch', u'id': u'7ee373eb-8aa7-4a24-8c76-c4fa52022624', u'name': u'demo'}]
 
-    """
+        """
 
-    params = {'tid':'compute.vswitch'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-    return result['children']
+        return list(self._walk(self.agent, 'compute.vswitch'))
 
-    def getSwitchName(self, switchName):
-    """.. function:: getSwitchName(switchName)
+    def iterSwitches(self):
+        """.. function:: iterSwitches()
 
-    Get the switch details by name.
+        Generator variant of *getSwitches*. Yields switches one at a time.
+        Nothing is requested before the first item is consumed.
 
-    If switch *name* attribute value is not unique, and this is not enforced by data model, then the first found switch instance is returned.
+        :returns: generator of switches
+        :raises: CvbnApiFailure
 
-    :returns: Switch instances or None if switch name does not exist
-    :raises: CvbnApiFailure
+        >>> print [switch['name'] for switch in vswitch.iterSwitches()]
+        [u'demo']
 
-    >>> print vswitch.getSwitchName("demo")
-    {u'tid': u'compute.vswitch', u'id': u'ea2db47c-1cbe-4846-9ba6-141c3ac59508', u'name': u'demo'}
-    >>> print vswitch.getSwitchName("wrong")
-    None
+        """
+        for instances in self._walk(self.agent, 'compute.vswitch'):
+            yield instances
 
-    """
+    def getSwitchName(self, switchName):
+        """.. function:: getSwitchName(switchName)
 
-    params = {'tid':'compute.vswitch'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        Get the switch details by name.
 
-    for instances in result['children']:
-        if instances['name'] == switchName:
-            return instances
-    return None
+        If switch *name* attribute value is not unique, and this is not enforced by data model, then the first found switch instance is returned.
 
-    def getSwitchDomain(self, domainName):
-    """.. function:: getSwitchDomain(domainName)
+        :returns: Switch instances or None if switch name does not exist
+        :raises: CvbnApiFailure
 
-    Get the switch details by name.
+        >>> print vswitch.getSwitchName("demo")
+        {u'tid': u'compute.vswitch', u'id': u'ea2db47c-1cbe-4846-9ba6-141c3ac59508', u'name': u'demo'}
+        >>> print vswitch.getSwitchName("wrong")
+        None
 
-    If switch *name* attribute value is not unique, and this is not enforced by data model, then the first found switch instance is returned.
+        """
 
-    :param domainName: domain name to be found
-    :type domainName: string
-    :returns: Switch instances details that has domain or None if domain is not found
-    :raises: CvbnApiFailure
+        for instances in self._walk(self.agent, 'compute.vswitch', {'name':switchName}):
+            return instances
+        return None
 
-    >>> print vswitch.getSwitchDomain("user1")
-    {u'tid': u'compute.vswitch', u'id': u'ea2db47c-1cbe-4846-9ba6-141c3ac59508', u'name': u'demo'}
-    >>> print vswitch.getSwitchDomain("user2")
-    None
+    def getSwitchDomain(self, domainName):
+        """.. function:: getSwitchDomain(domainName)
 
-    """
+        Get the switch details by name.
 
-    params = {'tid':'compute.vswitch'}
-    try:
-        result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        If switch *name* attribute value is not unique, and this is not enforced by data model, then the first found switch instance is returned.
 
-    for instances in result['children']:
-        if not (self.getDomainName(instances['id'], domainName) == None):
-            return instances
+        :param domainName: domain name to be found
+        :type domainName: string
+        :returns: Switch instances details that has domain or None if domain is not found
+        :raises: CvbnApiFailure
+
+        >>> print vswitch.getSwitchDomain("user1")
+        {u'tid': u'compute.vswitch', u'id': u'ea2db47c-1cbe-4846-9ba6-141c3ac59508', u'name': u'demo'}
+        >>> print vswitch.getSwitchDomain("user2")
+        None
 
-    return None
+        """
+
+        for instances in list(self._walk(self.agent, 'compute.vswitch')):
+            if self.getDomainName(instances['id'], domainName) != None:
+                return instances
+        return None
 
     def isSwitch(self, uuid):
-    """.. function:: isSwitch(uuid)
+        """.. function:: isSwitch(uuid)
 
-    Checks if switch instance *uuid* is defined
+        Checks if switch instance *uuid* is defined
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: True if defined, False if not defined
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: True if defined, False if not defined
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.isSwitch("wrong")
-    False
-    >>> print vswitch.isSwitch("7ee373eb-8aa7-4a24-8c76-c4fa52022624")
-    True
+        >>> print vswitch.isSwitch("wrong")
+        False
+        >>> print vswitch.isSwitch("7ee373eb-8aa7-4a24-8c76-c4fa52022624")
+        True
 
-    """
+        """
 
-        params = {'tid':'compute.vswitch'}
-        try:
-                result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-        for instances in result['children']:
-                if instances['id'] == uuid:
-            return True
-        return False
+        return self._get_object(self.agent, 'compute.vswitch', uuid) != None
 
     def addSwitch(self, name):
-    """.. function:: addSwitch(name)
+        """.. function:: addSwitch(name)
 
-    Add the switch with *name*
+        Add the switch with *name*
 
-    The data model does not enforce *name* to be unique. Neither does *addSwitch* method.
+        The data model does not enforce *name* to be unique. Neither does *addSwitch* method.
 
-    :param name: Switch instance name
-    :type name: string
-    :returns: *uuid* reference value for Switch instance or None
-    :raises: CvbnApiFailure
+        :param name: Switch instance name
+        :type name: string
+        :returns: *uuid* reference value for Switch instance or None
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.addSwitch("demo")
-    7ee373eb-8aa7-4a24-8c76-c4fa52022624
+        >>> print vswitch.addSwitch("demo")
+        7ee373eb-8aa7-4a24-8c76-c4fa52022624
 
-    """
+        """
 
-    params = {'tid':'compute.vswitch','name':name}
-    try:
-        result = self._set_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-    return result['id']
+        params = {'tid':'compute.vswitch','name':name}
+        return self._set(self.agent, params)
 
     def deleteSwitch(self, uuid):
-    """.. function:: deleteSwitch(uuid)
+        """.. function:: deleteSwitch(uuid)
 
-    Delete the switch by *uuid*
+        Delete the switch by *uuid*
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: True if deleted, False if switch is running or not defined
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: True if deleted, False if switch is running or not defined
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.deleteSwitch("wrong")
-    False
-    >>> print vswitch.deleteSwitch("7ee373eb-8aa7-4a24-8c76-c4fa52022624")
-    True
-    >>> print vswitch.getSwitches()
-    []
+        >>> print vswitch.deleteSwitch("wrong")
+        False
+        >>> print vswitch.deleteSwitch("7ee373eb-8aa7-4a24-8c76-c4fa52022624")
+        True
+        >>> print vswitch.getSwitches()
+        []
 
-    """
-
-    if not self.isSwitch(uuid):
-        return False
+        """
 
-    if self.isRunning(uuid):
-        if not self.stopSwitch(uuid):
+        if not self._guard(lambda: self.isSwitch(uuid)):
             return False
 
-    for domain in self.getDomains(uuid):
-        if not self.deleteDomain(uuid, domain['id']):
-            return False
+        if self.isRunning(uuid):
+            if not self.stopSwitch(uuid):
+                return False
 
-    params = {'tid':'compute.vswitch','id':uuid}
-    try:
-        result = self._delete_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        for domain in self.iterDomains(uuid):
+            if not self.deleteDomain(uuid, domain['id']):
+                return False
 
-    return True
+        params = {'tid':'compute.vswitch','id':uuid}
+        return self._delete(self.agent, params)
 
     def startSwitch(self, uuid, maxWait = 10):
-    """.. function:: startSwitch(uuid, maxWait = 10)
+        """.. function:: startSwitch(uuid, maxWait = 10)
 
-    Start the switch instance *uuid*. If *uuid* is not defined, then *False* is returned.
-    Default max. 10 seconds of waiting for the switch to start.
+        Start the switch instance *uuid*. If *uuid* is not defined, then *False* is returned.
+        Default max. 10 seconds of waiting for the switch to start.
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param maxWait: Optional waiting time in seconds for switch connection to cvbn-mux. Default 10
-    :type maxWait: integer
-    :returns: *True* if switch started correctly, *False* if not started or switch not defined or switch already running
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param maxWait: Optional waiting time in seconds for switch connection to cvbn-mux. Default 10
+        :type maxWait: integer
+        :returns: *True* if switch started correctly, *False* if not started or switch not defined or switch already running
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.startSwitch("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    True
-    >>> print vswitch.startSwitch("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    False
-    >>> print vswitch.startSwitch("wrong")
-    False
+        >>> print vswitch.startSwitch("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        True
+        >>> print vswitch.startSwitch("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        False
+        >>> print vswitch.startSwitch("wrong")
+        False
 
-    """
-
-    if not self.isSwitch(uuid):
-        return False
+        """
 
-    if self.isRunning(uuid):
-        return False
+        if not self._guard(lambda: self.isSwitch(uuid), lambda: not self.isRunning(uuid)):
+            return False
 
-        config = {}
-        config['tid'] = 'compute.vswitch'
-        config['id'] = uuid
-        params = {'tid':'compute.server','configuration':config}
-        try:
-                result = self._set_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        config = {'tid':'compute.vswitch','id':uuid}
+        if self._set(self.agent, {'tid':'compute.server','configuration':config}) == None:
+            return False
 
-    counter = 0
-    connected = False
+        counter = 0
+        connected = False
         while True:
-                if self.isConnectedToMux(uuid):
-            connected = True
-                        break
-                time.sleep(1)
-        counter = counter + 1
-        if counter > maxWait:
-            break
-    if not connected:
-        return False
-
-        params = {'tid':'networking.vswitch'}
-        try:
-                result = self._set_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+            if self.isConnectedToMux(uuid):
+                connected = True
+                break
+            time.sleep(1)
+            counter = counter + 1
+            if counter > maxWait:
+                break
+        if not connected:
+            return False
 
-    return True
+        self._set(uuid, {'tid':'networking.vswitch'})
+        return True
 
     def stopSwitch(self, uuid):
-    """.. function: stopSwitch(uuid)
+        """.. function: stopSwitch(uuid)
 
-    Stop the running switch instance *uuid*
+        Stop the running switch instance *uuid*
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: True if stopped, False if not defined or not running
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: True if stopped, False if not defined or not running
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.stopSwitch("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    True
-    >>> print vswitch.stopSwitch("wrong")
-    False
+        >>> print vswitch.stopSwitch("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        True
+        >>> print vswitch.stopSwitch("wrong")
+        False
 
-    """
+        """
 
-    runId = self.getRunId(uuid)
-    if runId == None:
-        return False
+        runId = self.getRunId(uuid)
+        if runId == None:
+            return False
 
         params = {'tid':'compute.server','id':runId}
-        try:
-                result = self._delete_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    return True
+        return self._delete(self.agent, params)
 
     def getRunId(self, uuid):
-    """.. function: getRunId(uuid)
+        """.. function: getRunId(uuid)
 
-    Get the running instance's *id*
+        Get the running instance's *id*
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: *id* value if vSwitch is running and is defined. *None* otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: *id* value if vSwitch is running and is defined. *None* otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.getRunId("wrong")
-    None
-    >>> print vswitch.getRunId("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    2eec5b9a-2ba4-4a2f-8c7b-be9b2bb63787
+        >>> print vswitch.getRunId("wrong")
+        None
+        >>> print vswitch.getRunId("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        2eec5b9a-2ba4-4a2f-8c7b-be9b2bb63787
 
-    """
+        """
 
-    if not self.isSwitch(uuid):
-        return None
+        if not self.isSwitch(uuid):
+            return None
 
-        params = {'tid':'compute.server'}
-        try:
-                result = self._walk_method.invoke(self.agent, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-        for instances in result['children']:
-                if instances['configuration']['id'] == uuid:
+        for instances in self._walk(self.agent, 'compute.server', {'configuration.id':uuid}):
             return instances['id']
         return None
 
     def getNetworkingId(self, uuid):
-    """.. function:: getNetworkingId(uuid)
+        """.. function:: getNetworkingId(uuid)
 
-    Get networking.vswich object id related to switch instance
+        Get networking.vswich object id related to switch instance
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: networking.switch object id, None if switch not running
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: networking.switch object id, None if switch not running
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.getNetworkingId("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    {u'tid': u'networking.vswitch', u'id': u'69970943-8ad6-45ec-820d-58dca4d3ca82'}
-    >>> print vswitch.getNetworkingId("wrong")
-    None
+        >>> print vswitch.getNetworkingId("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        {u'tid': u'networking.vswitch', u'id': u'69970943-8ad6-45ec-820d-58dca4d3ca82'}
+        >>> print vswitch.getNetworkingId("wrong")
+        None
 
-    """
+        """
 
-    if self.getRunId(uuid) == None:
-        return None
+        if not self._guard(lambda: self.getRunId(uuid) != None):
+            return None
 
-    params = {'tid':'networking.vswitch'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-    return result['children'][0]
+        for instances in self._walk(uuid, 'networking.vswitch'):
+            return instances
+        return None
 
     def isRunning(self, uuid):
-    """.. function:: isRunning(uuid)
+        """.. function:: isRunning(uuid)
 
-    Check if the switch *uuid* is running. If the switch is not even defined, it does not run.
-    No check is made if the switch is defined.
+        Check if the switch *uuid* is running. If the switch is not even defined, it does not run.
+        No check is made if the switch is defined.
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: True if running, False if not running
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: True if running, False if not running
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.isRunning("wrong")
-    False
-    >>> print vswitch.isRunning("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    True
+        >>> print vswitch.isRunning("wrong")
+        False
+        >>> print vswitch.isRunning("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        True
 
-    """
+        """
 
-    if self.getRunId(uuid) == None:
-        return False
-    return True
+        return self.getRunId(uuid) != None
 
     def isConnectedToMux(self, uuid):
-    """.. function:: isConnectedToMux(uuid)
+        """.. function:: isConnectedToMux(uuid)
 
-    Check if the running vSwitch instances connected to cvbn-mux i.e. is the switch instance ready to be configured.
+        Check if the running vSwitch instances connected to cvbn-mux i.e. is the switch instance ready to be configured.
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: True if connected, False if not connected
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: True if connected, False if not connected
+        :raises: CvbnApiFailure
 
-    """
+        """
 
-        params = {'tid':'connection'}
-        try:
-                result = self._walk_method.invoke('0', self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-        for instances in result['children']:
-                if instances['name'] == uuid:
-                        return True
+        for instances in self._walk('0', 'connection', {'name':uuid}):
+            return True
         return False
 
     def getNetworks(self,uuid):
-    """.. function:: getNetworks(self, uuid)
+        """.. function:: getNetworks(self, uuid)
 
-    Get the list of associate networks created on the switch *uuid*
+        Get the list of associate networks created on the switch *uuid*
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: List of associate networks or None if switch is not running
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: List of associate networks or None if switch is not running
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    []
-    >>> print vswitch.getNetworks("wrong")
-    None
-    >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    [{u'subnets': [], u'name': u'pcpe', u'host_interface': u'eth1', u'network_type': u'associate', u'tid': u'networking.network', u'id': u'09c357c1-adf4-4071-b267-3b7cd8815860'}, {u'subnets': [], u'name': u'pcpe', u'host_interface': u'eth1', u'network_type': u'associate', u'tid': u'networking.network', u'id': u'85da5f09-2291-4961-bf7b-acf05fa116ee'}, {u'tid': u'networking.network', u'subnets': [u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'], u'id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'network_type': u'associate', u'name': u'vm'}]
+        >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        []
+        >>> print vswitch.getNetworks("wrong")
+        None
+        >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        [{u'subnets': [], u'name': u'pcpe', u'host_interface': u'eth1', u'network_type': u'associate', u'tid': u'networking.network', u'id': u'09c357c1-adf4-4071-b267-3b7cd8815860'}, {u'subnets': [], u'name': u'pcpe', u'host_interface': u'eth1', u'network_type': u'associate', u'tid': u'networking.network', u'id': u'85da5f09-2291-4961-bf7b-acf05fa116ee'}, {u'tid': u'networking.network', u'subnets': [u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'], u'id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'network_type': u'associate', u'name': u'vm'}]
 
-    """
+        """
 
-    runId = self.getRunId(uuid)
-    if runId == None:
-        return None
+        if self.getRunId(uuid) == None:
+            return None
 
-    params = {'tid':'networking.network'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        return list(self._walk(uuid, 'networking.network'))
 
-    return result['children']
+    def iterNetworks(self, uuid):
+        """.. function:: iterNetworks(uuid)
 
-    def getNetworkId(self, uuid, networkId):
-    """.. function:: isNetworkid(uuid, networkId)
+        Generator variant of *getNetworks*. Yields associate networks one at a time, nothing if switch is not running.
+        Nothing is requested before the first item is consumed.
 
-    Get associate network by id
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: generator of associate networks
+        :raises: CvbnApiFailure
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param networkId: Network id
-    :type networkId: string
-    :returns: Network details if exists, None otherwise (switch not defined, not running, network id not exist)
-    :raises: CvbnApiFailure
+        >>> print [network['name'] for network in vswitch.iterNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")]
+        [u'pcpe', u'vm']
 
-    >>> print vswitch.getNetworkId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
-    None
-    >>> print vswitch.getNetworkId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","cce575af-0b1e-4193-a5ce-1118ea86308e")
-    {u'tid': u'networking.network', u'subnets': [u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'], u'id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'network_type': u'associate', u'name': u'vm'}
+        """
+        if self.getRunId(uuid) == None:
+            return
 
-    """
+        for instances in self._walk(uuid, 'networking.network'):
+            yield instances
 
-    runId = self.getRunId(uuid)
-    if runId == None:
-        return None
+    def getNetworkId(self, uuid, networkId):
+        """.. function:: isNetworkid(uuid, networkId)
 
-    params = {'tid':'networking.network'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        Get associate network by id
 
-        for instances in result['children']:
-                if instances['id'] == networkId:
-                        return instances
-        return None
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param networkId: Network id
+        :type networkId: string
+        :returns: Network details if exists, None otherwise (switch not defined, not running, network id not exist)
+        :raises: CvbnApiFailure
 
-    def getNetworkName(self, uuid, networkName):
-    """.. function:: getNetworkName(uuid, networkName)
+        >>> print vswitch.getNetworkId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
+        None
+        >>> print vswitch.getNetworkId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","cce575af-0b1e-4193-a5ce-1118ea86308e")
+        {u'tid': u'networking.network', u'subnets': [u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'], u'id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'network_type': u'associate', u'name': u'vm'}
 
-    Get details of network by name
+        """
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param networkName: Network name
-    :type networkName: string
-    :returns: Network details if exists, None otherwise (switch not defined, not running, network id not exist)
-    :raises: CvbnApiFailure
+        if self.getRunId(uuid) == None:
+            return None
 
-    >>> print vswitch.getNetworkName("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
-    None
-    >>> print vswitch.getNetworkName("ea2db47c-1cbe-4846-9ba6-141c3ac59508","vm")
-    {u'tid': u'networking.network', u'subnets': [u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'], u'id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'network_type': u'associate', u'name': u'vm'}
+        return self._get_object(uuid, 'networking.network', networkId)
 
-    """
+    def getNetworkName(self, uuid, networkName):
+        """.. function:: getNetworkName(uuid, networkName)
 
-    runId = self.getRunId(uuid)
-    if runId == None:
-        return None
+        Get details of network by name
 
-    params = {'tid':'networking.network'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param networkName: Network name
+        :type networkName: string
+        :returns: Network details if exists, None otherwise (switch not defined, not running, network id not exist)
+        :raises: CvbnApiFailure
 
-        for instances in result['children']:
-                if instances['name'] == networkName:
-                        return instances
+        >>> print vswitch.getNetworkName("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
+        None
+        >>> print vswitch.getNetworkName("ea2db47c-1cbe-4846-9ba6-141c3ac59508","vm")
+        {u'tid': u'networking.network', u'subnets': [u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'], u'id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'network_type': u'associate', u'name': u'vm'}
+
+        """
+
+        if self.getRunId(uuid) == None:
+            return None
+
+        for instances in self._walk(uuid, 'networking.network', {'name':networkName}):
+            return instances
         return None
 
     def addNetwork(self, uuid, networkName, hostInterface, ipv4Subnet):
-    """.. function:: addNetwork(uuid, networkName, hostInterface, ipv4Subnet)
-
-    Add associate network to switch *uuid* with the attribute values as parameters.
-
-    ipv4Subnet can be *None* else it has to be proper notation of CIDR (a.b.c.d/n)
-
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param networkName: Network name
-    :type networkName: string
-    :param hostInterface: Host interface name
-    :type hostInterface: string
-    :param ipv4Subnet: IPv4 subnet of the network
-    :type ipv4Subnet: string
-    :returns: network *id* if operation was successful, None otherwise (switch not defined, not running)
-    :raises: CvbnApiFailure
-
-    >>> print vswitch.addNetwork("ea2db47c-1cbe-4846-9ba6-141c3ac59508","pcpe","eth1","None")
-    33b97119-3d45-4790-b888-eb9e5e1c6430
-    >>> print vswitch.addNetwork("ea2db47c-1cbe-4846-9ba6-141c3ac59508","vm","lo","192.168.30.0/24")
-    fd07cb98-4030-45cc-b4ba-183f110ce10d
-    >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    [{u'subnets': [], u'name': u'pcpe', u'host_interface': u'eth1', u'network_type': u'associate', u'tid': u'networking.network', u'id': u'33b97119-3d45-4790-b888-eb9e5e1c6430'}, {u'tid': u'networking.network', u'subnets': [u'e67d8e96-f887-4217-9ca6-ccb52d101d92'], u'id': u'fd07cb98-4030-45cc-b4ba-183f110ce10d', u'network_type': u'associate', u'name': u'vm'}]
+        """.. function:: addNetwork(uuid, networkName, hostInterface, ipv4Subnet)
 
-    """
+        Add associate network to switch *uuid* with the attribute values as parameters.
 
-    runId = self.getRunId(uuid)
-    if runId == None:
-        return None
+        ipv4Subnet can be *None* else it has to be proper notation of CIDR (a.b.c.d/n)
 
-    params = {'tid':'networking.network','network_type':'associate','name':networkName,'host_interface':hostInterface}
-    try:
-        result = self._set_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-    networkId = result['id']
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param networkName: Network name
+        :type networkName: string
+        :param hostInterface: Host interface name
+        :type hostInterface: string
+        :param ipv4Subnet: IPv4 subnet of the network
+        :type ipv4Subnet: string
+        :returns: network *id* if operation was successful, None otherwise (switch not defined, not running)
+        :raises: CvbnApiFailure
+
+        >>> print vswitch.addNetwork("ea2db47c-1cbe-4846-9ba6-141c3ac59508","pcpe","eth1","None")
+        33b97119-3d45-4790-b888-eb9e5e1c6430
+        >>> print vswitch.addNetwork("ea2db47c-1cbe-4846-9ba6-141c3ac59508","vm","lo","192.168.30.0/24")
+        fd07cb98-4030-45cc-b4ba-183f110ce10d
+        >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        [{u'subnets': [], u'name': u'pcpe', u'host_interface': u'eth1', u'network_type': u'associate', u'tid': u'networking.network', u'id': u'33b97119-3d45-4790-b888-eb9e5e1c6430'}, {u'tid': u'networking.network', u'subnets': [u'e67d8e96-f887-4217-9ca6-ccb52d101d92'], u'id': u'fd07cb98-4030-45cc-b4ba-183f110ce10d', u'network_type': u'associate', u'name': u'vm'}]
 
-    if not ipv4Subnet == "None":
-        if not self.addSubnet(uuid, networkId, ipv4Subnet):
-            self.deleteNetwork(uuid, networkId)
+        """
+
+        if not ipv4Subnet == "None":
+            self._checkSubnet(uuid, ipv4Subnet)
+
+        if not self._guard(lambda: self.getRunId(uuid) != None):
             return None
 
-    return networkId
+        params = {'tid':'networking.network','network_type':'associate','name':networkName,'host_interface':hostInterface}
+        networkId = self._set(uuid, params)
+        if networkId == None:
+            return None
 
-    def deleteNetwork(self, uuid, networkId):
-    """.. function:: deleteNetwork(uuid, networkId)
+        index = self._indexes.get(('vlan', uuid))
+        if index != None:
+            index.addNetwork({'id':networkId, 'host_interface':hostInterface})
 
-    Delete network by *networkId*. Associated subnets (if any) are deleted too
+        if not ipv4Subnet == "None":
+            if not self.addSubnet(uuid, networkId, ipv4Subnet):
+                self.deleteNetwork(uuid, networkId)
+                return None
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param networkId: Network id
-    :type networkId: string
-    :returns: True if operation was successful, False otherwise
-    :raises: CvbnApiFailure
+        return networkId
 
-    >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    [{u'tid': u'networking.network', u'subnets': [u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'], u'id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'network_type': u'associate', u'name': u'vm'}]
-    >>> print vswitch.deleteNetwork("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "cce575af-0b1e-4193-a5ce-1118ea86308e")
-    True
-    >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    []
+    def deleteNetwork(self, uuid, networkId):
+        """.. function:: deleteNetwork(uuid, networkId)
 
-    """
+        Delete network by *networkId*. Associated subnets (if any) are deleted too
 
-    if self.getRunId(uuid) == None:
-        return False
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param networkId: Network id
+        :type networkId: string
+        :returns: True if operation was successful, False otherwise
+        :raises: CvbnApiFailure
 
-    networkDetails = self.getNetworkId(uuid, networkId)
-    if networkDetails == None:
-        return False
+        >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        [{u'tid': u'networking.network', u'subnets': [u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'], u'id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'network_type': u'associate', u'name': u'vm'}]
+        >>> print vswitch.deleteNetwork("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "cce575af-0b1e-4193-a5ce-1118ea86308e")
+        True
+        >>> print vswitch.getNetworks("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        []
+
+        """
 
-    for subnetId in networkDetails['subnets']:
-        if not self.deleteSubnet(uuid, subnetId):
+        if not self._guard(lambda: self.getRunId(uuid) != None):
             return False
 
-    params = {'tid':'networking.network','id':networkId}
-    try:
-        result = self._delete_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        # the network itself is needed for its subnets, so it is fetched in trusted mode too
+        networkDetails = self._get_object(uuid, 'networking.network', networkId, preflight = True)
+        if networkDetails == None:
+            return False
+
+        for subnetId in networkDetails['subnets']:
+            if not self.deleteSubnet(uuid, subnetId):
+                return False
+
+        params = {'tid':'networking.network','id':networkId}
+        if not self._delete(uuid, params):
+            return False
 
-    return True
+        index = self._indexes.get(('vlan', uuid))
+        if index != None:
+            index.removeNetwork(networkId)
+        return True
 
     def addSubnet(self, uuid, networkId, ipv4Subnet):
-    """.. function:: addSubnet(uuid, networkId, ipv4Subnet)
+        """.. function:: addSubnet(uuid, networkId, ipv4Subnet)
 
-    Add IPv4 Subnet and associate it with the network *networkId*
+        Add IPv4 Subnet and associate it with the network *networkId*
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param networkId: Network id
-    :type networkId: string
-    :param ipv4Subnet: IPv4 subnet of the network
-    :type ipv4Subnet: string
-    :returns: subnet *id* if operation was successful, None otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param networkId: Network id
+        :type networkId: string
+        :param ipv4Subnet: IPv4 subnet of the network
+        :type ipv4Subnet: string
+        :returns: subnet *id* if operation was successful, None otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.addSubnet("ea2db47c-1cbe-4846-9ba6-141c3ac59508","33b97119-3d45-4790-b888-eb9e5e1c6430","192.168.40.0/24")
-    23c978ac-8d7f-4a56-9a62-21d11b90ddc9
+        >>> print vswitch.addSubnet("ea2db47c-1cbe-4846-9ba6-141c3ac59508","33b97119-3d45-4790-b888-eb9e5e1c6430","192.168.40.0/24")
+        23c978ac-8d7f-4a56-9a62-21d11b90ddc9
 
-    """
+        """
 
-    if self.getRunId(uuid) == None:
-        return None
+        index = self._checkSubnet(uuid, ipv4Subnet, claim = True)
+        subnetId = None
+        try:
+            if not self._guard(lambda: self.getRunId(uuid) != None,
+                               lambda: self._get_object(uuid, 'networking.network', networkId) != None):
+                return None
+
+            params = {'tid':'networking.subnet', 'network_id':networkId, 'cidr':ipv4Subnet}
+            subnetId = self._set(uuid, params)
+        finally:
+            if index != None:
+                index.release(ipv4Subnet, subnetId)
+
+        ipam = self._indexes.get(('gre', uuid))
+        if ipam != None and subnetId != None:
+            # allocation pools and gateway are chosen by the agent
+            subnet = self._get_object(uuid, 'networking.subnet', subnetId)
+            if subnet != None:
+                ipam.addSubnet(subnet)
+        return subnetId
 
-    if self.getNetworkId(uuid, networkId) == None:
-        return None
+    def getSubnets(self, uuid):
+        """.. function:: getSubnets(self, uuid)
 
-    params = {'tid':'networking.subnet', 'network_id':networkId, 'cidr':ipv4Subnet}
-    try:
-        result = self._set_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        Get the list of subnets created on the switch *uuid*
 
-    return result['id']
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: array of subnets or None if switch not running
+        :raises: CvbnApiFailure
 
-    def getSubnets(self, uuid):
-    """.. function:: getSubnets(self, uuid)
+        >>> print vswitch.getSubnets("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        []
+        >>> print vswitch.getSubnets("wrong")
+        None
+        >>> print vswitch.getSubnets("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        [{u'network_id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'ip_version': 4, u'allocation_pools': [{u'start': u'192.168.30.2', u'end': u'192.168.30.254'}], u'gateway_ip': u'192.168.30.1', u'tid': u'networking.subnet', u'cidr': u'192.168.30.0/24', u'id': u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'}]
 
-    Get the list of subnets created on the switch *uuid*
+        """
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: array of subnets or None if switch not running
-    :raises: CvbnApiFailure
+        if self.getRunId(uuid) == None:
+            return None
 
-    >>> print vswitch.getSubnets("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    []
-    >>> print vswitch.getSubnets("wrong")
-    None
-    >>> print vswitch.getSubnets("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    [{u'network_id': u'cce575af-0b1e-4193-a5ce-1118ea86308e', u'ip_version': 4, u'allocation_pools': [{u'start': u'192.168.30.2', u'end': u'192.168.30.254'}], u'gateway_ip': u'192.168.30.1', u'tid': u'networking.subnet', u'cidr': u'192.168.30.0/24', u'id': u'c4e3dfcd-9aa9-422c-959e-885f11db8d36'}]
+        return list(self._walk(uuid, 'networking.subnet'))
 
-    """
+    def iterSubnets(self, uuid):
+        """.. function:: iterSubnets(uuid)
 
-    if self.getRunId(uuid) == None:
-        return None
+        Generator variant of *getSubnets*. Yields subnets one at a time, nothing if switch is not running.
+        Nothing is requested before the first item is consumed.
 
-    params = {'tid':'networking.subnet'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: generator of subnets
+        :raises: CvbnApiFailure
 
-    return result['children']
+        >>> print [subnet['cidr'] for subnet in vswitch.iterSubnets("ea2db47c-1cbe-4846-9ba6-141c3ac59508")]
+        [u'192.168.30.0/24']
 
-    def getSubnetId(self, uuid, subnetId):
-    """.. function:: isSubnetId(uuid, subnetId)
+        """
+        if self.getRunId(uuid) == None:
+            return
 
-    Get subnet details by *subnetId* for switch *uuid*
+        for instances in self._walk(uuid, 'networking.subnet'):
+            yield instances
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param subnetId: subnet id
-    :type subnetId: string
-    :returns: Subnet details if exists, None otherwise
-    :raises: CvbnApiFailure
+    def getSubnetId(self, uuid, subnetId):
+        """.. function:: isSubnetId(uuid, subnetId)
 
-    >>> print vswitch.getSubnetId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","23c978ac-8d7f-4a56-9a62-21d11b90ddc9")
-    {u'network_id': u'33b97119-3d45-4790-b888-eb9e5e1c6430', u'ip_version': 4, u'allocation_pools': [{u'start': u'192.168.40.2', u'end': u'192.168.40.254'}], u'gateway_ip': u'192.168.40.1', u'tid': u'networking.subnet', u'cidr': u'192.168.40.0/24', u'id': u'23c978ac-8d7f-4a56-9a62-21d11b90ddc9'}
-    >>> print vswitch.getSubnetId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
-    None
+        Get subnet details by *subnetId* for switch *uuid*
 
-    """
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param subnetId: subnet id
+        :type subnetId: string
+        :returns: Subnet details if exists, None otherwise
+        :raises: CvbnApiFailure
 
-    if self.getRunId(uuid) == None:
-        return None
+        >>> print vswitch.getSubnetId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","23c978ac-8d7f-4a56-9a62-21d11b90ddc9")
+        {u'network_id': u'33b97119-3d45-4790-b888-eb9e5e1c6430', u'ip_version': 4, u'allocation_pools': [{u'start': u'192.168.40.2', u'end': u'192.168.40.254'}], u'gateway_ip': u'192.168.40.1', u'tid': u'networking.subnet', u'cidr': u'192.168.40.0/24', u'id': u'23c978ac-8d7f-4a56-9a62-21d11b90ddc9'}
+        >>> print vswitch.getSubnetId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
+        None
 
-    params = {'tid':'networking.subnet'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        """
 
-        for instances in result['children']:
-                if instances['id'] == subnetId:
-                        return instances
-        return None
+        if self.getRunId(uuid) == None:
+            return None
+
+        return self._get_object(uuid, 'networking.subnet', subnetId)
 
     def deleteSubnet(self, uuid, subnetId):
-    """.. function:: deleteSubnet(uuid, subnetId):
+        """.. function:: deleteSubnet(uuid, subnetId):
 
-    Delete subnet by *subnetId* on switch *uuid*
+        Delete subnet by *subnetId* on switch *uuid*
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param subnetId: subnet id
-    :type subnetId: string
-    :returns: True if operation successful, False otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param subnetId: subnet id
+        :type subnetId: string
+        :returns: True if operation successful, False otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.deleteSubnet("ea2db47c-1cbe-4846-9ba6-141c3ac59508","23c978ac-8d7f-4a56-9a62-21d11b90ddc9")
-    True
-    >>> print vswitch.deleteSubnet("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
-    False
+        >>> print vswitch.deleteSubnet("ea2db47c-1cbe-4846-9ba6-141c3ac59508","23c978ac-8d7f-4a56-9a62-21d11b90ddc9")
+        True
+        >>> print vswitch.deleteSubnet("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
+        False
 
-    """
+        """
 
-    if self.getRunId(uuid) == None:
-        return False
-
-    if self.getSubnetId(uuid, subnetId) == None:
-        return False
+        if not self._guard(lambda: self.getRunId(uuid) != None,
+                           lambda: self._get_object(uuid, 'networking.subnet', subnetId) != None):
+            return False
 
-    params = {'tid':'networking.subnet','id':subnetId}
-    try:
-        result = self._delete_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        params = {'tid':'networking.subnet','id':subnetId}
+        if not self._delete(uuid, params):
+            return False
 
-    return True
+        ipam = self._indexes.get(('gre', uuid))
+        if ipam != None:
+            ipam.removeSubnet(subnetId)
+        index = self._indexes.get(('cidr', uuid))
+        if index != None:
+            index.remove(subnetId)
+        return True
 
     def addDomain(self, uuid, domainName):
-    """.. function:: addDomain(uuid, domainName):
+        """.. function:: addDomain(uuid, domainName):
 
-    Add domain to switch. There is no check for domain's name uniqueness
+        Add domain to switch. There is no check for domain's name uniqueness
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainName: domain's name
-    :type domainName: string
-    :returns: domain's *id* if operation successful, None otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainName: domain's name
+        :type domainName: string
+        :returns: domain's *id* if operation successful, None otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.addDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "user1")
-    bf5f93ea-bf25-4514-bc80-93615a9bb785
-    >>> print vswitch.addDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "user1")
-    351ae2bf-047e-406e-913e-0215ed91c2d2
+        >>> print vswitch.addDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "user1")
+        bf5f93ea-bf25-4514-bc80-93615a9bb785
+        >>> print vswitch.addDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "user1")
+        351ae2bf-047e-406e-913e-0215ed91c2d2
 
-    """
-
-    if self.getRunId(uuid) == None:
-        return None
+        """
 
-    params = {}
-    params['tid'] = 'networking.vswitch.domain'
-    params['vswitch'] = self.getNetworkingId(uuid)
-    params['name'] = domainName
-    try:
-        result = self._set_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        # getNetworkingId checks that the switch is running
+        networking = self.getNetworkingId(uuid)
+        if networking == None:
+            return None
 
-    return result['id']
+        params = {}
+        params['tid'] = 'networking.vswitch.domain'
+        params['vswitch'] = networking
+        params['name'] = domainName
+        return self._set(uuid, params)
 
     def getDomains(self, uuid):
-    """.. function:: getDomains(uuid):
+        """.. function:: getDomains(uuid):
 
-    Get all domains details on the switch instance
+        Get all domains details on the switch instance
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: array of domains details if operation successful, None otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: array of domains details if operation successful, None otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.getDomains("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    []
-    >>> print vswitch.getDomains("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    [{u'tid': u'networking.vswitch.domain', u'vswitch': {u'tid': u'networking.vswitch', u'id': u'69970943-8ad6-45ec-820d-58dca4d3ca82'}, u'name': u'user1', u'id': u'bf5f93ea-bf25-4514-bc80-93615a9bb785'}]
+        >>> print vswitch.getDomains("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        []
+        >>> print vswitch.getDomains("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        [{u'tid': u'networking.vswitch.domain', u'vswitch': {u'tid': u'networking.vswitch', u'id': u'69970943-8ad6-45ec-820d-58dca4d3ca82'}, u'name': u'user1', u'id': u'bf5f93ea-bf25-4514-bc80-93615a9bb785'}]
 
-    """
+        """
 
-    if self.getRunId(uuid) == None:
-        return None
+        if self.getRunId(uuid) == None:
+            return None
 
-    params = {'tid':'networking.vswitch.domain'}
-    try:
-            result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        return list(self._walk(uuid, 'networking.vswitch.domain'))
 
-    return result['children']
+    def iterDomains(self, uuid):
+        """.. function:: iterDomains(uuid)
 
-    def getDomainId(self, uuid, domainId):
-    """.. function:: getDomainId(uuid, domainId):
+        Generator variant of *getDomains*. Yields domains one at a time, nothing if switch is not running.
+        Nothing is requested before the first item is consumed.
 
-    Get domain's details by domain id.
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: generator of domains
+        :raises: CvbnApiFailure
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainId: domain's id
-    :type domainId: string
-    :returns: domain's details if operation successful, None otherwise
-    :raises: CvbnApiFailure
+        >>> print [domain['name'] for domain in vswitch.iterDomains("ea2db47c-1cbe-4846-9ba6-141c3ac59508")]
+        [u'user1']
 
-    >>> print vswitch.getDomainId("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785")
-    {u'tid': u'networking.vswitch.domain', u'vswitch': {u'tid': u'networking.vswitch', u'id': u'69970943-8ad6-45ec-820d-58dca4d3ca82'}, u'name': u'user1', u'id': u'bf5f93ea-bf25-4514-bc80-93615a9bb785'}
-    >>> print vswitch.getDomainId("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
-    None
+        """
+        if self.getRunId(uuid) == None:
+            return
 
-    """
-    if self.getRunId(uuid) == None:
-        return None
+        for instances in self._walk(uuid, 'networking.vswitch.domain'):
+            yield instances
 
-    params = {'tid':'networking.vswitch.domain'}
-    try:
-            result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+    def getDomainId(self, uuid, domainId):
+        """.. function:: getDomainId(uuid, domainId):
 
-    for instances in result['children']:
-        if instances['id'] == domainId:
-            return instances
-    return None
+        Get domain's details by domain id.
 
-    def getDomainName(self, uuid, domainName):
-    """.. function:: getDomainName(uuid, domainName):
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainId: domain's id
+        :type domainId: string
+        :returns: domain's details if operation successful, None otherwise
+        :raises: CvbnApiFailure
 
-    Get domain's details by domain name.
+        >>> print vswitch.getDomainId("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785")
+        {u'tid': u'networking.vswitch.domain', u'vswitch': {u'tid': u'networking.vswitch', u'id': u'69970943-8ad6-45ec-820d-58dca4d3ca82'}, u'name': u'user1', u'id': u'bf5f93ea-bf25-4514-bc80-93615a9bb785'}
+        >>> print vswitch.getDomainId("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
+        None
 
-    Domain name is not enforced to be unique in the data model. The first found object is returned.
+        """
+        if self.getRunId(uuid) == None:
+            return None
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainName: domain's name
-    :type domainName: string
-    :returns: domain's details if operation successful, None otherwise
-    :raises: CvbnApiFailure
+        return self._get_object(uuid, 'networking.vswitch.domain', domainId)
 
-    >>> print vswitch.getDomainName("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "user1")
-    {u'tid': u'networking.vswitch.domain', u'vswitch': {u'tid': u'networking.vswitch', u'id': u'69970943-8ad6-45ec-820d-58dca4d3ca82'}, u'name': u'user1', u'id': u'bf5f93ea-bf25-4514-bc80-93615a9bb785'}
-    >>> print vswitch.getDomainName("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
-    None
+    def getDomainName(self, uuid, domainName):
+        """.. function:: getDomainName(uuid, domainName):
 
-    """
-    if self.getRunId(uuid) == None:
-        return None
+        Get domain's details by domain name.
 
-    params = {'tid':'networking.vswitch.domain'}
-    try:
-            result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        Domain name is not enforced to be unique in the data model. The first found object is returned.
+
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainName: domain's name
+        :type domainName: string
+        :returns: domain's details if operation successful, None otherwise
+        :raises: CvbnApiFailure
+
+        >>> print vswitch.getDomainName("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "user1")
+        {u'tid': u'networking.vswitch.domain', u'vswitch': {u'tid': u'networking.vswitch', u'id': u'69970943-8ad6-45ec-820d-58dca4d3ca82'}, u'name': u'user1', u'id': u'bf5f93ea-bf25-4514-bc80-93615a9bb785'}
+        >>> print vswitch.getDomainName("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
+        None
+
+        """
+        if self.getRunId(uuid) == None:
+            return None
 
-    for instances in result['children']:
-        if instances['name'] == domainName:
+        for instances in self._walk(uuid, 'networking.vswitch.domain', {'name':domainName}):
             return instances
-    return None
+        return None
 
     def deleteDomain(self, uuid, domainId):	
-    """.. function:: deleteDomain(uuid, domainId):
+        """.. function:: deleteDomain(uuid, domainId):
 
-    Delete domain defined on the switch with all dependencies
+        Delete domain defined on the switch with all dependencies
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainId: domain's id
-    :type domainId: string
-    :returns: True if operation successful, False otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainId: domain's id
+        :type domainId: string
+        :returns: True if operation successful, False otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.deleteDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "351ae2bf-047e-406e-913e-0215ed91c2d2")
-    True
-    >>> print vswitch.deleteDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
-    False
+        >>> print vswitch.deleteDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "351ae2bf-047e-406e-913e-0215ed91c2d2")
+        True
+        >>> print vswitch.deleteDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
+        False
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
+        """
 
-    if self.getDomainId(uuid, domainId) == None:
-        return False
+        if not self._guard(lambda: self.getRunId(uuid) != None,
+                           lambda: self._get_object(uuid, 'networking.vswitch.domain', domainId) != None):
+            return False
 
-    if not self.deleteDomainPorts(uuid, domainId):
-        return False
+        if not self.deleteDomainPorts(uuid, domainId):
+            return False
 
-    params = {'tid':'networking.vswitch.domain','id':domainId}
-    try:
-        result = self._delete_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-    return True
+        params = {'tid':'networking.vswitch.domain','id':domainId}
+        return self._delete(uuid, params)
 
     def deleteDomainPorts(self, uuid, domainId):
-    """.. function:: deleteDomainPorts(uuid, domainId):
+        """.. function:: deleteDomainPorts(uuid, domainId):
 
-    Delete all port objects associated with domain defined on the switch
+        Delete all port objects associated with domain defined on the switch
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainId: domain's id
-    :type domainId: string
-    :returns: True if operation successful, False otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainId: domain's id
+        :type domainId: string
+        :returns: True if operation successful, False otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.deleteDomainPorts("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785")
-    True
-
-    """
-    if self.getRunId(uuid) == None:
-        return False
+        >>> print vswitch.deleteDomainPorts("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785")
+        True
 
-    if self.getDomainId(uuid, domainId) == None:
-        return False
+        """
 
-    params = {'tid':'networking.vswitch.domain.ports'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        if not self._guard(lambda: self.getRunId(uuid) != None,
+                           lambda: self._get_object(uuid, 'networking.vswitch.domain', domainId) != None):
+            return False
 
-    for instances in result['children']:
-        if instances['domain']['id'] == domainId:
+        for instances in self._walk(uuid, 'networking.vswitch.domain.ports', {'domain.id':domainId}, preflight = True):
             if instances['port']['tid'] == "networking.port.gre":
                 self.deletePortGreDomain(uuid, domainId, instances['port']['id'])
                 self.deletePortGre(uuid, instances['port']['id'])
@@ -1100,783 +1229,629 @@ class vswitch(object):
                 self.deletePortVlanDomain(uuid, domainId, instances['port']['id'])
                 self.deletePortVlan(uuid, instances['port']['id'])
 
-    return True
+        return True
 
     def addPortGreDomain(self, uuid, domainId, portId):
-    """.. function:: addPortGreDomain(uuid, domainId, portId):
-
-    Add GRE port to domain
-
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainId: domain's id
-    :type domainId: string
-    :param portId: port's id
-    :type portId: string
-    :returns: True if operation successful, False otherwise
-    :raises: CvbnApiFailure
+        """.. function:: addPortGreDomain(uuid, domainId, portId):
 
-    >>> print vswitch.addPortGreDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785","f1739786-38e0-4158-b337-9fd25aae3eb8")
-    True
+        Add GRE port to domain
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
-
-    if self.getDomainId(uuid, domainId) == None:
-        return False
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainId: domain's id
+        :type domainId: string
+        :param portId: port's id
+        :type portId: string
+        :returns: True if operation successful, False otherwise
+        :raises: CvbnApiFailure
 
-    if self.getPortGreId(uuid, portId) == None:
-        return False
-
-    if self.isPortGreDomain(uuid, domainId, portId):
-        return False
+        >>> print vswitch.addPortGreDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785","f1739786-38e0-4158-b337-9fd25aae3eb8")
+        True
 
-    params = {}
-    params['tid'] = "networking.vswitch.domain.ports"
-    params['domain'] = {'tid':'networking.vswitch.domain','id':domainId}
-    params['port'] = {'tid':'networking.port.gre','id':portId}
-    try:
-        result = self._set_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    return True
-
-    def isPortGreDomain(self, uuid, domainId, portId):
-    """.. function:: isPortGreDomain(uuid, domainId, portId):
-
-    Check if GRE port is member of domain
-
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainId: domain's id
-    :type domainId: string
-    :param portId: port's id
-    :type portId: string
-    :returns: True if GRE port is member of domain, False otherwise
-    :raises: CvbnApiFailure
-
-    >>> print vswitch.isPortGreDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785","f1739786-38e0-4158-b337-9fd25aae3eb8")
-    True
-
-    """
-    if self.getRunId(uuid) == None:
-        return False
-
-    if self.getDomainId(uuid, domainId) == None:
-        return False
+        """
 
-    if self.getPortGreId(uuid, portId) == None:
-        return False
-
-    params = {'tid':'networking.vswitch.domain.ports'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    for instances in result['children']:
-        if instances['domain']['id'] == domainId:
-            if instances['port']['tid'] == "networking.port.gre":
-                if instances['port']['id'] == portId:
-                    return True
+        if not self._guard(lambda: self.getRunId(uuid) != None,
+                           lambda: self._get_object(uuid, 'networking.vswitch.domain', domainId) != None,
+                           lambda: self._get_object(uuid, 'networking.port.gre', portId) != None,
+                           lambda: not self._isDomainPort(uuid, domainId, 'networking.port.gre', portId)):
+            return False
 
-    return False
+        params = {}
+        params['tid'] = 'networking.vswitch.domain.ports'
+        params['domain'] = {'tid':'networking.vswitch.domain','id':domainId}
+        params['port'] = {'tid':'networking.port.gre','id':portId}
+        return self._set(uuid, params) != None
 
     def deletePortGreDomain(self,uuid,domainId,portId):
-    """.. function:: deletePortGreDomain(uuid, domainId, portId):
-
-    Delete GRE port from domain
+        """.. function:: deletePortGreDomain(uuid, domainId, portId):
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainId: domain's id
-    :type domainId: string
-    :param portId: port's id
-    :type portId: string
-    :returns: True if operation successful, False otherwise
-    :raises: CvbnApiFailure
+        Delete GRE port from domain
 
-    >>> print vswitch.deletePortGreDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785","f1739786-38e0-4158-b337-9fd25aae3eb8")
-    True
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainId: domain's id
+        :type domainId: string
+        :param portId: port's id
+        :type portId: string
+        :returns: True if operation successful, False otherwise
+        :raises: CvbnApiFailure
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
+        >>> print vswitch.deletePortGreDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785","f1739786-38e0-4158-b337-9fd25aae3eb8")
+        True
 
-    if self.getDomainId(uuid, domainId) == None:
-        return False
-
-    if not self.isPortGreDomain(uuid, domainId, portId):
-        return False
+        """
 
-    params = {}
-    params['tid'] = "networking.vswitch.domain.ports"
-    params['domain'] = {'tid':'networking.vswitch.domain','id':domainId}
-    params['port'] = {'tid':'networking.port.gre','id':portId}
-    try:
-        result = self._delete_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        if not self._guard(lambda: self.getRunId(uuid) != None,
+                           lambda: self._get_object(uuid, 'networking.vswitch.domain', domainId) != None,
+                           lambda: self._isDomainPort(uuid, domainId, 'networking.port.gre', portId)):
+            return False
 
-    return True
+        params = {}
+        params['tid'] = 'networking.vswitch.domain.ports'
+        params['domain'] = {'tid':'networking.vswitch.domain','id':domainId}
+        params['port'] = {'tid':'networking.port.gre','id':portId}
+        return self._delete(uuid, params)
 
     def addPortVlanDomain(self, uuid, domainId, portId):
-    """.. function:: addPortVlanDomain(uuid, domainId, portId):
+        """.. function:: addPortVlanDomain(uuid, domainId, portId):
 
-    Add VLAN port to domain.
+        Add VLAN port to domain.
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainId: domain's id
-    :type domainId: string
-    :param portId: port's id
-    :type portId: string
-    :returns: True if operation successful, False otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainId: domain's id
+        :type domainId: string
+        :param portId: port's id
+        :type portId: string
+        :returns: True if operation successful, False otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.addPortVlanDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785", "e07cc20e-75f2-4738-abd3-a4dd6ae172d7")
-    True
+        >>> print vswitch.addPortVlanDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785", "e07cc20e-75f2-4738-abd3-a4dd6ae172d7")
+        True
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
+        """
 
-    if self.getDomainId(uuid, domainId) == None:
-        return False
-
-    if self.getPortVlanId(uuid, portId) == None:
-        return False
-
-    if self.isPortVlanDomain(uuid, domainId, portId):
-        return False
-
-    params = {}
-    params['tid'] = 'networking.vswitch.domain.ports'
-    params['domain'] = {'tid':'networking.vswitch.domain','id':domainId}
-    params['port'] = {'tid':'networking.port.raw','id':portId}
-    try:
-        result = self._set_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        if not self._guard(lambda: self.getRunId(uuid) != None,
+                           lambda: self._get_object(uuid, 'networking.vswitch.domain', domainId) != None,
+                           lambda: self._get_object(uuid, 'networking.port.raw', portId) != None,
+                           lambda: not self._isDomainPort(uuid, domainId, 'networking.port.raw', portId)):
+            return False
 
-    return True
+        params = {}
+        params['tid'] = 'networking.vswitch.domain.ports'
+        params['domain'] = {'tid':'networking.vswitch.domain','id':domainId}
+        params['port'] = {'tid':'networking.port.raw','id':portId}
+        return self._set(uuid, params) != None
 
     def isPortVlanDomain(self, uuid, domainId, portId):
-    """.. function:: isPortVlanDomain(uuid, domainId, portId):
+        """.. function:: isPortVlanDomain(uuid, domainId, portId):
 
-    Check if VLAN port is member of domain
+        Check if VLAN port is member of domain
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainId: domain's id
-    :type domainId: string
-    :param portId: port's id
-    :type portId: string
-    :returns: True if GRE port is member of domain, False otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainId: domain's id
+        :type domainId: string
+        :param portId: port's id
+        :type portId: string
+        :returns: True if GRE port is member of domain, False otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.isPortVlanDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785", "e07cc20e-75f2-4738-abd3-a4dd6ae172d7")
-    True
+        >>> print vswitch.isPortVlanDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785", "e07cc20e-75f2-4738-abd3-a4dd6ae172d7")
+        True
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
-
-    if self.getDomainId(uuid, domainId) == None:
-        return False
+        """
+        if self.getRunId(uuid) == None:
+            return False
 
-    if self.getPortVlanId(uuid, portId) == None:
-        return False
+        if self.getDomainId(uuid, domainId) == None:
+            return False
 
-    params = {'tid':'networking.vswitch.domain.ports'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        if self.getPortVlanId(uuid, portId) == None:
+            return False
 
-    for instances in result['children']:
-        if instances['domain']['id'] == domainId:
-            if instances['port']['tid'] == "networking.port.raw":
-                if instances['port']['id'] == portId:
-                    return True
+        filters = {'domain.id':domainId, 'port.tid':'networking.port.raw', 'port.id':portId}
+        for instances in self._walk(uuid, 'networking.vswitch.domain.ports', filters):
+            return True
 
-    return False
+        return False
 
     def deletePortVlanDomain(self,uuid,domainId,portId):
-    """.. function:: deletePortVlanDomain(uuid, domainId, portId):
+        """.. function:: deletePortVlanDomain(uuid, domainId, portId):
 
-    Delete VLAN port from domain
+        Delete VLAN port from domain
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param domainId: domain's id
-    :type domainId: string
-    :param portId: port's id
-    :type portId: string
-    :returns: True if operation successful, False otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param domainId: domain's id
+        :type domainId: string
+        :param portId: port's id
+        :type portId: string
+        :returns: True if operation successful, False otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.deletePortVlanDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785", "e07cc20e-75f2-4738-abd3-a4dd6ae172d7")
-    True
-    >>> print vswitch.deletePortVlanDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785", "wrong")
-    False
+        >>> print vswitch.deletePortVlanDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785", "e07cc20e-75f2-4738-abd3-a4dd6ae172d7")
+        True
+        >>> print vswitch.deletePortVlanDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "bf5f93ea-bf25-4514-bc80-93615a9bb785", "wrong")
+        False
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
+        """
 
-    if self.getDomainId(uuid, domainId) == None:
-        return False
-
-    if not self.isPortVlanDomain(uuid, domainId, portId):
-        return False
-
-    params = {}
-    params['tid'] = "networking.vswitch.domain.ports"
-    params['domain'] = {'tid':'networking.vswitch.domain','id':domainId}
-    params['port'] = {'tid':'networking.port.raw','id':portId}
-    try:
-        result = self._delete_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        if not self._guard(lambda: self.getRunId(uuid) != None,
+                           lambda: self._get_object(uuid, 'networking.vswitch.domain', domainId) != None,
+                           lambda: self._isDomainPort(uuid, domainId, 'networking.port.raw', portId)):
+            return False
 
-    return True
+        params = {}
+        params['tid'] = 'networking.vswitch.domain.ports'
+        params['domain'] = {'tid':'networking.vswitch.domain','id':domainId}
+        params['port'] = {'tid':'networking.port.raw','id':portId}
+        return self._delete(uuid, params)
 
     def addPortGre(self, uuid, subnetId, portName, local_ip = None, remote_ip = None, checksum = False, seqnum = False):
-    """.. function:: addPortGre(uuid, subnetId, portName, local_ip = None, remote_ip = None, checksum = False, seqnum = False):
-
-    Add port GRE to switch.
-
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param subnetId: subnet id
-    :type subnetId: string
-    :param portName: port's name
-    :type portName: string
-    :local_ip: local (on the switch) IP end of GRE tunnel
-    :type local_ip: string
-    :remote_ip: remote (on the pCPE or VM) IP end of GRE tunnel
-    :type remote_ip: string
-    :param checksum: is checksum enabled in GRE header
-    :type checksum: boolean (True, False)
-    :param seqnum: is sequence numbers enabled in GRE header
-    :type seqnum: boolean (True, False)
-    :returns: port's *id* if operation successful, None otherwise
-    :raises: CvbnApiFailure
-
-    >>> print vswitch.addPortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "e67d8e96-f887-4217-9ca6-ccb52d101d92", "gre10", local_ip = "192.168.30.10", remote_ip = None, checksum = False, seqnum = False)
-    f1739786-38e0-4158-b337-9fd25aae3eb8
-    >>> print vswitch.addPortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "e67d8e96-f887-4217-9ca6-ccb52d101d92", "gre10", local_ip = "192.168.30.10", remote_ip = None, checksum = False, seqnum = False)
-    ['']
-    inconsistent port usage
-    Traceback (most recent call last):
-      File "<stdin>", line 1, in <module>
-      File "cvbn_vswitch.py", line 1400, in addPortGre
-        raise CvbnApiFailure(err)
-    cvbn_vswitch.CvbnApiFailure: ['']
-    inconsistent port usage
-    >>> print vswitch.addPortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "e67d8e96-f887-4217-9ca6-ccb52d101d92", "gre10", local_ip = "192.168.32.10", remote_ip = None, checksum = False, seqnum = False)
-    ['']
-    192.168.32.10 is not in available subnet address range
-    Traceback (most recent call last):
-      File "<stdin>", line 1, in <module>
-      File "cvbn_vswitch.py", line 1400, in addPortGre
-        raise CvbnApiFailure(err)
-    cvbn_vswitch.CvbnApiFailure: ['']
-    192.168.32.10 is not in available subnet address range
-    >>> print vswitch.addPortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong", "gre10", local_ip = "192.168.30.10", remote_ip = None, checksum = False, seqnum = False)
-    None
+        """.. function:: addPortGre(uuid, subnetId, portName, local_ip = None, remote_ip = None, checksum = False, seqnum = False):
+
+        Add port GRE to switch.
+
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param subnetId: subnet id
+        :type subnetId: string
+        :param portName: port's name
+        :type portName: string
+        :local_ip: local (on the switch) IP end of GRE tunnel
+        :type local_ip: string
+        :remote_ip: remote (on the pCPE or VM) IP end of GRE tunnel
+        :type remote_ip: string
+        :param checksum: is checksum enabled in GRE header
+        :type checksum: boolean (True, False)
+        :param seqnum: is sequence numbers enabled in GRE header
+        :type seqnum: boolean (True, False)
+        :returns: port's *id* if operation successful, None otherwise
+        :raises: CvbnApiFailure
+
+        >>> print vswitch.addPortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "e67d8e96-f887-4217-9ca6-ccb52d101d92", "gre10", local_ip = "192.168.30.10", remote_ip = None, checksum = False, seqnum = False)
+        f1739786-38e0-4158-b337-9fd25aae3eb8
+        >>> print vswitch.addPortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "e67d8e96-f887-4217-9ca6-ccb52d101d92", "gre10", local_ip = "192.168.30.10", remote_ip = None, checksum = False, seqnum = False)
+        ['']
+        inconsistent port usage
+        Traceback (most recent call last):
+          File "<stdin>", line 1, in <module>
+          File "cvbn_vswitch.py", line 1400, in addPortGre
+            raise CvbnApiFailure(err)
+        cvbn_vswitch.CvbnApiFailure: ['']
+        inconsistent port usage
+        >>> print vswitch.addPortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "e67d8e96-f887-4217-9ca6-ccb52d101d92", "gre10", local_ip = "192.168.32.10", remote_ip = None, checksum = False, seqnum = False)
+        ['']
+        192.168.32.10 is not in available subnet address range
+        Traceback (most recent call last):
+          File "<stdin>", line 1, in <module>
+          File "cvbn_vswitch.py", line 1400, in addPortGre
+            raise CvbnApiFailure(err)
+        cvbn_vswitch.CvbnApiFailure: ['']
+        192.168.32.10 is not in available subnet address range
+        >>> print vswitch.addPortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong", "gre10", local_ip = "192.168.30.10", remote_ip = None, checksum = False, seqnum = False)
+        None
+
+        """
+
+        # endpoints are checked and reserved before the preflight lookups, so a rejected
+        # endpoint costs no RPC and a concurrent add of the same endpoint fails here
+        ipam = self._indexes.get(('gre', uuid))
+        claimed = []
+        if ipam != None:
+            reason, claimed = ipam.claim(subnetId, local_ip, remote_ip)
+            if reason != None:
+                err = '{}\n{}'.format(sys.argv, reason)
+                print >> sys.stderr, err
+                raise CvbnApiFailure(err)
+
+        portId = None
+        try:
+            if not self._guard(lambda: self.getRunId(uuid) != None,
+                               lambda: self._get_object(uuid, 'networking.subnet', subnetId) != None):
+                return None
+
+            if ipam != None and local_ip == None:
+                local_ip = ipam.allocate(subnetId)
+                if local_ip != None:
+                    claimed.append(local_ip)
+
+            params = {}
+            params['tid'] = 'networking.port.gre'
+            params['name'] = portName
+            params['local_subnet'] = subnetId
+            if local_ip == None:
+                params['local_endpoint'] = {}
+            else:
+                params['local_endpoint'] = {"ip_address":local_ip}
+            if remote_ip == None:
+                params['remote_endpoint'] = {}
+            else:
+                params['remote_endpoint'] = {"ip_address":remote_ip}
+            params['checksum_present'] = checksum
+            params['seq_num_present'] = seqnum
+            portId = self._set(uuid, params)
+        finally:
+            if ipam != None:
+                if portId == None:
+                    for ip in claimed:
+                        ipam.release(subnetId, ip)
+                else:
+                    params['id'] = portId
+                    ipam.addPort(params, claimed)
+        return portId
 
-    """
-    if self.getRunId(uuid) == None:
-        return None
+    def getPortsGre(self, uuid):
+        """.. function:: getPortsGre(uuid):
 
-    if self.getSubnetId(uuid, subnetId) == None:
-        return None
+        Get all GRE ports on the switch *uuid*
 
-    params = {}
-    params['tid'] = 'networking.port.gre'
-    params['name'] = portName
-    params['local_subnet'] = subnetId
-    if local_ip == None:
-        params['local_endpoint'] = {}
-    else:
-        params['local_endpoint'] = {"ip_address":local_ip}
-    if remote_ip == None:
-        params['remote_endpoint'] = {}
-    else:
-        params['remote_endpoint'] = {"ip_address":remote_ip}
-    params['checksum_present'] = checksum
-    params['seq_num_present'] = seqnum
-    try:
-        result = self._set_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: array of ports details if operation successful, None otherwise
+        :raises: CvbnApiFailure
 
-    return result['id']
+        >>> vswitch.getPortsGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        []
+        >>> print vswitch.getPortsGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        [{u'name': u'gre10', u'local_subnet': u'e67d8e96-f887-4217-9ca6-ccb52d101d92', u'checksum_present': False, u'local_endpoint': {u'ip_address': u'192.168.30.10'}, u'seq_num_present': False, u'mac_address': u'3a:26:2d:9c:84:4a', u'tid': u'networking.port.gre', u'id': u'f1739786-38e0-4158-b337-9fd25aae3eb8', u'remote_endpoint': {}}]
 
-    def getPortsGre(self, uuid):
-    """.. function:: getPortsGre(uuid):
+        """
+        if self.getRunId(uuid) == None:
+            return None
 
-    Get all GRE ports on the switch *uuid*
+        return list(self._walk(uuid, 'networking.port.gre'))
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: array of ports details if operation successful, None otherwise
-    :raises: CvbnApiFailure
+    def iterPortsGre(self, uuid):
+        """.. function:: iterPortsGre(uuid)
 
-    >>> vswitch.getPortsGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    []
-    >>> print vswitch.getPortsGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    [{u'name': u'gre10', u'local_subnet': u'e67d8e96-f887-4217-9ca6-ccb52d101d92', u'checksum_present': False, u'local_endpoint': {u'ip_address': u'192.168.30.10'}, u'seq_num_present': False, u'mac_address': u'3a:26:2d:9c:84:4a', u'tid': u'networking.port.gre', u'id': u'f1739786-38e0-4158-b337-9fd25aae3eb8', u'remote_endpoint': {}}]
+        Generator variant of *getPortsGre*. Yields GRE ports one at a time, nothing if switch is not running.
+        Nothing is requested before the first item is consumed.
 
-    """
-    if self.getRunId(uuid) == None:
-        return None
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: generator of GRE ports
+        :raises: CvbnApiFailure
 
-    params = {'tid':'networking.port.gre'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        >>> print [port['name'] for port in vswitch.iterPortsGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508")]
+        [u'gre10']
 
-    return result['children']
+        """
+        if self.getRunId(uuid) == None:
+            return
+
+        for instances in self._walk(uuid, 'networking.port.gre'):
+            yield instances
 
     def getPortGreId(self, uuid, portId):
-    """.. function:: getPortGreId(uuid, portId):
+        """.. function:: getPortGreId(uuid, portId):
 
-    Get port GRE details by id
+        Get port GRE details by id
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param portId: port's id
-    :type portId: string
-    :returns: port's details if operation successful, None otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param portId: port's id
+        :type portId: string
+        :returns: port's details if operation successful, None otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.getPortGreId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","f1739786-38e0-4158-b337-9fd25aae3eb8")
-    {u'name': u'gre10', u'local_subnet': u'e67d8e96-f887-4217-9ca6-ccb52d101d92', u'checksum_present': False, u'local_endpoint': {u'ip_address': u'192.168.30.10'}, u'seq_num_present': False, u'mac_address': u'3a:26:2d:9c:84:4a', u'tid': u'networking.port.gre', u'id': u'f1739786-38e0-4158-b337-9fd25aae3eb8', u'remote_endpoint': {}}
-    >>> print vswitch.getPortGreId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
-    None
+        >>> print vswitch.getPortGreId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","f1739786-38e0-4158-b337-9fd25aae3eb8")
+        {u'name': u'gre10', u'local_subnet': u'e67d8e96-f887-4217-9ca6-ccb52d101d92', u'checksum_present': False, u'local_endpoint': {u'ip_address': u'192.168.30.10'}, u'seq_num_present': False, u'mac_address': u'3a:26:2d:9c:84:4a', u'tid': u'networking.port.gre', u'id': u'f1739786-38e0-4158-b337-9fd25aae3eb8', u'remote_endpoint': {}}
+        >>> print vswitch.getPortGreId("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
+        None
 
-    """
-    if self.getRunId(uuid) == None:
-        return None
-
-    params = {'tid':'networking.port.gre'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    for instances in result['children']:
-        if instances['id'] == portId:
-            return instances
+        """
+        if self.getRunId(uuid) == None:
+            return None
 
-    return None
+        return self._get_object(uuid, 'networking.port.gre', portId)
 
     def getPortGreName(self, uuid, portName):
-    """.. function:: getPortGreName(uuid, portName):
-
-    Get port GRE details by port name
+        """.. function:: getPortGreName(uuid, portName):
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param portName: port's name
-    :type portName: string
-    :returns: port's details if operation successful, None otherwise
-    :raises: CvbnApiFailure
+        Get port GRE details by port name
 
-    >>> print vswitch.getPortGreName("ea2db47c-1cbe-4846-9ba6-141c3ac59508","gre10")
-    {u'name': u'gre10', u'local_subnet': u'e67d8e96-f887-4217-9ca6-ccb52d101d92', u'checksum_present': False, u'local_endpoint': {u'ip_address': u'192.168.30.10'}, u'seq_num_present': False, u'mac_address': u'3a:26:2d:9c:84:4a', u'tid': u'networking.port.gre', u'id': u'f1739786-38e0-4158-b337-9fd25aae3eb8', u'remote_endpoint': {}}
-    >>> print vswitch.getPortGreName("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
-    None
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param portName: port's name
+        :type portName: string
+        :returns: port's details if operation successful, None otherwise
+        :raises: CvbnApiFailure
 
-    """
-    if self.getRunId(uuid) == None:
-        return None
+        >>> print vswitch.getPortGreName("ea2db47c-1cbe-4846-9ba6-141c3ac59508","gre10")
+        {u'name': u'gre10', u'local_subnet': u'e67d8e96-f887-4217-9ca6-ccb52d101d92', u'checksum_present': False, u'local_endpoint': {u'ip_address': u'192.168.30.10'}, u'seq_num_present': False, u'mac_address': u'3a:26:2d:9c:84:4a', u'tid': u'networking.port.gre', u'id': u'f1739786-38e0-4158-b337-9fd25aae3eb8', u'remote_endpoint': {}}
+        >>> print vswitch.getPortGreName("ea2db47c-1cbe-4846-9ba6-141c3ac59508","wrong")
+        None
 
-    params = {'tid':'networking.port.gre'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        """
+        if self.getRunId(uuid) == None:
+            return None
 
-    for instances in result['children']:
-        if instances['name'] == portName:
+        for instances in self._walk(uuid, 'networking.port.gre', {'name':portName}):
             return instances
 
-    return None
+        return None
 
     def isPortGreDomain(self, uuid, portId, domainId):
-    """.. function:: isPortGreDomain(uuid, portId, domainId):
+        """.. function:: isPortGreDomain(uuid, portId, domainId):
 
-    Check if port GRE is member of domain
+        Check if port GRE is member of domain
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param portId: port's id
-    :type portId: string
-    :param domainId: domain's id
-    :type domainId: string
-    :returns: True if yes, False otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param portId: port's id
+        :type portId: string
+        :param domainId: domain's id
+        :type domainId: string
+        :returns: True if yes, False otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.isPortGreDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508","57da5612-1f87-4dc8-a7c4-8c70f732e2b2","bf5f93ea-bf25-4514-bc80-93615a9bb785")
-    True
+        >>> print vswitch.isPortGreDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508","57da5612-1f87-4dc8-a7c4-8c70f732e2b2","bf5f93ea-bf25-4514-bc80-93615a9bb785")
+        True
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
-
-    params = {'tid':'networking.vswitch.domain.ports'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        """
+        if self.getRunId(uuid) == None:
+            return False
 
-    for instances in result['children']:
-        if instances['domain']['id'] == domainId:
-            if instances['port']['tid'] == "networking.port.gre":
-                if instances['port']['id'] == portId:
-                    return True
+        filters = {'domain.id':domainId, 'port.tid':'networking.port.gre', 'port.id':portId}
+        for instances in self._walk(uuid, 'networking.vswitch.domain.ports', filters):
+            return True
 
-    return False
+        return False
 
     def isPortGreAnyDomain(self, uuid, portId):
-    """.. function:: isPortGreAnyDomain(uuid, portId):
+        """.. function:: isPortGreAnyDomain(uuid, portId):
 
-    Check if port GRE is member of any domain
+        Check if port GRE is member of any domain
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param portId: port's id
-    :type portId: string
-    :returns: True if yes, False otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param portId: port's id
+        :type portId: string
+        :returns: True if yes, False otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.isPortGreAnyDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508","57da5612-1f87-4dc8-a7c4-8c70f732e2b2")
-    True
+        >>> print vswitch.isPortGreAnyDomain("ea2db47c-1cbe-4846-9ba6-141c3ac59508","57da5612-1f87-4dc8-a7c4-8c70f732e2b2")
+        True
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
+        """
+        if self.getRunId(uuid) == None:
+            return False
+
+        return self._isPortGreAnyDomain(uuid, portId)
 
-    for domain in self.getDomains(uuid):
-        if self.isPortGreDomain(uuid, portId, domain['id']):
+    def _isPortGreAnyDomain(self, uuid, portId):
+        '''one filtered walk of domain memberships of the port (switch known to be running)'''
+        filters = {'port.tid':'networking.port.gre', 'port.id':portId}
+        for instances in self._walk(uuid, 'networking.vswitch.domain.ports', filters):
             return True
 
-    return False
+        return False
 
     def deletePortGre(self, uuid, portId):
-    """.. function:: deletePortGre(uuid, portId):
-
-    Delete port GRE
+        """.. function:: deletePortGre(uuid, portId):
 
-    If port GRE is member of domain, the delete operation should fail.
+        Delete port GRE
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param portId: port's id
-    :type portId: string
-    :returns: True if operation successful, False otherwise
-    :raises: CvbnApiFailure
+        If port GRE is member of domain, the delete operation should fail.
 
-    >>> print vswitch.deletePortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508","57da5612-1f87-4dc8-a7c4-8c70f732e2b2")
-    True
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param portId: port's id
+        :type portId: string
+        :returns: True if operation successful, False otherwise
+        :raises: CvbnApiFailure
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
+        >>> print vswitch.deletePortGre("ea2db47c-1cbe-4846-9ba6-141c3ac59508","57da5612-1f87-4dc8-a7c4-8c70f732e2b2")
+        True
 
-    if self.getPortGreId(uuid, portId) == None:
-        return False
+        """
 
-    if self.isPortGreAnyDomain(uuid, portId):
-        return False
+        if not self._guard(lambda: self.getRunId(uuid) != None,
+                           lambda: self._get_object(uuid, 'networking.port.gre', portId) != None,
+                           lambda: not self._isPortGreAnyDomain(uuid, portId)):
+            return False
 
-    params = {'tid':'networking.port.gre','id':portId}
-    try:
-        result = self._delete_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        params = {'tid':'networking.port.gre','id':portId}
+        if not self._delete(uuid, params):
+            return False
 
-    return True
+        ipam = self._indexes.get(('gre', uuid))
+        if ipam != None:
+            ipam.removePort(portId)
+        return True
 
     def addPortVlan(self, uuid, networkId, portName, vlan):
-    """.. function:: addPortVlan(uuid, networkId, portName, vlan):
-
-    Add port VLAN to switch.
-
-    If VLAN is already defined on the target interface, the API should fail (CvbnApiFailure)
+        """.. function:: addPortVlan(uuid, networkId, portName, vlan):
+
+        Add port VLAN to switch.
+
+        If VLAN is already defined on the target interface, the API should fail (CvbnApiFailure)
+
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param networkId: network id
+        :type networkId: string
+        :param portName: port's name
+        :type portName: string
+        :param vlan: vlan value; None picks free VLAN once *vlanIndex(uuid)* was built
+        :type vlan: string
+        :returns: port's *id* if operation successful, None otherwise
+        :raises: CvbnApiFailure, also if *vlan* is None and no free VLAN can be picked
+
+        >>> print vswitch.addPortVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "33b97119-3d45-4790-b888-eb9e5e1c6430", "vlan666", "666")
+        45233226-f003-4aa6-9553-5cbfe6424626
+        >>> print vswitch.addPortVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong", "vlan666", "666")
+        None
+
+        # ip addr
+        5: eth1.666@eth1: <BROADCAST,MULTICAST,PROMISC,UP,LOWER_UP> mtu 1500 qdisc noqueue state UP group default link/ether 00:50:56:b4:a1:3a brd ff:ff:ff:ff:ff:ff
+
+        """
+
+        # VLAN is claimed (or picked) before the preflight lookups, so a rejected or
+        # missing VLAN costs no RPC and concurrent adds of one VLAN can not both pass
+        index = self._indexes.get(('vlan', uuid))
+        allocated = None
+        reason = None
+        if vlan != None:
+            if index != None:
+                reason, allocated = index.claim(networkId, vlan)
+        elif index == None:
+            reason = cvbn_vlan.INVALID.format(vlan)
+        else:
+            allocated = index.allocate(networkId)
+            if allocated == None:
+                reason = cvbn_vlan.NO_FREE.format(networkId)
+            else:
+                vlan = str(allocated)
+        if reason != None:
+            err = '{}\n{}'.format(sys.argv, reason)
+            print >> sys.stderr, err
+            raise CvbnApiFailure(err)
+
+        portId = None
+        try:
+            if not self._guard(lambda: self.getRunId(uuid) != None,
+                               lambda: self._get_object(uuid, 'networking.network', networkId) != None):
+                return None
+
+            params = {}
+            params['tid'] = 'networking.port.raw'
+            params['name'] = portName
+            params['network_id'] = networkId
+            params['vlan_ids'] = [vlan]
+            portId = self._set(uuid, params)
+        finally:
+            if index != None:
+                if portId == None:
+                    if allocated != None:
+                        index.release(networkId, allocated)
+                else:
+                    index.addPort({'id':portId, 'network_id':networkId, 'vlan_ids':[vlan]})
+        return portId
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param networkId: network id
-    :type networkId: string
-    :param portName: port's name
-    :type portName: string
-    :param vlan: vlan value
-    :type vlan: string
-    :returns: port's *id* if operation successful, None otherwise
-    :raises: CvbnApiFailure
+    def getPortsVlan(self, uuid):
+        """.. function:: getPortsVlan(uuid):
 
-    >>> print vswitch.addPortVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "33b97119-3d45-4790-b888-eb9e5e1c6430", "vlan666", "666")
-    45233226-f003-4aa6-9553-5cbfe6424626
-    >>> print vswitch.addPortVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong", "vlan666", "666")
-    None
+        Get all VLAN ports created on vSwitch *uuid*
 
-    # ip addr
-    5: eth1.666@eth1: <BROADCAST,MULTICAST,PROMISC,UP,LOWER_UP> mtu 1500 qdisc noqueue state UP group default link/ether 00:50:56:b4:a1:3a brd ff:ff:ff:ff:ff:ff
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: array of ports if operation successful, None otherwise
+        :raises: CvbnApiFailure
 
-    """
+        >>> print vswitch.getPortsVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        []
+        >>> print vswitch.getPortsVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
+        [{u'name': u'vlan666', u'network_id': u'33b97119-3d45-4790-b888-eb9e5e1c6430', u'host_interface': u'eth1.666', u'vlan_id': [666], u'mac_address': u'02:1e:69:02:e6:a9', u'tid': u'networking.port.raw', u'id': u'45233226-f003-4aa6-9553-5cbfe644626'}]
 
-    if self.getRunId(uuid) == None:
-        return None
-
-    if self.getNetworkId(uuid, networkId) == None:
-        return None
+        """
+        if self.getRunId(uuid) == None:
+            return None
 
-    params = {}
-    params['tid'] = 'networking.port.raw'
-    params['name'] = portName
-    params['network_id'] = networkId
-    params['vlan_ids'] = [vlan]
-    try:
-        result = self._set_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        return list(self._walk(uuid, 'networking.port.raw'))
 
-    return result['id']
+    def iterPortsVlan(self, uuid):
+        """.. function:: iterPortsVlan(uuid)
 
-    def getPortsVlan(self, uuid):
-    """.. function:: getPortsVlan(uuid):
+        Generator variant of *getPortsVlan*. Yields VLAN ports one at a time, nothing if switch is not running.
+        Nothing is requested before the first item is consumed.
 
-    Get all VLAN ports created on vSwitch *uuid*
+        :param uuid: Switch instance id
+        :type uuid: string
+        :returns: generator of VLAN ports
+        :raises: CvbnApiFailure
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :returns: array of ports if operation successful, None otherwise
-    :raises: CvbnApiFailure
+        >>> print [port['name'] for port in vswitch.iterPortsVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508")]
+        [u'vlan666']
 
-    >>> print vswitch.getPortsVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    []
-    >>> print vswitch.getPortsVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508")
-    [{u'name': u'vlan666', u'network_id': u'33b97119-3d45-4790-b888-eb9e5e1c6430', u'host_interface': u'eth1.666', u'vlan_id': [666], u'mac_address': u'02:1e:69:02:e6:a9', u'tid': u'networking.port.raw', u'id': u'45233226-f003-4aa6-9553-5cbfe644626'}]
+        """
+        if self.getRunId(uuid) == None:
+            return
 
-    """
-    if self.getRunId(uuid) == None:
-        return None
-
-    params = {'tid':'networking.port.raw'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    return result['children']
+        for instances in self._walk(uuid, 'networking.port.raw'):
+            yield instances
 
     def getPortVlanId(self, uuid, portId):
-    """.. function:: getPortVlanId(uuid, portId):
+        """.. function:: getPortVlanId(uuid, portId):
 
-    Get port VLAN details by id
+        Get port VLAN details by id
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param portId: port's id
-    :type portId: string
-    :returns: port's details if operation successful, None otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param portId: port's id
+        :type portId: string
+        :returns: port's details if operation successful, None otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.getPortVlanId("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "45233226-f003-4aa6-9553-5cbfe6424626")
-    {u'name': u'vlan666', u'network_id': u'33b97119-3d45-4790-b888-eb9e5e1c6430', u'host_interface': u'eth1.666', u'vlan_ids': [666], u'mac_address': u'02:1e:69:02:e6:a9', u'tid': u'networking.port.raw', u'id': u'45233226-f003-4aa6-9553-5cbfe6424626'}
+        >>> print vswitch.getPortVlanId("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "45233226-f003-4aa6-9553-5cbfe6424626")
+        {u'name': u'vlan666', u'network_id': u'33b97119-3d45-4790-b888-eb9e5e1c6430', u'host_interface': u'eth1.666', u'vlan_ids': [666], u'mac_address': u'02:1e:69:02:e6:a9', u'tid': u'networking.port.raw', u'id': u'45233226-f003-4aa6-9553-5cbfe6424626'}
 
-    # ip addr
-    5: eth1.666@eth1: <BROADCAST,MULTICAST,PROMISC,UP,LOWER_UP> mtu 1500 qdisc noqueue state UP group default link/ether 00:50:56:b4:a1:3a brd ff:ff:ff:ff:ff:ff
+        # ip addr
+        5: eth1.666@eth1: <BROADCAST,MULTICAST,PROMISC,UP,LOWER_UP> mtu 1500 qdisc noqueue state UP group default link/ether 00:50:56:b4:a1:3a brd ff:ff:ff:ff:ff:ff
 
-    """
-    if self.getRunId(uuid) == None:
-        return None
-
-    params = {'tid':'networking.port.raw'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    for instances in result['children']:
-        if instances['id'] == portId:
-            return instances
+        """
+        if self.getRunId(uuid) == None:
+            return None
 
-    return None
+        return self._get_object(uuid, 'networking.port.raw', portId)
 
     def getPortVlanName(self, uuid, portName):
-    """.. function:: getPortVlanName(uuid, portName):
-
-    Get port VLAN details by port name
+        """.. function:: getPortVlanName(uuid, portName):
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param portName: port's name
-    :type portName: string
-    :returns: port's details if operation successful, None otherwise
-    :raises: CvbnApiFailure
+        Get port VLAN details by port name
 
-    >>> print vswitch.getPortVlanName("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "vlan666")
-    {u'name': u'vlan666', u'network_id': u'33b97119-3d45-4790-b888-eb9e5e1c6430', u'host_interface': u'eth1.666', u'vlan_ids': [666], u'mac_address': u'02:1e:69:02:e6:a9', u'tid': u'networking.port.raw', u'id': u'45233226-f003-4aa6-9553-5cbfe6424626'}
-    >>> print vswitch.getPortVlanName("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
-    None
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param portName: port's name
+        :type portName: string
+        :returns: port's details if operation successful, None otherwise
+        :raises: CvbnApiFailure
 
-    """
-    if self.getRunId(uuid) == None:
-        return None
+        >>> print vswitch.getPortVlanName("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "vlan666")
+        {u'name': u'vlan666', u'network_id': u'33b97119-3d45-4790-b888-eb9e5e1c6430', u'host_interface': u'eth1.666', u'vlan_ids': [666], u'mac_address': u'02:1e:69:02:e6:a9', u'tid': u'networking.port.raw', u'id': u'45233226-f003-4aa6-9553-5cbfe6424626'}
+        >>> print vswitch.getPortVlanName("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
+        None
 
-    params = {'tid':'networking.port.raw'}
-    try:
-        result = self._walk_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
+        """
+        if self.getRunId(uuid) == None:
+            return None
 
-    for instances in result['children']:
-        if instances['name'] == portName:
+        for instances in self._walk(uuid, 'networking.port.raw', {'name':portName}):
             return instances
 
-    return None
+        return None
 
     def deletePortVlan(self, uuid, portId):
-    """.. function:: deletePortVlan(uuid, portId):
+        """.. function:: deletePortVlan(uuid, portId):
 
-    Delete port VLAN
+        Delete port VLAN
 
-    :param uuid: Switch instance id
-    :type uuid: string
-    :param portId: port's id
-    :type portId: string
-    :returns: True if operation successful, False otherwise
-    :raises: CvbnApiFailure
+        :param uuid: Switch instance id
+        :type uuid: string
+        :param portId: port's id
+        :type portId: string
+        :returns: True if operation successful, False otherwise
+        :raises: CvbnApiFailure
 
-    >>> print vswitch.deletePortVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "45233226-f003-4aa6-9553-5cbfe6424626")
-    True
-    >>> print vswitch.deletePortVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
-    False
+        >>> print vswitch.deletePortVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "45233226-f003-4aa6-9553-5cbfe6424626")
+        True
+        >>> print vswitch.deletePortVlan("ea2db47c-1cbe-4846-9ba6-141c3ac59508", "wrong")
+        False
 
-    """
-    if self.getRunId(uuid) == None:
-        return False
-
-    if self.getPortVlanId(uuid, portId) == None:
-        return False
+        """
 
-    params = {'tid':'networking.port.raw','id':portId}
-    try:
-        result = self._delete_method.invoke(uuid, self.cid, params)
-    except RpcMethodError as error:
-            err = '{}\n{}'.format(sys.argv, error)
-        print >> sys.stderr, err
-        raise CvbnApiFailure(err)
-    except:
-        err = "Unknown reason for CVBN API execution failure"
-        print >> sys.stderr, err
-        raise CvbnApiFailure("reason unknown")
-
-    return True
+        if not self._guard(lambda: self.getRunId(uuid) != None,
+                           lambda: self._get_object(uuid, 'networking.port.raw', portId) != None):
+            return False
 
+        params = {'tid':'networking.port.raw','id':portId}
+        if not self._delete(uuid, params):
+            return False
 
+        index = self._indexes.get(('vlan', uuid))
+        if index != None:
+            index.removePort(portId)
+        return True
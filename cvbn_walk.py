@@ -0,0 +1,171 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_walk
+    :synopsis: Filtered walk layer for CVBN control classes
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing walks with filter predicates used by 'vbn' and 'vswitch' classes.
+
+Filters are given as *dict* of attribute path to expected value, where nested
+attributes are separated with dot, e.g.::
+
+    {'domain.id': domainId, 'port.tid': 'networking.port.gre', 'port.id': portId}
+
+Filters are pushed to the agent as query-by-example walk parameters when the agent
+supports it. Returned objects are always checked client-side as well, one at a time,
+so the result is correct whether the agent filtered or not. The capability is detected
+on the first filtered walk of each tid and cached in *FilterSupport* object.
+
+Method objects providing *stream(agent, cid, params)* (iterable of raw JSON response
+chunks) are decoded incrementally with cvbn_jsonstream, so a walk stopped at the
+first match does not decode the rest of the response. The first object is decoded by
+the *walk* call itself, so a rejected request raises there; errors of the rest of the
+stream (RpcMethodError, ValueError of malformed data) are raised while iterating,
+converted by *failure* of *walk* when given.
+
+Pushed filters are given up (tid marked as not supporting them) only when the agent
+rejects the walk with an 'unsupported' error, see *UNSUPPORTED_MESSAGES*.
+
+"""
+
+import itertools
+import threading
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_jsonstream
+
+UNKNOWN = None
+SUPPORTED = True
+UNSUPPORTED = False
+
+# agent error messages meaning that the pushed walk parameters are not understood
+UNSUPPORTED_MESSAGES = ('unsupported', 'not supported', 'unknown parameter', 'unknown attribute')
+
+def is_unsupported(error):
+    """Check if RPC error reports walk parameters (pushed filters) the agent does not support
+    """
+    message = str(error).lower()
+    for text in UNSUPPORTED_MESSAGES:
+        if text in message:
+            return True
+    return False
+
+def _value(obj, path):
+    for attr in path.split('.'):
+        if not isinstance(obj, dict) or attr not in obj:
+            return None
+        obj = obj[attr]
+    return obj
+
+def matches(obj, filters):
+    """Check if object *obj* matches all *filters*
+    """
+    for path, value in filters.items():
+        if _value(obj, path) != value:
+            return False
+    return True
+
+def to_params(filters):
+    """Convert *filters* to nested walk parameters, e.g. {'domain.id': x} to {'domain': {'id': x}}
+    """
+    params = {}
+    for path, value in filters.items():
+        attrs = path.split('.')
+        node = params
+        for attr in attrs[:-1]:
+            node = node.setdefault(attr, {})
+        node[attrs[-1]] = value
+    return params
+
+class FilterSupport(object):
+    """Cache of agent's server-side filtering capability per tid
+    """
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def state(self, tid):
+        return self._state.get(tid, UNKNOWN)
+
+    def pushable(self, tid):
+        return self.state(tid) != UNSUPPORTED
+
+    def set(self, tid, state):
+        # once detected as not supported, it stays so (also when walks of many threads race)
+        with self._lock:
+            if self._state.get(tid) != UNSUPPORTED:
+                self._state[tid] = state
+
+def _filtered(children, filters, tid, support):
+    matched = 0
+    for instances in children:
+        if matches(instances, filters):
+            matched = matched + 1
+            yield instances
+        elif support != None:
+            # agent returned object not matching pushed filters, so it ignores them
+            support.set(tid, UNSUPPORTED)
+            support = None
+    if support != None and matched > 0:
+        support.set(tid, SUPPORTED)
+
+def _primed(children):
+    # decode the first object now, so that the request itself fails in the walk call
+    for instances in children:
+        return itertools.chain([instances], children)
+    return iter([])
+
+def _guarded(children, failure):
+    try:
+        for instances in children:
+            yield instances
+    except (RpcMethodError, ValueError) as error:
+        raise failure(error)
+
+def _children(method, agent, cid, params):
+    # method objects able to return raw response chunks are decoded incrementally
+    stream = getattr(method, 'stream', None)
+    if stream != None:
+        return _primed(cvbn_jsonstream.iter_array(stream(agent, cid, params), 'children'))
+    return iter(method.invoke(agent, cid, params)['children'])
+
+def _walk(method, agent, cid, tid, filters, support):
+    params = {'tid':tid}
+    if not filters:
+        return _children(method, agent, cid, params)
+
+    if support == None or not support.pushable(tid):
+        return _filtered(_children(method, agent, cid, params), filters, tid, None)
+
+    pushed = dict(to_params(filters), **params)
+    try:
+        children = _children(method, agent, cid, pushed)
+    except RpcMethodError as error:
+        if support.state(tid) == SUPPORTED or not is_unsupported(error):
+            raise
+        # agent rejects unknown walk parameters; fall back to plain walk
+        children = _children(method, agent, cid, params)
+        support.set(tid, UNSUPPORTED)
+        return _filtered(children, filters, tid, None)
+    return _filtered(children, filters, tid, support)
+
+def walk(method, agent, cid, tid, filters = None, support = None, failure = None):
+    """.. function:: walk(method, agent, cid, tid, filters = None, support = None, failure = None)
+
+    Walk *tid* on *agent* and return iterator over objects matching *filters*
+
+    :param method: RPC walk method object
+    :param filters: dict of attribute path to value; None or empty means no filtering
+    :param support: FilterSupport object; filters are never pushed to the agent if None
+    :param failure: optional callable error -> exception raised instead of RpcMethodError
+        or ValueError hit while iterating over streamed response
+    :returns: iterator over matching objects
+    :raises: RpcMethodError, ValueError
+
+    """
+    children = _walk(method, agent, cid, tid, filters, support)
+    if failure != None:
+        return _guarded(children, failure)
+    return children
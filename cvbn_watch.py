@@ -0,0 +1,288 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: cvbn_watch
+    :synopsis: Topology change watcher for CVBN vSwitch instances
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Module implementing 'TopologyWatcher' class that keeps the last snapshot of objects
+per (switch, tid), polls with adaptive intervals and emits only added, removed and
+changed objects (*Diff*).
+
+Poll interval of every (switch, tid) starts at *minInterval*, grows by *backoff*
+factor up to *maxInterval* while nothing changes (or the switch does not answer)
+and drops back to *minInterval* on the first change.
+
+Listeners are called in the polling thread; a listener raising an exception is
+reported on stderr and does not stop the other listeners or the polling. Diffs of a
+switch removed while its poll was running are not emitted.
+
+If no switches are given, the list of switches itself (compute.vswitch) is watched
+and switches are added to/removed from the watch as they appear/disappear.
+
+>>> import cvbn_vswitch
+>>> vswitch = cvbn_vswitch.vswitch("localhost","none")
+>>> watcher = vswitch.watch(tids = ['networking.network', 'networking.port.gre'])
+>>> watcher.addListener(lambda diff: sys.stdout.write(repr(diff) + '\\n'))
+>>> watcher.start()
+>>> for diff in watcher.diffs():
+...     print diff.switch, diff.tid, len(diff.added), len(diff.removed), len(diff.changed)
+
+"""
+
+import sys
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+SWITCH_TID = 'compute.vswitch'
+
+DEFAULT_TIDS = (
+    'networking.network',
+    'networking.subnet',
+    'networking.vswitch.domain',
+    'networking.vswitch.domain.ports',
+    'networking.port.gre',
+    'networking.port.raw',
+)
+
+def _objectId(instances):
+    if 'id' in instances:
+        return instances['id']
+    # domain membership objects may come without own id
+    return (instances['domain']['id'], instances['port']['tid'], instances['port']['id'])
+
+class Diff(object):
+    """Difference between two snapshots of (switch, tid)
+
+    :ivar switch: switch instance id (None for the list of switches)
+    :ivar tid: object type
+    :ivar added: list of new objects
+    :ivar removed: list of objects that disappeared
+    :ivar changed: list of (old, new) object pairs
+    """
+    def __init__(self, switch, tid, added, removed, changed):
+        self.switch = switch
+        self.tid = tid
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        return "Diff(switch={}, tid={}, added={}, removed={}, changed={})".format(
+            self.switch, self.tid, len(self.added), len(self.removed), len(self.changed))
+
+def diff(switch, tid, old, new):
+    """Compare snapshots *old* and *new* (dict id -> object) and return Diff
+    """
+    added = [new[key] for key in new if key not in old]
+    removed = [old[key] for key in old if key not in new]
+    changed = [(old[key], new[key]) for key in new if key in old and old[key] != new[key]]
+    return Diff(switch, tid, added, removed, changed)
+
+class _Watch(object):
+    def __init__(self, switch, tid, interval):
+        self.switch = switch
+        self.tid = tid
+        self.snapshot = None
+        self.interval = interval
+        self.due = 0
+        self.errors = 0
+
+class TopologyWatcher(object):
+    """Incremental topology watcher over 'vswitch' instance
+
+    :param client: cvbn_vswitch.vswitch instance
+    :param switches: list of switch instance ids; None to watch all switches
+    :param tids: object types to watch on every switch
+    :param minInterval: shortest poll interval in seconds. Default 5
+    :param maxInterval: longest poll interval in seconds (idle switches). Default 300
+    :param backoff: interval growth factor when nothing changes. Default 2
+    :param initial: emit the first snapshot as added objects. Default True
+    """
+    def __init__(self, client, switches = None, tids = DEFAULT_TIDS, minInterval = 5, maxInterval = 300, backoff = 2, initial = True):
+        self.client = client
+        self.tids = tuple(tids)
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.backoff = backoff
+        self.initial = initial
+        self._lock = threading.Lock()
+        self._watches = {}
+        self._listeners = []
+        self._queues = []
+        self.listenerErrors = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.autoSwitches = switches == None
+        if self.autoSwitches:
+            self._add(None, SWITCH_TID)
+        else:
+            for uuid in switches:
+                self.addSwitch(uuid)
+
+    def _add(self, switch, tid):
+        key = (switch, tid)
+        if key not in self._watches:
+            self._watches[key] = _Watch(switch, tid, self.minInterval)
+
+    def addSwitch(self, uuid):
+        """Start watching all tids of switch *uuid*
+        """
+        with self._lock:
+            for tid in self.tids:
+                self._add(uuid, tid)
+
+    def removeSwitch(self, uuid):
+        """Stop watching switch *uuid* and drop its snapshots
+        """
+        with self._lock:
+            for tid in self.tids:
+                self._watches.pop((uuid, tid), None)
+
+    def addListener(self, listener):
+        """Register callable(diff) called for every non-empty Diff
+        """
+        self._listeners.append(listener)
+
+    def snapshot(self, uuid, tid):
+        """Return last snapshot (dict id -> object) of (switch, tid) or None
+        """
+        watch = self._watches.get((uuid, tid))
+        if watch == None:
+            return None
+        return watch.snapshot
+
+    def _fetch(self, watch):
+        if watch.switch == None:
+            instances = self.client._walk(self.client.agent, SWITCH_TID)
+        else:
+            instances = self.client._walk(watch.switch, watch.tid)
+        snapshot = {}
+        for obj in instances:
+            snapshot[_objectId(obj)] = obj
+        return snapshot
+
+    def _pollWatch(self, watch, now):
+        try:
+            snapshot = self._fetch(watch)
+        except Exception:
+            # switch not running/not answering: keep last snapshot, back off
+            watch.errors = watch.errors + 1
+            watch.interval = min(watch.interval * self.backoff, self.maxInterval)
+            watch.due = now + watch.interval
+            return None
+
+        watch.errors = 0
+        if watch.snapshot == None and not self.initial:
+            result = Diff(watch.switch, watch.tid, [], [], [])
+        else:
+            result = diff(watch.switch, watch.tid, watch.snapshot or {}, snapshot)
+        watch.snapshot = snapshot
+        if result:
+            watch.interval = self.minInterval
+        else:
+            watch.interval = min(watch.interval * self.backoff, self.maxInterval)
+        watch.due = now + watch.interval
+        return result
+
+    def _watched(self, watch):
+        with self._lock:
+            return self._watches.get((watch.switch, watch.tid)) is watch
+
+    def _emit(self, result):
+        for listener in list(self._listeners):
+            try:
+                listener(result)
+            except Exception as error:
+                self.listenerErrors = self.listenerErrors + 1
+                sys.stderr.write("listener {} failed on {}: {}\n".format(listener, result, error))
+        for q in list(self._queues):
+            q.put(result)
+
+    def poll(self, force = False):
+        """.. function:: poll(force = False)
+
+        Poll all (switch, tid) pairs that are due (all of them if *force*) and emit diffs
+
+        :returns: list of non-empty Diff objects
+
+        """
+        now = time.time()
+        with self._lock:
+            due = [watch for watch in self._watches.values() if force or watch.due <= now]
+        # the list of switches first, so new switches are polled in the same round
+        due.sort(key = lambda watch: watch.switch != None)
+        results = []
+        for watch in due:
+            # switch removed (by the list of switches or removeSwitch) since the round started
+            if not self._watched(watch):
+                continue
+            result = self._pollWatch(watch, now)
+            if not result or not self._watched(watch):
+                continue
+            if watch.switch == None:
+                for switch in result.added:
+                    self.addSwitch(switch['id'])
+                    with self._lock:
+                        added = [self._watches.get((switch['id'], tid)) for tid in self.tids]
+                    due.extend(entry for entry in added if entry != None)
+                for switch in result.removed:
+                    self.removeSwitch(switch['id'])
+            results.append(result)
+            self._emit(result)
+        return results
+
+    def nextDue(self):
+        """Return time (epoch) of the next due poll
+        """
+        with self._lock:
+            if not self._watches:
+                return time.time() + self.maxInterval
+            return min(watch.due for watch in self._watches.values())
+
+    def run(self):
+        """Poll until *stop()* is called (blocking)
+        """
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(max(0, self.nextDue() - time.time()))
+
+    def start(self):
+        """Start polling in background thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target = self.run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        for q in list(self._queues):
+            q.put(None)
+
+    def diffs(self):
+        """Generator of non-empty Diff objects as they are detected (until *stop()*)
+        """
+        q = queue.Queue()
+        self._queues.append(q)
+        try:
+            while True:
+                result = q.get()
+                if result == None:
+                    return
+                yield result
+        finally:
+            self._queues.remove(q)
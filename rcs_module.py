@@ -9,6 +9,9 @@ Module implenting 'rcs' class that controls all interactions with RCS instance
 """
 
 import requests, json
+import threading
+import cvbn_jsonstream
+from cvbn_deadline import DeadlineExceeded
 
 requests.packages.urllib3.disable_warnings()
 
@@ -29,12 +32,19 @@ class RcsApiFailure(Exception):
 
 class rcs(object):
     """ Python class that controls all interactions with RCS instance.
+
+    Thread safety: one object can be shared by many threads. Authentication is done
+    once under a lock (concurrent first requests wait for the same token) and every
+    request builds its own headers; the HTTP layer (*requests* by default) must be
+    thread-safe too. *filter* is a setting of the object (all threads), set it before
+    sharing the object (cvbn_clientpool hands out shared warm objects).
     """
-    def __init__(self, rcs_def):
-	""".. function:: init(rcs_def)
+    def __init__(self, rcs_def, http = None):
+	""".. function:: init(rcs_def, http = None)
 
-	Init authenticates with RCS instances as per rcs_def (dict) parameter. 
-	The authentication token is stored in *token* attribute.
+	Init stores RCS instance definition as per rcs_def (dict) parameter. 
+	Authentication is deferred to the first request (or *warmup()*) and
+	the authentication token is stored in *token* attribute.
 
 	*rcs_def* of *dict* type must have the following keys defined
 
@@ -45,8 +55,9 @@ class rcs(object):
 	:param grant_type: authentication type (e.g. password)
 	:param username: username
 	:param password: password
+	:param http: optional HTTP layer with *requests* interface (e.g. cvbn_replay.ReplayHttp). Default *requests*
 	:returns: object reference
-	:raises: RcsDefFailure, GetAuthTokenFailure
+	:raises: RcsDefFailure
 
 	>>> import rcs_module
 	>>> rcs_def={
@@ -72,11 +83,59 @@ class rcs(object):
 		self.password = rcs_def["password"]
 	except:
 		raise RcsDefFailure
+	if http == None:
+		http = requests
+	self._http = http
+	self._authLock = threading.Lock()
 	self.token = None
-	self._get_authentication_token()
 	self.filter = None
 	self.url = "http://" + self.server + ":" + self.port
 
+    @property
+    def token(self):
+	"""Authorization header value; authenticates on first access
+
+	:raises: GetAuthTokenFailure
+	"""
+	if self._token == None:
+		with self._authLock:
+			if self._token == None:
+				self._get_authentication_token()
+	return self._token
+
+    @token.setter
+    def token(self, value):
+	self._token = value
+
+    def warmup(self, background = False):
+	""".. function:: warmup(background = False)
+
+	Authenticate now instead of on the first request
+
+	:param background: authenticate in background thread and return immediately
+	:type background: boolean
+	:returns: the background thread if *background* is True, None otherwise
+	:raises: GetAuthTokenFailure (if not in background)
+
+	>>> _rcs.warmup()
+
+	"""
+	if not background:
+		self.token
+		return None
+
+	def authenticate():
+		try:
+			self.token
+		except GetAuthTokenFailure:
+			# retried on the first request
+			pass
+
+	thread = threading.Thread(target = authenticate)
+	thread.daemon = True
+	thread.start()
+	return thread
+
     def _get_authentication_token(self):
 	tokenReq = {}
 	tokenReq['client_id'] = self.client_id
@@ -87,7 +146,9 @@ class rcs(object):
 
 	url = "https://" + self.server + "/oauth/token"
 	try: 
-		ret = requests.post(url, tokenReq, verify=False)
+		ret = self._http.post(url, tokenReq, verify=False)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise GetAuthTokenFailure
 	try:
@@ -119,7 +180,9 @@ class rcs(object):
 	url = self.url + "/admin/services"
 	hdr = {"Accept-version":"v2","Authorization":self.token}
 	try:
-		r = requests.get(url, headers = hdr)
+		r = self._http.get(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 	return r.json()
@@ -144,10 +207,50 @@ class rcs(object):
 	url = self.url + "/admin/devices"
 	hdr = {"Accept-version":"v2","Authorization":self.token}
 	try:
-		r = requests.get(url, headers = hdr)
+		r = self._http.get(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
-	return r.json()
+	return cvbn_jsonstream.loads(r.content)
+
+    def iterAdminDevices(self):
+	""".. function:: iterAdminDevices()
+
+	Iterate over /admin/devices list. Devices are decoded one at a time as the
+	response arrives, so the iteration can be stopped early without reading the rest
+
+	:returns: generator of devices (JSON)
+	:raises: RcsApiFailure
+
+	>>> for device in _rcs.iterAdminDevices():
+	...     print device['name']
+	Device #1 for Velcom
+
+	"""
+
+	url = self.url + "/admin/devices"
+	hdr = {"Accept-version":"v2","Authorization":self.token}
+	return self._iterList(url, hdr, 'devices')
+
+    def _iterList(self, url, hdr, key):
+	try:
+		r = self._http.get(url, headers = hdr, stream = True)
+	except DeadlineExceeded:
+		raise
+	except:
+		raise RcsApiFailure
+	if not 200 <= r.status_code < 300:
+		# error document (e.g. 401/404 {"errors": ...}), not an empty list
+		r.close()
+		raise RcsApiFailure
+	try:
+		for item in cvbn_jsonstream.iter_array(r.iter_content(cvbn_jsonstream.CHUNK_SIZE), key, required = True):
+			yield item
+	except Exception:
+		raise RcsApiFailure
+	finally:
+		r.close()
 
     def getAdminDevice(self, device_id):
 	""".. function:: getAdminDevice(device_id)
@@ -170,7 +273,9 @@ class rcs(object):
 	url = self.url + "/admin/devices/" + device_id
 	hdr = {"Accept-version":"v2","Authorization":self.token}
 	try:
-		r = requests.get(url, headers = hdr)
+		r = self._http.get(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 	return r.json()
@@ -194,15 +299,10 @@ class rcs(object):
 	>>>
 
 	"""
-	try:
-		devicesList = self.getAdminDevices()['devices']
-	except:
-		raise RcsApiFailure
-	retValue = None
-	for device in devicesList:
+	for device in self.iterAdminDevices():
 		if device['name'] == name:
-			retValue = device['id']
-	return retValue
+			return device['id']
+	return None
 	
     # Exact match search for device Id 
     def getAdminDeviceIdByUid(self, uid):
@@ -223,15 +323,10 @@ class rcs(object):
 	>>>
 
 	"""
-	try:
-		devicesList = self.getAdminDevices()['devices']
-	except:
-		raise RcsApiFailure
-	retValue = None
-	for device in devicesList:
+	for device in self.iterAdminDevices():
 		if device['uid'] == uid:
-			retValue = device['id']
-	return retValue
+			return device['id']
+	return None
 
     # if device with uid exists, device is updated
     def addAdminDevice(self, uid, name):
@@ -264,7 +359,9 @@ class rcs(object):
 	payload = {}
 	payload['device'] = {'uid': uid, 'name': name }
 	try:
-		r = requests.post(url, json.dumps(payload), headers = hdr)
+		r = self._http.post(url, json.dumps(payload), headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -315,7 +412,9 @@ class rcs(object):
 	url = self.url + "/admin/devices/" + device_id
 	hdr = {"Accept-version":"v2", "Authorization":self.token}
 	try:
-		r = requests.delete(url, headers = hdr)
+		r = self._http.delete(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -362,7 +461,9 @@ class rcs(object):
 	url = self.url + "/admin/devices/" + device_id + "/authorizations"
 	hdr = {"Accept-version":"v2","Authorization":self.token}
 	try:
-		r = requests.get(url, headers = hdr)
+		r = self._http.get(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 	return r.json()
@@ -395,7 +496,9 @@ class rcs(object):
 	payload = {}
 	payload['authorization'] = {'user_id': user_id, 'permissions': {"owner": True, "admin": True, "invite": True} }
 	try:
-		r = requests.post(url, json.dumps(payload), headers = hdr)
+		r = self._http.post(url, json.dumps(payload), headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -450,7 +553,9 @@ class rcs(object):
 	url = self.url + "/admin/devices/" + device_id + "/authorizations/" + auth_id
 	hdr = {"Accept-version":"v2", "Authorization":self.token}
 	try:
-		r = requests.delete(url, headers = hdr)
+		r = self._http.delete(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -495,11 +600,32 @@ class rcs(object):
 	url = self.url + "/admin/users"
 	hdr = {"Accept-version":"v2","Authorization":self.token}
 	try:
-		r = requests.get(url, headers = hdr)
+		r = self._http.get(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
-	return r.json()
+	return cvbn_jsonstream.loads(r.content)
+
+    def iterAdminUsers(self):
+	""".. function:: iterAdminUsers()
+
+	Iterate over list of all users. Users are decoded one at a time as the
+	response arrives, so the iteration can be stopped early without reading the rest
+
+	:returns: generator of admin users (JSON)
+	:raises: RcsApiFailure
+
+	>>> for user in _rcs.iterAdminUsers():
+	...     print user['email']
+	demo@cisco.com
+
+	"""
+
+	url = self.url + "/admin/users"
+	hdr = {"Accept-version":"v2","Authorization":self.token}
+	return self._iterList(url, hdr, 'users')
 
     def getAdminUser(self, user_id):
 	""".. function:: getAdminUser(user_id)
@@ -521,7 +647,9 @@ class rcs(object):
 	url = self.url + "/admin/users/" + user_id
 	hdr = {"Accept-version":"v2","Authorization":self.token}
 	try:
-		r = requests.get(url, headers = hdr)
+		r = self._http.get(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 	return r.json()
@@ -544,15 +672,10 @@ class rcs(object):
 
 	"""
 	
-	try:
-		usersList = self.getAdminUsers()['users']
-	except:
-		RcsApiFailure
-	retValue = None
-	for user in usersList:
+	for user in self.iterAdminUsers():
 		if user['email'] == name:
-			retValue = user['id']
-	return retValue
+			return user['id']
+	return None
 	
     def addAdminUser(self, email, name, password):
 	""".. function:: addAdminUser(email, name, password)
@@ -584,7 +707,9 @@ class rcs(object):
 	payload = {}
 	payload['user'] = {'email': email, 'name': name, 'password': password }
 	try:
-		r = requests.post(url, json.dumps(payload), headers = hdr)
+		r = self._http.post(url, json.dumps(payload), headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -629,7 +754,9 @@ class rcs(object):
 	url = self.url + "/admin/users/" + user_id
 	hdr = {"Accept-version":"v2", "Authorization":self.token}
 	try:
-		r = requests.delete(url, headers = hdr)
+		r = self._http.delete(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -675,7 +802,9 @@ class rcs(object):
 	url = self.url + "/admin/users/" + user_id + "/authorizations"
 	hdr = {"Accept-version":"v2","Authorization":self.token}
 	try:
-		req = requests.get(url, headers = hdr)
+		req = self._http.get(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 	return req.json()
@@ -707,7 +836,9 @@ class rcs(object):
 	payload = {}
 	payload['authorization'] = {'device_id': device_id, 'permissions': {"owner": True, "admin": True, "invite": True} }
 	try:
-		r = requests.post(url, json.dumps(payload), headers = hdr)
+		r = self._http.post(url, json.dumps(payload), headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -757,7 +888,9 @@ class rcs(object):
 	url = self.url + "/admin/users/" + user_id + "/authorizations/" + auth_id
 	hdr = {"Accept-version":"v2", "Authorization":self.token}
 	try:
-		r = requests.delete(url, headers = hdr)
+		r = self._http.delete(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -811,7 +944,9 @@ class rcs(object):
 	hdr = {"Accept-version":"v2", "Authorization":self.token, "Content-type": "application/json", "X-SSL-Client-Subject": uid, "X-SSL-Client-Verify": "SUCCESS"}
 
 	try:
-		r = requests.get(url, headers = hdr)
+		r = self._http.get(url, headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -865,7 +1000,9 @@ class rcs(object):
 	payload = {}
 	payload['device'] = {'name': name}
 	try:
-		r = requests.put(url, json.dumps(payload), headers = hdr)
+		r = self._http.put(url, json.dumps(payload), headers = hdr)
+	except DeadlineExceeded:
+		raise
 	except:
 		raise RcsApiFailure
 
@@ -0,0 +1,102 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_deadline
+    :synopsis: Tests of deadlines of RPC requests
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Requests of agents in *hung* block until the test releases them, standing in for
+agents that stopped answering.
+
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cvbn_deadline
+
+class FakeMethod(object):
+    def __init__(self, hung = ()):
+        self.hung = set(hung)
+        self.release = threading.Event()
+        self.sent = []
+
+    def invoke(self, agent, cid, params):
+        self.sent.append((agent, params.get('tid')))
+        if agent in self.hung:
+            self.release.wait(10)
+        return {'id': params.get('tid')}
+
+class DeadlineMethodTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = cvbn_deadline._pool
+        cvbn_deadline._pool = cvbn_deadline._Workers(2)
+        self.method = FakeMethod(hung = ['hung'])
+
+    def tearDown(self):
+        self.method.release.set()
+        cvbn_deadline._pool = self.saved
+
+    def invoke(self, name, agent, tid):
+        return cvbn_deadline.DeadlineMethod(name, self.method).invoke(agent, 1, {'tid': tid})
+
+    def test_abandoned_requests_do_not_use_up_workers(self):
+        for index in range(5):
+            with cvbn_deadline.deadline(0.05):
+                self.assertRaises(cvbn_deadline.DeadlineExceeded, self.invoke, 'walk', 'hung', 't')
+        with cvbn_deadline.deadline(1):
+            self.assertEqual(self.invoke('walk', 'agent', 't'), {'id': 't'})
+        self.assertEqual(cvbn_deadline._pool.stats()['abandoned'], 5)
+        self.method.release.set()
+        with cvbn_deadline.deadline(1):
+            self.invoke('get', 'agent', 't')
+        # threads of returned requests above the limit exit
+        for index in range(100):
+            if cvbn_deadline._pool.stats()['threads'] <= 2:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(cvbn_deadline._pool.stats()['abandoned'], 0)
+        self.assertTrue(cvbn_deadline._pool.stats()['threads'] <= 2)
+
+    def test_progress_of_exceeded_operation(self):
+        try:
+            with cvbn_deadline.deadline(0.1):
+                self.invoke('set', 'agent', 'networking.port.gre')
+                self.invoke('delete', 'hung', 'networking.domain')
+        except cvbn_deadline.DeadlineExceeded as error:
+            self.assertEqual(error.completed, [('set', 'agent', 'networking.port.gre')])
+            self.assertEqual(error.abandoned, ('delete', 'hung', 'networking.domain'))
+        else:
+            self.fail("DeadlineExceeded not raised")
+
+    def test_queued_request_not_sent_after_deadline(self):
+        # both workers busy with requests still within their (longer) budget
+        def walk():
+            with cvbn_deadline.deadline(10):
+                self.invoke('walk', 'hung', 'busy')
+        busy = [threading.Thread(target = walk) for index in range(2)]
+        for thread in busy:
+            thread.start()
+        while len(self.method.sent) < 2:
+            threading.Event().wait(0.01)
+        with cvbn_deadline.deadline(0.05):
+            self.assertRaises(cvbn_deadline.DeadlineExceeded, self.invoke, 'set', 'agent', 'queued')
+        self.method.release.set()
+        for thread in busy:
+            thread.join()
+        self.assertFalse(('agent', 'queued') in self.method.sent)
+        self.assertEqual(cvbn_deadline._pool.stats()['queued'], 0)
+
+    def test_request_after_deadline_not_sent(self):
+        with cvbn_deadline.deadline(0):
+            self.assertRaises(cvbn_deadline.DeadlineExceeded, self.invoke, 'get', 'agent', 't')
+        self.assertEqual(self.method.sent, [])
+
+if __name__ == '__main__':
+    unittest.main()
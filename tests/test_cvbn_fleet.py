@@ -0,0 +1,91 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_fleet
+    :synopsis: Tests of 'FleetScanner' and 'FleetInventory' classes
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Hosts are served by a fake RPC method factory shared through cvbn_multihost.MultiHost;
+walks of hosts in *hung* block until the test releases them.
+
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cvbn_deadline
+import cvbn_fleet
+import cvbn_multihost
+
+class FakeMethod(object):
+    def __init__(self, factory, name):
+        self.factory = factory
+        self.name = name
+
+    def invoke(self, agent, cid, params):
+        host = agent.split('/')[0]
+        if host in self.factory.hung:
+            self.factory.release.wait(10)
+        return {'children': [{'tid': params['tid'], 'id': '{}-{}'.format(host, params['tid']), 'name': host}]}
+
+class FakeFactory(object):
+    def __init__(self, hung = ()):
+        self.hung = set(hung)
+        self.release = threading.Event()
+
+    def method(self, name):
+        return FakeMethod(self, name)
+
+class FleetScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = FakeFactory(hung = ['slow'])
+        self.multi = cvbn_multihost.MultiHost('cvbb', factory = self.factory)
+
+    def tearDown(self):
+        self.factory.release.set()
+
+    def test_hung_host_times_out_without_holding_back_others(self):
+        scanner = cvbn_fleet.FleetScanner(self.multi, workers = 4, hostTimeout = 0.3)
+        hosts = ['slow'] + ['h{}'.format(index) for index in range(6)]
+        start = time.time()
+        order = [report.host for report in scanner.iterScan(hosts)]
+        self.assertTrue(time.time() - start < 5)
+        # in input order every host would wait for 'slow'
+        self.assertTrue(order.index('h0') < order.index('slow'))
+        self.assertEqual(sorted(order), sorted(hosts))
+        failures = scanner.inventory.failures()
+        self.assertEqual(list(failures), ['slow'])
+        for error in failures['slow'].errors.values():
+            self.assertTrue(isinstance(error, cvbn_deadline.DeadlineExceeded))
+        self.assertEqual(len(scanner.inventory.find(tid = 'host.nat')), 6)
+
+    def test_budget_starts_again_with_every_scan(self):
+        self.factory.hung = set()
+        scanner = cvbn_fleet.FleetScanner(self.multi, workers = 2, hostTimeout = 0.2)
+        scanner.scan(['h1'])
+        time.sleep(0.3)
+        self.assertEqual(scanner.scan(['h1']).failures(), {})
+
+class FleetInventoryTest(unittest.TestCase):
+    def test_replaced_walk_unindexed(self):
+        inventory = cvbn_fleet.FleetInventory()
+        objects = [{'id': 'i{}'.format(index), 'name': 'n{}'.format(index % 3)} for index in range(30)]
+        inventory.add('h1', 't', objects, 0.1)
+        inventory.add('h2', 't', [{'id': 'i1', 'name': 'n1'}], 0.1)
+        inventory.add('h1', 't', objects[:2], 0.1)
+        self.assertEqual(len(inventory.find(tid = 't')), 3)
+        self.assertEqual(sorted(host for host, tid, obj in inventory.find(objId = 'i1')), ['h1', 'h2'])
+        self.assertEqual(inventory.find(objId = 'i5'), [])
+        inventory.add('h1', 't', [], 0.1)
+        self.assertEqual(inventory.find(name = 'n0'), [])
+        self.assertEqual(inventory.summary()['objects'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_inventory
+    :synopsis: Tests of 'Inventory' class
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cvbn_inventory
+
+NETWORK = 'networking.network'
+
+class StreamBroken(Exception):
+    pass
+
+def broken(objects):
+    # lazy walk failing after part of the listing was read
+    for obj in objects:
+        yield obj
+    raise StreamBroken()
+
+class FakeVswitch(object):
+    '''vswitch client with switches s1 (running) and s2 (stopped)'''
+    server = 'cvbb'
+    agent = 'h/cvbn-switch-agent'
+
+    def __init__(self):
+        self.walks = []
+        self.networks = {'s1': [{'id': 'n-1', 'name': 'a'}], 's2': [{'id': 'n-2', 'name': 'b'}]}
+        self.failing = set()
+
+    def iterSwitches(self):
+        return iter([{'id': 's1'}, {'id': 's2'}])
+
+    def _walk(self, agent, tid):
+        self.walks.append((agent, tid))
+        if tid == 'compute.server':
+            return iter([{'id': 'run-s1', 'configuration': {'tid': 'compute.vswitch', 'id': 's1'}}])
+        if agent in self.failing:
+            return broken(self.networks[agent])
+        return iter(self.networks[agent])
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self.inventory = cvbn_inventory.Inventory(':memory:')
+        self.inventory.store('vbn:cvbb', 'h', NETWORK, [{'id': 'n-1', 'name': 'a'}, {'id': 'n-2', 'name': 'b'}], now = 1)
+
+    def test_failed_stream_leaves_nothing_pending(self):
+        listing = [{'id': 'n-1', 'name': 'renamed'}, {'id': 'n-3', 'name': 'c'}]
+        self.assertRaises(StreamBroken, self.inventory.store, 'vbn:cvbb', 'h', NETWORK, broken(listing), now = 2)
+        # any later commit must not persist the half-applied listing
+        self.inventory.forget('other')
+        self.assertEqual(sorted(obj['name'] for obj in self.inventory.objects(tid = NETWORK)), ['a', 'b'])
+        self.assertEqual(self.inventory.version('n-1'), (1, 1))
+        self.assertEqual(self.inventory.synced('vbn:cvbb', 'h', NETWORK), 1)
+
+    def test_versions_and_removal(self):
+        self.assertEqual(self.inventory.store('vbn:cvbb', 'h', NETWORK, [{'id': 'n-1', 'name': 'x'}], now = 2), (0, 1, 1))
+        self.assertEqual(self.inventory.version('n-1'), (2, 2))
+        self.assertEqual(self.inventory.get('n-2'), None)
+
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.inventory = cvbn_inventory.Inventory(':memory:')
+        self.client = FakeVswitch()
+        self.inventory.addVswitch(self.client, tids = [NETWORK])
+
+    def test_only_running_switches_walked(self):
+        self.assertEqual(self.inventory.sync(), [])
+        self.assertEqual([obj['id'] for obj in self.inventory.objects(tid = NETWORK)], ['n-1'])
+        self.assertFalse(('s2', NETWORK) in self.client.walks)
+
+    def test_failing_switch_reported_and_kept(self):
+        self.inventory.sync()
+        self.client.networks['s1'] = [{'id': 'n-9', 'name': 'z'}]
+        self.client.failing.add('s1')
+        failures = self.inventory.sync(force = True)
+        self.assertEqual([type(error) for error in failures], [StreamBroken])
+        self.assertEqual([obj['id'] for obj in self.inventory.objects(tid = NETWORK)], ['n-1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_ipam
+    :synopsis: Tests of GRE endpoint allocator and GRE port adds of 'vswitch'
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_ipam
+import cvbn_vswitch
+
+SWITCH = 'ea2db47c-1cbe-4846-9ba6-141c3ac59508'
+SUBNET = {'tid': 'networking.subnet', 'id': 'subnet-1', 'cidr': '192.168.30.0/24', 'gateway_ip': '192.168.30.1',
+          'allocation_pools': [{'start': '192.168.30.1', 'end': '192.168.30.20'}]}
+
+class SubnetPoolTest(unittest.TestCase):
+    def test_release_merges_free_ranges(self):
+        pool = cvbn_ipam.SubnetPool('10.0.0.0/29')
+        self.assertEqual(pool.free, 6)
+        for ip in ('10.0.0.2', '10.0.0.4', '10.0.0.3'):
+            self.assertTrue(pool.reserve(ip))
+        self.assertFalse(pool.reserve('10.0.0.3'))
+        self.assertFalse(pool.reserve('10.0.0.7'))
+        self.assertEqual((pool._starts, pool._ends), ([0x0a000001, 0x0a000005], [0x0a000001, 0x0a000006]))
+        for ip in ('10.0.0.2', '10.0.0.4', '10.0.0.3'):
+            pool.release(ip)
+        self.assertEqual((pool._starts, pool._ends, pool.free), ([0x0a000001], [0x0a000006], 6))
+
+    def test_allocate_next_fit_wraps_around(self):
+        pool = cvbn_ipam.SubnetPool('10.0.0.0/29', gateway = '10.0.0.1')
+        self.assertEqual([pool.allocate() for index in range(3)], ['10.0.0.2', '10.0.0.3', '10.0.0.4'])
+        pool.release('10.0.0.2')
+        self.assertEqual([pool.allocate() for index in range(3)], ['10.0.0.5', '10.0.0.6', '10.0.0.2'])
+        self.assertEqual(pool.allocate(), None)
+
+    def test_invalid_pools_rejected(self):
+        self.assertRaises(ValueError, cvbn_ipam.SubnetPool, '10.0.0.0/24',
+                          [{'start': '10.0.0.10', 'end': '10.0.0.20'}, {'start': '10.0.0.20', 'end': '10.0.0.30'}])
+        self.assertRaises(ValueError, cvbn_ipam.SubnetPool, '10.0.0.0/24', [{'start': '10.0.0.9', 'end': '10.0.0.2'}])
+
+class GreIpamTest(unittest.TestCase):
+    def setUp(self):
+        self.ipam = cvbn_ipam.GreIpam([SUBNET], [{'id': 'gre-1', 'local_subnet': 'subnet-1',
+                                                  'local_endpoint': {'ip_address': '192.168.30.5'}}])
+
+    def test_concurrent_claims_of_one_endpoint(self):
+        results = []
+        start = threading.Event()
+
+        def claim():
+            start.wait(5)
+            results.append(self.ipam.claim('subnet-1', '192.168.30.10'))
+        threads = [threading.Thread(target = claim) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [(None, ['192.168.30.10'])] + [(cvbn_ipam.IN_USE, [])] * 7)
+
+    def test_claim_checks(self):
+        self.assertEqual(self.ipam.claim('subnet-1', '192.168.30.5'), (cvbn_ipam.IN_USE, []))
+        self.assertEqual(self.ipam.claim('subnet-1', '192.168.30.1'), (cvbn_ipam.IN_USE, []))
+        self.assertEqual(self.ipam.claim('subnet-1', '192.168.30.50'), (cvbn_ipam.NOT_IN_RANGE.format('192.168.30.50'), []))
+        # nothing reserved by a rejected claim
+        self.assertEqual(self.ipam.claim('subnet-1', '192.168.30.6', '192.168.30.5'), (cvbn_ipam.IN_USE, []))
+        self.assertTrue(self.ipam.subnet('subnet-1').isFree('192.168.30.6'))
+        self.assertEqual(self.ipam.claim('unknown', '1.1.1.1'), (None, []))
+
+    def test_port_keeps_claimed_endpoints_until_removed(self):
+        reason, claimed = self.ipam.claim('subnet-1', '192.168.30.10', '192.168.30.11')
+        port = {'id': 'gre-2', 'local_subnet': 'subnet-1', 'local_endpoint': {'ip_address': '192.168.30.10'},
+                'remote_endpoint': {'ip_address': '192.168.30.11'}}
+        self.ipam.addPort(port, claimed)
+        # a port reusing an endpoint of another one does not own it
+        self.ipam.addPort({'id': 'gre-3', 'local_subnet': 'subnet-1', 'local_endpoint': {'ip_address': '192.168.30.10'}})
+        self.ipam.removePort('gre-3')
+        self.assertFalse(self.ipam.subnet('subnet-1').isFree('192.168.30.10'))
+        self.ipam.removePort('gre-2')
+        self.assertEqual(self.ipam.check('subnet-1', '192.168.30.10', '192.168.30.11'), None)
+
+class GreAgent(object):
+    '''agent of a running switch with one subnet; creation of GRE ports waits for *proceed*'''
+    def __init__(self):
+        self.entered = threading.Event()
+        self.proceed = threading.Event()
+        self.proceed.set()
+        self.ports = []
+
+    def method(self, name):
+        return GreMethod(self, name)
+
+class GreMethod(object):
+    def __init__(self, agent, name):
+        self.agent = agent
+        self.name = name
+
+    def invoke(self, agent, cid, params):
+        tid = params['tid']
+        if self.name == 'set':
+            self.agent.entered.set()
+            self.agent.proceed.wait(5)
+            if params['name'] == 'failing':
+                raise RpcMethodError('internal error')
+            port = dict(params, id = 'gre-{}'.format(len(self.agent.ports) + 1))
+            self.agent.ports.append(port)
+            return {'id': port['id']}
+        if tid == 'compute.server':
+            return {'children': [{'tid': tid, 'id': 'run-1', 'configuration': {'tid': 'compute.vswitch', 'id': SWITCH}}]}
+        if tid == 'networking.subnet':
+            return SUBNET if self.name == 'get' else {'children': [SUBNET]}
+        if tid == 'networking.port.gre':
+            return {'children': list(self.agent.ports)}
+        return {'tid': tid, 'id': params.get('id')}
+
+class AddPortGreTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = GreAgent()
+        self.vswitch = cvbn_vswitch.vswitch('cvbb', 'h', factory = self.agent)
+        self.ipam = self.vswitch.greIpam(SWITCH)
+
+    def tearDown(self):
+        self.agent.proceed.set()
+
+    def add(self, name, local_ip):
+        return self.vswitch.addPortGre(SWITCH, 'subnet-1', name, local_ip = local_ip, remote_ip = None,
+                                       checksum = False, seqnum = False)
+
+    def test_endpoint_claimed_while_rpc_in_flight(self):
+        self.agent.proceed.clear()
+        results = []
+        first = threading.Thread(target = lambda: results.append(self.add('first', '192.168.30.10')))
+        first.start()
+        self.assertTrue(self.agent.entered.wait(5))
+        self.assertRaises(cvbn_vswitch.CvbnApiFailure, self.add, 'second', '192.168.30.10')
+        self.agent.proceed.set()
+        first.join()
+        self.assertEqual(results, ['gre-1'])
+        self.assertEqual(len(self.agent.ports), 1)
+
+    def test_failed_add_releases_endpoints(self):
+        self.assertRaises(cvbn_vswitch.CvbnApiFailure, self.add, 'failing', None)
+        self.assertEqual(self.ipam.subnet('subnet-1').free, 19)
+        self.assertEqual(self.add('gre', '192.168.30.2'), 'gre-1')
+        self.assertFalse(self.ipam.subnet('subnet-1').isFree('192.168.30.2'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_jsonstream
+    :synopsis: Tests of incremental JSON decoding
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cvbn_jsonstream
+
+DOCUMENT = {'meta': {'total_count': 3, 'note': u'caf\u00e9 [ , ] { }'},
+            'devices': [{'id': 'd-1', 'name': u'\u017c\u00f3\u0142w'}, {'id': 'd-2', 'size': 12345}, {'id': 'd-3', 'tags': []}]}
+
+def chunked(data, size):
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+class IterArrayTest(unittest.TestCase):
+    def test_items_equal_at_every_chunk_boundary(self):
+        data = json.dumps(DOCUMENT, ensure_ascii = False).encode('utf-8')
+        # every chunk size splits numbers, strings and multi-byte characters somewhere
+        for size in range(1, len(data) + 1):
+            items = list(cvbn_jsonstream.iter_array(chunked(data, size), 'devices'))
+            self.assertEqual(items, DOCUMENT['devices'], "chunk size {}".format(size))
+
+    def test_stops_reading_after_last_consumed_item(self):
+        read = []
+        def source():
+            for chunk in chunked(json.dumps(DOCUMENT).encode('utf-8'), 8):
+                read.append(chunk)
+                yield chunk
+        items = cvbn_jsonstream.iter_array(source(), 'devices')
+        self.assertEqual(next(items)['id'], 'd-1')
+        self.assertTrue(len(b''.join(read)) < len(json.dumps(DOCUMENT)))
+
+    def test_missing_key(self):
+        error = b'{"errors": "not found"}'
+        self.assertEqual(list(cvbn_jsonstream.iter_array(error, 'devices')), [])
+        self.assertRaises(ValueError, list, cvbn_jsonstream.iter_array(error, 'devices', required = True))
+        self.assertRaises(ValueError, list, cvbn_jsonstream.iter_array(b'{"devices": {}}', 'devices', required = True))
+        self.assertEqual(list(cvbn_jsonstream.iter_array(b'{"devices": []}', 'devices', required = True)), [])
+
+    def test_truncated_document(self):
+        data = json.dumps(DOCUMENT).encode('utf-8')
+        items = cvbn_jsonstream.iter_array(chunked(data[:-20], 16), 'devices')
+        self.assertEqual(next(items)['id'], 'd-1')
+        self.assertRaises(ValueError, list, items)
+
+if __name__ == '__main__':
+    unittest.main()
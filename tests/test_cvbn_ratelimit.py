@@ -0,0 +1,108 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_ratelimit
+    :synopsis: Tests of token buckets and adaptive concurrency
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_ratelimit
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = cvbn_ratelimit.TokenBucket(50, 5)
+        self.assertEqual([bucket.tryAcquire() for index in range(6)], [True] * 5 + [False])
+        start = time.time()
+        for index in range(5):
+            bucket.acquire()
+        # 5 tokens at 50/s
+        self.assertTrue(0.07 < time.time() - start < 0.5)
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def test_mixed_operations_are_not_overload(self):
+        limiter = cvbn_ratelimit.AdaptiveLimiter(initial = 8)
+        for index in range(50):
+            for operation, latency in ((('get', 'networking.port.gre'), 0.002),
+                                       (('walk', 'networking.vswitch.domain.ports'), 2.0)):
+                limiter.acquire()
+                limiter.release(latency, operation = operation)
+        self.assertTrue(limiter.limit > 8)
+
+    def test_slow_responses_and_server_errors_cut_limit(self):
+        limiter = cvbn_ratelimit.AdaptiveLimiter(initial = 8, backoff = 0.5)
+        limiter.acquire()
+        limiter.release(0.01, operation = 'get')
+        limiter.acquire()
+        limiter.release(0.05, operation = 'get')
+        # additive increase of the first response, then halved
+        self.assertEqual(limiter.limit, (8 + 1.0 / 8) / 2)
+        limiter.acquire()
+        limiter.release(0.01, overload = True, operation = 'get')
+        self.assertEqual(limiter.limit, (8 + 1.0 / 8) / 4)
+        # overloaded responses do not raise the baseline
+        self.assertEqual(limiter.baselines['get'], 0.01)
+
+    def test_operations_beyond_cap_share_baseline(self):
+        limiter = cvbn_ratelimit.AdaptiveLimiter()
+        for index in range(limiter.MAX_OPERATIONS + 10):
+            limiter.acquire()
+            limiter.release(0.01, operation = index)
+        self.assertEqual(len(limiter.baselines), limiter.MAX_OPERATIONS + 1)
+
+class FakeMethod(object):
+    '''RPC method slowing down above 4 requests in flight'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.peak = 0
+
+    def invoke(self, agent, cid, params):
+        with self.lock:
+            self.inflight = self.inflight + 1
+            self.peak = max(self.peak, self.inflight)
+            inflight = self.inflight
+        time.sleep(0.005 * (1 + max(0, inflight - 4)))
+        with self.lock:
+            self.inflight = self.inflight - 1
+        if params.get('fail'):
+            raise RpcMethodError(params['fail'])
+        return {}
+
+class RateLimitedMethodTest(unittest.TestCase):
+    def test_concurrency_limited_under_load(self):
+        limits = cvbn_ratelimit.Limits(serverRate = None, adaptive = {'initial': 16, 'maximum': 16})
+        fake = FakeMethod()
+        method = cvbn_ratelimit.RateLimitedMethod('walk', fake, limits, 'cvbb')
+        threads = [threading.Thread(target = lambda: [method.invoke('0', 1, {'tid': 't'}) for index in range(10)])
+                   for index in range(24)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(fake.peak <= 16)
+        self.assertTrue(limits.stats('cvbb')['limit'] < 16)
+        self.assertEqual(limits.stats('cvbb')['inflight'], 0)
+
+    def test_agent_errors_are_not_overload(self):
+        limits = cvbn_ratelimit.Limits(serverRate = None, adaptive = {'initial': 8})
+        method = cvbn_ratelimit.RateLimitedMethod('get', FakeMethod(), limits, 'cvbb')
+        for message in ('agent not connected', 'object not found'):
+            self.assertRaises(RpcMethodError, method.invoke, 'h', 1, {'tid': 't', 'fail': message})
+        self.assertTrue(limits.stats('cvbb')['limit'] >= 8)
+        self.assertRaises(RpcMethodError, method.invoke, 'h', 1, {'tid': 't', 'fail': 'connection refused'})
+        self.assertTrue(limits.stats('cvbb')['limit'] < 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_replay
+    :synopsis: Tests of recording and replay of exchanges
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Logs are written to a temporary directory and read back for replay.
+
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cvbn_replay
+
+class SlowMethod(object):
+    def invoke(self, agent, cid, params):
+        time.sleep(params['sleep'])
+        return {'id': params['id']}
+
+class TextResponse(object):
+    def __init__(self, text):
+        self.status_code = 200
+        self.text = text
+
+class EchoHttp(object):
+    '''answers with fixed text of *responses* per URL'''
+    def __init__(self, responses):
+        self.responses = responses
+
+    def get(self, url, *args, **kwargs):
+        return TextResponse(self.responses[url])
+
+    post = put = get
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'exchanges.log.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def entries(self):
+        log = cvbn_replay.ExchangeLog(self.path)
+        return [entry for entries in log._exchanges.values() for entry in entries]
+
+    def test_gaps_and_concurrency_reproduced(self):
+        log = cvbn_replay.ExchangeLog(self.path, 'w')
+        method = cvbn_replay.RecordingMethod('get', SlowMethod(), log)
+        # a 0.2s gap, then two overlapping requests of 0.2s
+        method.invoke('h', 1, {'id': 'a', 'sleep': 0.0})
+        time.sleep(0.2)
+        threads = [threading.Thread(target = method.invoke, args = ('h', 1, {'id': name, 'sleep': 0.2}))
+                   for name in ('b', 'c')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        log.close()
+        self.assertEqual(sorted(entry['p']['id'] for entry in self.entries()), ['a', 'b', 'c'])
+
+        replay = cvbn_replay.ReplayFactory(cvbn_replay.ExchangeLog(self.path), speed = 1.0).method('get')
+        start = time.time()
+        self.assertEqual(replay.invoke('h', 1, {'id': 'a', 'sleep': 0.0}), {'id': 'a'})
+        threads = [threading.Thread(target = replay.invoke, args = ('h', 1, {'id': name, 'sleep': 0.2}))
+                   for name in ('b', 'c')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # gap 0.2s + concurrent 0.2s, not 0.4s of the sequential durations only
+        self.assertTrue(0.35 < time.time() - start < 0.75, time.time() - start)
+
+    def test_redaction_keeps_text_without_credentials(self):
+        plain = '{"devices": [ {"id": 7,"name":"r1"} ]}'
+        token = '{"token_type": "bearer", "access_token": "abc"}'
+        log = cvbn_replay.ExchangeLog(self.path, 'w')
+        http = cvbn_replay.RecordingHttp(EchoHttp({'https://rcs/api/devices': plain, 'https://rcs/oauth': token}), log)
+        http.request('post', 'https://rcs/oauth', data = {'grant_type': 'password', 'password': 'secret'})
+        http.request('put', 'https://rcs/api/devices', data = '{"name" : "r1",  "username": "admin"}')
+        http.request('get', 'https://rcs/api/devices', data = '{"z": 1,  "a": 2}')
+        log.close()
+        with open(self.path, 'rb') as fd:
+            self.assertFalse(b'secret' in fd.read())
+        entries = dict((entry['m'], entry) for entry in self.entries())
+        self.assertEqual(entries['get']['x'], plain)
+        self.assertEqual(entries['get']['b'], '{"z": 1,  "a": 2}')
+        self.assertEqual(json.loads(entries['post']['x'])['access_token'], cvbn_replay.REDACTED)
+        self.assertEqual(entries['post']['b'], {'grant_type': 'password', 'password': cvbn_replay.REDACTED})
+        self.assertEqual(json.loads(entries['put']['b']), {'name': 'r1', 'username': cvbn_replay.REDACTED})
+
+        replay = cvbn_replay.ReplayHttp(cvbn_replay.ExchangeLog(self.path), speed = 0)
+        self.assertEqual(replay.request('get', 'https://rcs/api/devices', data = '{"z": 1,  "a": 2}').text, plain)
+        self.assertEqual(replay.request('put', 'https://rcs/api/devices',
+                                        data = '{"name" : "r1",  "username": "other"}').status_code, 200)
+        self.assertRaises(cvbn_replay.ReplayMiss, replay.request, 'get', 'https://rcs/api/devices',
+                          data = '{"z":1,"a":2}')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_retry
+    :synopsis: Tests of retries and circuit breakers
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+The fake method answers with the scripted errors first, then succeeds; backoff delays
+are recorded instead of slept.
+
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_retry
+
+class ScriptedMethod(object):
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = 0
+
+    def invoke(self, agent, cid, params):
+        self.sent = self.sent + 1
+        if self.errors:
+            raise RpcMethodError(self.errors.pop(0))
+        return {'id': params.get('id')}
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_open_probe_and_close(self):
+        breaker = cvbn_retry.CircuitBreaker(threshold = 2, reset = 0.05)
+        self.assertFalse(breaker.failure())
+        self.assertTrue(breaker.failure())
+        self.assertEqual(breaker.state, cvbn_retry.OPEN)
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        # only one probe while half-open
+        allowed = []
+        threads = [threading.Thread(target = lambda: allowed.append(breaker.allow())) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(allowed), [False, False, False, True])
+        self.assertEqual(breaker.state, cvbn_retry.HALF_OPEN)
+        # failed probe opens at once, successful one closes
+        self.assertTrue(breaker.failure())
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertEqual((breaker.state, breaker.failures), (cvbn_retry.CLOSED, 0))
+
+class RetryingMethodTest(unittest.TestCase):
+    def setUp(self):
+        self.breakers = cvbn_retry.Breakers(threshold = 3, reset = 60)
+        self.metrics = cvbn_retry.RetryMetrics()
+        self.delays = []
+
+    def wrap(self, name, method):
+        return cvbn_retry.RetryingMethod(name, method, 'cvbb', cvbn_retry.RetryPolicy(attempts = 3, jitter = False),
+                                         self.breakers, self.metrics, self.delays.append)
+
+    def test_transient_errors_retried_with_backoff(self):
+        method = ScriptedMethod('connection refused', 'timed out')
+        self.assertEqual(self.wrap('get', method).invoke('h', 1, {'id': 'n-1'}), {'id': 'n-1'})
+        self.assertEqual(method.sent, 3)
+        self.assertEqual(self.delays, [0.1, 0.2])
+        self.assertEqual(self.breakers.states(), {'cvbb': cvbn_retry.CLOSED})
+        self.assertEqual(self.metrics.snapshot('cvbb')['retries'], 2)
+
+    def test_request_and_agent_errors_not_retried_nor_counted(self):
+        for message in ('object not found', 'agent not connected', 'something odd'):
+            method = ScriptedMethod(message, message, message)
+            self.assertRaises(RpcMethodError, self.wrap('walk', method).invoke, 'h', 1, {})
+            self.assertEqual(method.sent, 1)
+        self.assertEqual(self.breakers.get('cvbb').failures, 0)
+
+    def test_writes_not_retried(self):
+        method = ScriptedMethod('connection reset')
+        self.assertRaises(RpcMethodError, self.wrap('set', method).invoke, 'h', 1, {})
+        self.assertEqual(method.sent, 1)
+        self.assertEqual(self.metrics.snapshot()['failures'], 1)
+
+    def test_repeated_delete_not_found_is_success(self):
+        method = ScriptedMethod('connection reset', 'object not found')
+        self.assertEqual(self.wrap('delete', method).invoke('h', 1, {'id': 'n-1'}), {})
+
+    def test_open_breaker_fails_fast(self):
+        method = ScriptedMethod(*(['server unavailable'] * 3))
+        self.assertRaises(RpcMethodError, self.wrap('get', method).invoke, 'h', 1, {})
+        self.assertEqual(self.breakers.states(), {'cvbb': cvbn_retry.OPEN})
+        self.assertRaises(cvbn_retry.RpcCircuitOpen, self.wrap('walk', method).invoke, 'h', 1, {})
+        self.assertEqual(method.sent, 3)
+        self.assertEqual(self.metrics.snapshot('cvbb')['opened'], 1)
+        self.assertEqual(self.metrics.snapshot('cvbb')['rejected'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_scheduler
+    :synopsis: Tests of 'Scheduler' class
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Slots are taken by requests blocked on an event, the test then queues more requests
+and lets them through one slot at a time.
+
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cvbn_deadline
+import cvbn_scheduler
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = cvbn_scheduler.Scheduler(capacity = 1)
+        self.release = threading.Event()
+        self.order = []
+        self.threads = []
+
+    def tearDown(self):
+        self.release.set()
+        for thread in self.threads:
+            thread.join(5)
+
+    def start(self, cls, key, fn):
+        thread = threading.Thread(target = lambda: self.scheduler.call(cls, key, fn))
+        thread.start()
+        self.threads.append(thread)
+
+    def queue(self, cls, key, name, count = 1):
+        for index in range(count):
+            queued = self.scheduler.stats()['queued'][cls]
+            self.start(cls, key, lambda: self.order.append(name))
+            while self.scheduler.stats()['queued'][cls] == queued:
+                time.sleep(0.001)
+
+    def block(self):
+        self.start(cvbn_scheduler.BULK, 'blocker', lambda: self.release.wait(5))
+        while self.scheduler.stats()['running'][cvbn_scheduler.BULK] == 0:
+            time.sleep(0.001)
+
+    def test_round_robin_per_key_and_interactive_first(self):
+        self.block()
+        self.queue(cvbn_scheduler.BULK, 'switch-a', 'a', 3)
+        self.queue(cvbn_scheduler.BULK, 'switch-b', 'b', 2)
+        self.queue(cvbn_scheduler.INTERACTIVE, 'user', 'i')
+        self.release.set()
+        for thread in self.threads:
+            thread.join(5)
+        self.assertEqual(self.order, ['i', 'a', 'b', 'a', 'b', 'a'])
+
+    def test_wait_bounded_by_deadline(self):
+        self.block()
+        start = time.time()
+        with cvbn_deadline.deadline(0.1):
+            self.assertRaises(cvbn_deadline.DeadlineExceeded, self.scheduler.call,
+                              cvbn_scheduler.INTERACTIVE, 'user', lambda: self.order.append('late'))
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(self.scheduler.stats()['queued'][cvbn_scheduler.INTERACTIVE], 0)
+        self.release.set()
+        self.scheduler.call(cvbn_scheduler.INTERACTIVE, 'user', lambda: self.order.append('next'))
+        self.assertEqual(self.order, ['next'])
+
+    def test_interrupted_wait_leaves_no_ticket(self):
+        self.block()
+        waits = []
+
+        def interrupt(timeout = None):
+            waits.append(timeout)
+            raise KeyboardInterrupt()
+        cond = self.scheduler._cond
+        cond.wait = interrupt
+        try:
+            self.assertRaises(KeyboardInterrupt, self.scheduler.acquire, cvbn_scheduler.BULK, 'switch-a')
+        finally:
+            del cond.wait
+        self.assertEqual(waits, [None])
+        self.assertEqual(self.scheduler.stats()['queued'], {'interactive': 0, 'bulk': 0})
+        self.release.set()
+        self.scheduler.call(cvbn_scheduler.BULK, 'switch-a', lambda: self.order.append('a'))
+        self.assertEqual(self.scheduler.stats()['running'], {'interactive': 0, 'bulk': 0})
+
+if __name__ == '__main__':
+    unittest.main()
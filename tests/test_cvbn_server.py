@@ -0,0 +1,115 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_server
+    :synopsis: Tests of 'vbn' class
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Tests run against fake RPC method factory passed as *factory*, no server is needed.
+
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_cidr
+import cvbn_server
+
+class FakeMethod(object):
+    def __init__(self, factory, name):
+        self.factory = factory
+        self.name = name
+
+    def invoke(self, agent, cid, params):
+        self.factory.calls.append((self.name, params.get('tid')))
+        if self.name == 'walk':
+            return {'children': list(self.factory.subnets)}
+        if self.name == 'set':
+            self.factory.entered.set()
+            self.factory.proceed.wait(5)
+            if params['name'] == 'failing':
+                raise RpcMethodError('internal error')
+            obj = dict(params, id = 'subnet-{}'.format(len(self.factory.subnets)))
+            self.factory.subnets.append(obj)
+            return obj
+        raise AssertionError("unexpected method {}".format(self.name))
+
+class FakeFactory(object):
+    def __init__(self, subnets):
+        self.subnets = list(subnets)
+        self.calls = []
+        self.entered = threading.Event()
+        self.proceed = threading.Event()
+        self.proceed.set()
+
+    def method(self, name):
+        return FakeMethod(self, name)
+
+class AddSubnetTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = FakeFactory([{'tid': 'networking.subnet', 'id': 'subnet-0', 'cidr': '192.168.30.0/24'}])
+        self.server = cvbn_server.vbn("localhost", "none", factory = self.factory)
+        self.server.subnetIndex()
+        del self.factory.calls[:]
+
+    def tearDown(self):
+        self.factory.proceed.set()
+
+    def test_overlapping_cidr_rejected_before_rpc(self):
+        self.assertRaises(cvbn_server.CvbnApiFailure, self.server.addSubnet,
+                          'sub1', '192.168.30.128/25', 'none', 'net1', 'none', 'none')
+        self.assertEqual(self.factory.calls, [])
+
+    def test_free_cidr_added_and_indexed(self):
+        subnetId = self.server.addSubnet('sub1', '192.168.31.0/24', 'none', 'net1', 'none', 'none')
+        self.assertEqual(self.factory.calls, [('set', 'networking.subnet')])
+        self.assertRaises(cvbn_server.CvbnApiFailure, self.server.addSubnet,
+                          'sub2', '192.168.31.0/25', 'none', 'net1', 'none', 'none')
+        self.assertEqual(subnetId, 'subnet-1')
+        self.assertEqual(len(self.factory.calls), 1)
+
+    def test_cidr_claimed_while_rpc_in_flight(self):
+        self.factory.proceed.clear()
+        results = []
+        first = threading.Thread(target = lambda: results.append(
+            self.server.addSubnet('sub1', '192.168.31.0/24', 'none', 'net1', 'none', 'none')))
+        first.start()
+        self.assertTrue(self.factory.entered.wait(5))
+        self.assertRaises(cvbn_server.CvbnApiFailure, self.server.addSubnet,
+                          'sub2', '192.168.31.128/25', 'none', 'net1', 'none', 'none')
+        self.factory.proceed.set()
+        first.join()
+        self.assertEqual(results, ['subnet-1'])
+        self.assertEqual(self.server.subnetIndex().overlaps('192.168.31.0/26'), '192.168.31.0/24')
+
+    def test_failed_add_releases_cidr(self):
+        self.assertRaises(cvbn_server.CvbnApiFailure, self.server.addSubnet,
+                          'failing', '192.168.31.0/24', 'none', 'net1', 'none', 'none')
+        self.assertEqual(self.server.subnetIndex().overlaps('192.168.31.0/24'), None)
+        self.assertEqual(self.server.addSubnet('sub1', '192.168.31.0/24', 'none', 'net1', 'none', 'none'),
+                         'subnet-1')
+
+class CidrIndexTest(unittest.TestCase):
+    def test_claim_and_release(self):
+        index = cvbn_cidr.CidrIndex([{'id': 'subnet-0', 'cidr': '10.0.0.0/16'}])
+        self.assertEqual(index.claim('10.0.5.0/24'), "10.0.5.0/24 overlaps with 10.0.0.0/16")
+        self.assertEqual(index.claim('10.1.0.0/16'), None)
+        self.assertEqual(index.claim('10.1.2.0/24'), "10.1.2.0/24 overlaps with 10.1.0.0/16")
+        self.assertEqual(index.suggest(16, '10.0.0.0/8'), '10.2.0.0/16')
+        index.release('10.1.0.0/16')
+        self.assertEqual(index.overlaps('10.1.2.0/24'), None)
+        self.assertEqual(index.claim('10.1.0.0/16'), None)
+        index.release('10.1.0.0/16', 'subnet-1')
+        index.remove('subnet-1')
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.claim('bad'), "invalid CIDR bad")
+
+if __name__ == '__main__':
+    unittest.main()
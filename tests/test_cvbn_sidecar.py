@@ -0,0 +1,114 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_sidecar
+    :synopsis: Tests of 'Sidecar' daemon and its clients
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Sidecar is served on a Unix socket in a temporary directory; behind it a fake HTTP
+layer stands in for the RCS server and a fake RPC factory for the CvBB server.
+
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_sidecar
+import rcs_module
+
+DEVICES = [{'id': 'd-1', 'name': 'first', 'uid': 'u-1'}, {'id': 'd-2', 'name': 'second', 'uid': 'u-2'}]
+
+class FakeResponse(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.headers = {'Content-Type': 'application/json'}
+        self.text = json.dumps(body)
+
+class FakeRcsServer(object):
+    '''HTTP layer answering token and /admin/devices requests'''
+    def __init__(self):
+        self.requests = []
+        self.status = 200
+
+    def post(self, url, **kwargs):
+        self.requests.append(('post', url))
+        return FakeResponse(200, {'access_token': 'token'})
+
+    def get(self, url, **kwargs):
+        self.requests.append(('get', url))
+        if self.status != 200:
+            return FakeResponse(self.status, {'errors': 'unauthorized'})
+        return FakeResponse(200, {'meta': {'total_count': len(DEVICES)}, 'devices': DEVICES})
+
+class FakeMethod(object):
+    def __init__(self, factory, name):
+        self.factory = factory
+        self.name = name
+
+    def invoke(self, agent, cid, params):
+        self.factory.calls.append(self.name)
+        if params.get('id') == 'missing':
+            raise RpcMethodError('object not found')
+        return {'children': [{'tid': params['tid'], 'id': 'n-1'}]}
+
+class FakeFactory(object):
+    def __init__(self):
+        self.calls = []
+
+    def method(self, name):
+        return FakeMethod(self, name)
+
+class SidecarTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cvbn.sock')
+        self.server = FakeRcsServer()
+        self.factory = FakeFactory()
+        self.sidecar = cvbn_sidecar.Sidecar(self.path, ttl = 60, factory = lambda server: self.factory,
+                                            http = self.server)
+        self.sidecar.serve(background = True)
+        rcs_def = {'server': 'rcs.example.com', 'port': '8080', 'client_id': 'admin',
+                   'client_secret': 'secret', 'grant_type': 'password',
+                   'username': 'admin@example.com', 'password': 'password'}
+        self.rcs = rcs_module.rcs(rcs_def, http = cvbn_sidecar.SidecarHttp(self.path))
+
+    def tearDown(self):
+        self.sidecar.shutdown()
+        shutil.rmtree(self.directory)
+
+    def test_rcs_streamed_list_through_sidecar(self):
+        self.assertEqual([device['id'] for device in self.rcs.iterAdminDevices()], ['d-1', 'd-2'])
+        self.assertEqual(self.rcs.getAdminDeviceIdByName('second'), 'd-2')
+        self.assertEqual(self.rcs.getAdminDeviceIdByUid('u-1'), 'd-1')
+        self.assertEqual(self.rcs.getAdminDeviceIdByName('none'), None)
+        # one token request, the list is read once and answered from the cache since
+        self.assertEqual([method for method, url in self.server.requests], ['post', 'get'])
+
+    def test_rcs_error_status_not_cached(self):
+        self.server.status = 401
+        self.assertRaises(rcs_module.RcsApiFailure, self.rcs.getAdminDeviceIdByName, 'first')
+        self.server.status = 200
+        self.assertEqual(self.rcs.getAdminDeviceIdByName('first'), 'd-1')
+
+    def test_rpc_result_cached_and_error_raised(self):
+        factory = cvbn_sidecar.SidecarFactory(self.path, 'cvbb.example.com')
+        for attempt in (0, 1):
+            result = factory.method('walk').invoke('agent', 1, {'tid': 'networking.network'})
+            self.assertEqual(result['children'][0]['id'], 'n-1')
+        self.assertEqual(self.factory.calls, ['walk'])
+        for attempt in (0, 1):
+            self.assertRaises(RpcMethodError, factory.method('get').invoke,
+                              'agent', 1, {'tid': 'networking.network', 'id': 'missing'})
+        self.assertEqual(self.factory.calls, ['walk', 'get', 'get'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_singleflight
+    :synopsis: Tests of coalescing of concurrent reads
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Reads of the fake method block until the test lets them return, so followers can
+join the read in flight.
+
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_singleflight
+
+class BlockingMethod(object):
+    def __init__(self):
+        self.proceed = threading.Event()
+        self.sent = []
+        self.version = 0
+        self.error = None
+
+    def invoke(self, agent, cid, params):
+        self.sent.append(params['tid'])
+        version = self.version
+        if params.get('name') != None:
+            # writes are not held
+            return {'id': 'n-1'}
+        self.proceed.wait(5)
+        if self.error != None:
+            raise self.error
+        return {'children': [{'id': 'n-1', 'version': version}]}
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.group = cvbn_singleflight.SingleFlight()
+        self.method = BlockingMethod()
+        self.results = []
+        self.errors = []
+        self.threads = []
+
+    def tearDown(self):
+        self.method.proceed.set()
+        for thread in self.threads:
+            thread.join(5)
+
+    def wrapper(self, name):
+        return cvbn_singleflight.CoalescingMethod(name, self.method, self.group, 'cvbb')
+
+    def read(self):
+        def run():
+            try:
+                self.results.append(self.wrapper('walk').invoke('h', 1, {'tid': 'networking.network'}))
+            except RpcMethodError as error:
+                self.errors.append(error)
+        calls = self.group.stats['calls'] + self.group.stats['coalesced']
+        thread = threading.Thread(target = run)
+        thread.start()
+        self.threads.append(thread)
+        while self.group.stats['calls'] + self.group.stats['coalesced'] == calls:
+            time.sleep(0.001)
+
+    def finish(self):
+        self.method.proceed.set()
+        for thread in self.threads:
+            thread.join(5)
+
+    def test_concurrent_reads_share_one_rpc_and_get_own_copies(self):
+        for index in range(4):
+            self.read()
+        self.finish()
+        self.assertEqual(self.method.sent, ['networking.network'])
+        self.assertEqual(self.group.stats['coalesced'], 3)
+        self.results[0]['children'][0]['id'] = 'changed'
+        for result in self.results[1:]:
+            self.assertEqual(result['children'][0]['id'], 'n-1')
+        self.assertEqual(len(set(id(result) for result in self.results)), 4)
+
+    def test_error_raised_to_every_caller(self):
+        self.method.error = RpcMethodError('agent not connected')
+        for index in range(3):
+            self.read()
+        self.finish()
+        self.assertEqual(len(self.errors), 3)
+        self.assertEqual(self.method.sent, ['networking.network'])
+        # the failed call is not cached
+        self.method.error = None
+        self.assertEqual(self.wrapper('walk').invoke('h', 1, {'tid': 'networking.network'})['children'][0]['version'], 0)
+
+    def test_read_after_write_does_not_join_older_read(self):
+        self.read()
+        self.method.version = 1
+        self.wrapper('set').invoke('h', 1, {'tid': 'networking.network', 'name': 'vm'})
+        self.read()
+        self.finish()
+        self.assertEqual(self.group.stats['coalesced'], 0)
+        self.assertEqual(sorted(result['children'][0]['version'] for result in self.results), [0, 1])
+
+    def test_generation_of_other_endpoint_kept(self):
+        self.group.forget('other')
+        self.read()
+        other = cvbn_singleflight.CoalescingMethod('walk', self.method, self.group, 'cvbb')
+        thread = threading.Thread(target = lambda: self.results.append(other.invoke('h', 1, {'tid': 'networking.network'})))
+        thread.start()
+        self.threads.append(thread)
+        while self.group.stats['coalesced'] == 0:
+            time.sleep(0.001)
+        self.finish()
+        self.assertEqual(len(self.method.sent), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_snapshot
+    :synopsis: Tests of snapshot store in memory-mapped file
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+Writer and readers map the same file in a temporary directory; a writer dying in the
+middle of a write is simulated by leaving odd sequence numbers in the file.
+
+"""
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cvbn_snapshot
+
+SOURCE = 'vswitch:cvbb'
+SWITCH = 'ea2db47c-1cbe-4846-9ba6-141c3ac59508'
+
+def networks(count, name = 'net'):
+    return [{'tid': 'networking.network', 'id': 'n-{}'.format(index), 'name': name} for index in range(count)]
+
+class SnapshotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cvbn.snap')
+        self.saved = cvbn_snapshot.READ_TIMEOUT
+        cvbn_snapshot.READ_TIMEOUT = 0.05
+        self.stores = []
+
+    def tearDown(self):
+        cvbn_snapshot.READ_TIMEOUT = self.saved
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.directory)
+
+    def open(self, **kwargs):
+        store = cvbn_snapshot.SnapshotStore(self.path, **kwargs)
+        self.stores.append(store)
+        return store
+
+    def test_reader_sees_writes_and_decodes_changed_only(self):
+        writer = self.open(writable = True, size = 1 << 20, slots = 16)
+        reader = self.open()
+        writer.put(SOURCE, SWITCH, 'networking.network', networks(2))
+        first = reader.get(SOURCE, SWITCH, 'networking.network')
+        self.assertEqual(first, networks(2))
+        self.assertTrue(reader.get(SOURCE, SWITCH, 'networking.network') is first)
+        writer.put(SOURCE, SWITCH, 'networking.network', networks(300))
+        self.assertEqual(reader.get(SOURCE, SWITCH, 'networking.network'), networks(300))
+        self.assertEqual(reader.raw(SOURCE, SWITCH, 'networking.network')[1], cvbn_snapshot.ZLIB)
+        writer.forget(SOURCE, SWITCH, 'networking.network')
+        self.assertEqual(reader.get(SOURCE, SWITCH, 'networking.network'), None)
+
+    def test_removed_slots_reused_with_new_versions(self):
+        writer = self.open(writable = True, size = 1 << 20, slots = 4)
+        versions = [writer.put(SOURCE, 'switch-{}'.format(index), 'networking.network', networks(1))
+                    for index in range(4)]
+        self.assertRaises(ValueError, writer.put, SOURCE, 'switch-4', 'networking.network', networks(1))
+        writer.forget(SOURCE, 'switch-1', 'networking.network')
+        versions.append(writer.put(SOURCE, 'switch-4', 'networking.network', networks(1)))
+        self.assertEqual(len(set(versions)), 5)
+        self.assertEqual(writer.stats()['used'], 4)
+        self.assertEqual(writer.stats()['removed'], 0)
+        self.assertEqual(writer.get(SOURCE, 'switch-3', 'networking.network'), networks(1))
+
+    def test_compaction_keeps_live_snapshots(self):
+        writer = self.open(writable = True, size = cvbn_snapshot.HEADER_SIZE + 8 * cvbn_snapshot.SLOT_SIZE + 4096,
+                           slots = 8)
+        reader = self.open()
+        writer.put(SOURCE, SWITCH, 'networking.subnet', networks(3, 'kept'))
+        for index in range(50):
+            writer.put(SOURCE, SWITCH, 'networking.network', networks(5, 'v{}'.format(index)))
+        stats = writer.stats()
+        self.assertTrue(stats['generation'] >= 2 and stats['generation'] % 2 == 0)
+        self.assertEqual(reader.get(SOURCE, SWITCH, 'networking.subnet'), networks(3, 'kept'))
+        self.assertEqual(reader.get(SOURCE, SWITCH, 'networking.network'), networks(5, 'v49'))
+
+    def test_concurrent_reader_never_sees_partial_write(self):
+        writer = self.open(writable = True, size = cvbn_snapshot.HEADER_SIZE + 8 * cvbn_snapshot.SLOT_SIZE + 16384,
+                           slots = 8)
+        writer.put(SOURCE, SWITCH, 'networking.network', networks(10, 'v0'))
+        reader = self.open()
+        stop = threading.Event()
+        seen = []
+
+        def read():
+            while not stop.is_set():
+                objects = reader.get(SOURCE, SWITCH, 'networking.network')
+                seen.append(len(set(obj['name'] for obj in objects)) == 1 and len(objects) == 10)
+        thread = threading.Thread(target = read)
+        thread.start()
+        try:
+            for index in range(300):
+                writer.put(SOURCE, SWITCH, 'networking.network', networks(10, 'v{}'.format(index)))
+        finally:
+            stop.set()
+            thread.join()
+        self.assertTrue(seen and all(seen))
+        self.assertTrue(writer.stats()['generation'] > 0)
+
+    def test_dead_writer_repaired_by_next_writer(self):
+        writer = self.open(writable = True, size = 1 << 20, slots = 4)
+        writer.put(SOURCE, SWITCH, 'networking.network', networks(1))
+        index = writer._find(cvbn_snapshot._digest(SOURCE, SWITCH, 'networking.network'))[0]
+        position = cvbn_snapshot.HEADER_SIZE + index * cvbn_snapshot.SLOT_SIZE
+        seq = cvbn_snapshot._SEQ.unpack_from(writer._map, position)[0]
+        # writer died in the middle of the slot write and of a compaction
+        cvbn_snapshot._SEQ.pack_into(writer._map, position, seq + 1)
+        struct.pack_into('<Q', writer._map, cvbn_snapshot._GENERATION_OFFSET, 1)
+        reader = self.open()
+        self.assertRaises(IOError, reader.get, SOURCE, SWITCH, 'networking.network')
+        self.open(writable = True)
+        self.assertEqual(reader.get(SOURCE, SWITCH, 'networking.network'), networks(1))
+        self.assertEqual(writer.put(SOURCE, SWITCH, 'networking.network', networks(2)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
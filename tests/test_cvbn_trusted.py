@@ -0,0 +1,69 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_trusted
+    :synopsis: Tests of trusted mode of 'vswitch'
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+The switch is defined and running, but its own agent rejects every request.
+
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_vswitch
+
+SWITCH = 'ea2db47c-1cbe-4846-9ba6-141c3ac59508'
+
+class RejectingMethod(object):
+    def __init__(self, factory, name):
+        self.factory = factory
+        self.name = name
+
+    def invoke(self, agent, cid, params):
+        self.factory.requests.append((self.name, params['tid']))
+        if agent == SWITCH:
+            raise RpcMethodError('agent not connected')
+        if params['tid'] == 'compute.vswitch':
+            return {'tid': 'compute.vswitch', 'id': params['id']}
+        return {'children': [{'tid': 'compute.server', 'id': 'run-1',
+                              'configuration': {'tid': 'compute.vswitch', 'id': SWITCH}}]}
+
+class RejectingFactory(object):
+    def __init__(self):
+        self.requests = []
+
+    def method(self, name):
+        return RejectingMethod(self, name)
+
+class TrustedModeTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = RejectingFactory()
+        self.vswitch = cvbn_vswitch.vswitch('cvbb', 'h', factory = self.factory)
+        self.vswitch.setTrusted(True)
+
+    def test_getters_raise_on_rejection(self):
+        self.assertRaises(cvbn_vswitch.CvbnApiFailure, self.vswitch.getNetworks, SWITCH)
+        self.assertRaises(cvbn_vswitch.CvbnApiFailure, self.vswitch.getPortVlanId, SWITCH, 'p-1')
+        self.assertRaises(cvbn_vswitch.CvbnApiFailure, self.vswitch.isPortGreAnyDomain, SWITCH, 'p-1')
+
+    def test_mutators_report_rejection_as_result(self):
+        self.assertFalse(self.vswitch.deleteNetwork(SWITCH, 'n-1'))
+        self.assertFalse(self.vswitch.deletePortVlan(SWITCH, 'p-1'))
+        self.assertEqual(self.vswitch.addNetwork(SWITCH, 'net', 'eth1', None), None)
+        # no preflight lookups of the switch
+        self.assertFalse(('walk', 'compute.server') in self.factory.requests)
+
+    def test_default_mode_raises(self):
+        self.vswitch.setTrusted(False)
+        self.assertRaises(cvbn_vswitch.CvbnApiFailure, self.vswitch.deletePortVlan, SWITCH, 'p-1')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_vlan
+    :synopsis: Tests of VLAN index and VLAN port adds of 'vswitch'
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+'vswitch' talks to a fake agent holding objects per (agent, tid); creation of VLAN
+ports can be held in the RPC to overlap concurrent adds.
+
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_vlan
+import cvbn_vswitch
+
+SWITCH = 'ea2db47c-1cbe-4846-9ba6-141c3ac59508'
+NETWORK = '33b97119-3d45-4790-b888-eb9e5e1c6430'
+
+class FakeAgent(object):
+    def __init__(self):
+        self.objects = {}
+        self.created = threading.Event()
+        self.proceed = threading.Event()
+        self.proceed.set()
+        self.ids = 0
+        self.put('h/cvbn-switch-agent', {'tid': 'compute.vswitch', 'id': SWITCH})
+        self.put('h/cvbn-switch-agent', {'tid': 'compute.server', 'id': 'run-1',
+                                         'configuration': {'tid': 'compute.vswitch', 'id': SWITCH}})
+        self.put(SWITCH, {'tid': 'networking.network', 'id': NETWORK, 'host_interface': 'eth1'})
+        self.put(SWITCH, {'tid': 'networking.port.raw', 'id': 'p-666', 'network_id': NETWORK, 'vlan_ids': [666]})
+
+    def put(self, agent, obj):
+        self.objects.setdefault((agent, obj['tid']), {})[obj['id']] = obj
+
+    def method(self, name):
+        return FakeMethod(self, name)
+
+class FakeMethod(object):
+    def __init__(self, agent, name):
+        self.agent = agent
+        self.name = name
+
+    def invoke(self, agent, cid, params):
+        objects = self.agent.objects.get((agent, params['tid']), {})
+        if self.name == 'walk':
+            return {'children': list(objects.values())}
+        if self.name == 'get':
+            if params['id'] not in objects:
+                raise RpcMethodError('object not found')
+            return objects[params['id']]
+        if self.name == 'set':
+            self.agent.created.set()
+            self.agent.proceed.wait(5)
+            if params['name'] == 'failing':
+                raise RpcMethodError('internal error')
+            self.agent.ids = self.agent.ids + 1
+            obj = dict(params, id = 'p-{}'.format(self.agent.ids))
+            self.agent.put(agent, obj)
+            return {'id': obj['id']}
+        raise AssertionError("unexpected method {}".format(self.name))
+
+class VlanIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = cvbn_vlan.VlanIndex([{'id': NETWORK, 'host_interface': 'eth1'}],
+                                         [{'id': 'p-666', 'network_id': NETWORK, 'vlan_ids': [666]}])
+
+    def test_claim_reserves_until_released(self):
+        self.assertEqual(self.index.claim(NETWORK, '100'), (None, 100))
+        self.assertEqual(self.index.claim(NETWORK, 100), (cvbn_vlan.IN_USE.format(100, 'eth1'), None))
+        self.index.release(NETWORK, 100)
+        self.assertEqual(self.index.claim(NETWORK, 100), (None, 100))
+
+    def test_claim_rejects_invalid_and_used(self):
+        self.assertEqual(self.index.claim(NETWORK, '4095')[0], cvbn_vlan.INVALID.format(4095))
+        self.assertEqual(self.index.claim(NETWORK, 'x')[0], cvbn_vlan.INVALID.format('x'))
+        self.assertEqual(self.index.claim(NETWORK, 666)[0], cvbn_vlan.IN_USE.format(666, 'eth1'))
+        # unknown network: nothing to check against, nothing reserved
+        self.assertEqual(self.index.claim('other', 666), (None, None))
+
+    def test_allocate_exhausted(self):
+        vlans = self.index._set('eth1')
+        for vlan in range(cvbn_vlan.VLAN_MIN, cvbn_vlan.VLAN_MAX):
+            vlans.add(vlan)
+        self.assertEqual(self.index.allocate(NETWORK), cvbn_vlan.VLAN_MAX)
+        self.assertEqual(self.index.allocate(NETWORK), None)
+
+class AddPortVlanTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = FakeAgent()
+        self.vswitch = cvbn_vswitch.vswitch('cvbb', 'h', factory = self.agent)
+        self.index = self.vswitch.vlanIndex(SWITCH)
+
+    def tearDown(self):
+        self.agent.proceed.set()
+
+    def test_concurrent_adds_of_one_vlan(self):
+        self.agent.proceed.clear()
+        results = []
+        first = threading.Thread(target = lambda: results.append(self.vswitch.addPortVlan(SWITCH, NETWORK, 'first', '100')))
+        first.start()
+        self.assertTrue(self.agent.created.wait(5))
+        # the first add is inside its RPC, its VLAN is claimed
+        self.assertRaises(cvbn_vswitch.CvbnApiFailure, self.vswitch.addPortVlan, SWITCH, NETWORK, 'second', '100')
+        self.agent.proceed.set()
+        first.join()
+        self.assertEqual(results, ['p-1'])
+        self.assertEqual(self.index.used('eth1'), [100, 666])
+
+    def test_failed_add_releases_claim(self):
+        self.assertRaises(cvbn_vswitch.CvbnApiFailure, self.vswitch.addPortVlan, SWITCH, NETWORK, 'failing', '100')
+        self.assertEqual(self.index.used('eth1'), [666])
+        self.assertEqual(self.vswitch.addPortVlan(SWITCH, NETWORK, 'vlan100', '100'), 'p-1')
+
+    def test_picked_vlan(self):
+        self.assertEqual(self.vswitch.addPortVlan(SWITCH, NETWORK, 'any', None), 'p-1')
+        self.assertEqual(self.agent.objects[(SWITCH, 'networking.port.raw')]['p-1']['vlan_ids'], ['1'])
+        self.assertEqual(self.index.used('eth1'), [1, 666])
+
+if __name__ == '__main__':
+    unittest.main()
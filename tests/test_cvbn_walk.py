@@ -0,0 +1,136 @@
+### Copyright (c) Cisco Systems Inc. 2016 -
+### Author Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+.. module:: test_cvbn_walk
+    :synopsis: Tests of filtered and streamed walks
+
+.. moduleauthor:: Arkadiusz Kaliwoda <akaliwod@cisco.com>
+
+"""
+
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cvbx_rpc_tools.method import RpcMethodError
+import cvbn_vswitch
+import cvbn_walk
+
+PORTS = [{'domain': {'id': 'd-{}'.format(index)}, 'port': {'tid': 'networking.port.gre', 'id': 'gre-{}'.format(index)}}
+         for index in range(20)]
+
+class StreamMethod(object):
+    '''walk method returning raw response chunks; agent rejects pushed filters with *reject*'''
+    def __init__(self, children, reject = None, chunk = 16):
+        self.data = json.dumps({'children': children}).encode('utf-8')
+        self.reject = reject
+        self.chunk = chunk
+        self.requests = []
+        self.failure = None
+
+    def stream(self, agent, cid, params):
+        self.requests.append(params)
+        if self.reject != None and len(params) > 1:
+            raise RpcMethodError(self.reject)
+        return self.chunks()
+
+    def chunks(self):
+        for offset in range(0, len(self.data), self.chunk):
+            if self.failure != None and offset >= len(self.data) // 2:
+                raise self.failure
+            yield self.data[offset:offset + self.chunk]
+
+class WalkFailure(Exception):
+    pass
+
+class StreamedWalkTest(unittest.TestCase):
+    def test_error_while_iterating_is_converted(self):
+        method = StreamMethod(PORTS)
+        method.failure = RpcMethodError('connection reset')
+        children = cvbn_walk.walk(method, 'agent', 1, 'networking.vswitch.domain.ports', failure = WalkFailure)
+        self.assertEqual(next(children), PORTS[0])
+        self.assertRaises(WalkFailure, list, children)
+
+    def test_malformed_stream_is_converted(self):
+        method = StreamMethod(PORTS)
+        method.data = method.data[:-30]
+        children = cvbn_walk.walk(method, 'agent', 1, 'networking.vswitch.domain.ports', failure = WalkFailure)
+        self.assertRaises(WalkFailure, list, children)
+
+    def test_malformed_start_raised_by_walk_call(self):
+        method = StreamMethod(PORTS)
+        method.data = b'{"children": [{"id": '
+        self.assertRaises(ValueError, cvbn_walk.walk, method, 'agent', 1, 'networking.network')
+
+class FilterSupportTest(unittest.TestCase):
+    filters = {'port.tid': 'networking.port.gre', 'port.id': 'gre-7'}
+
+    def test_unsupported_parameters_fall_back(self):
+        support = cvbn_walk.FilterSupport()
+        method = StreamMethod(PORTS, reject = 'unsupported walk parameter port')
+        self.assertEqual(list(cvbn_walk.walk(method, 'agent', 1, 'networking.vswitch.domain.ports', self.filters, support)),
+                         [PORTS[7]])
+        self.assertEqual(support.state('networking.vswitch.domain.ports'), cvbn_walk.UNSUPPORTED)
+        list(cvbn_walk.walk(method, 'agent', 1, 'networking.vswitch.domain.ports', self.filters, support))
+        self.assertEqual([len(params) for params in method.requests], [2, 1, 1])
+
+    def test_other_errors_keep_capability_unknown(self):
+        support = cvbn_walk.FilterSupport()
+        method = StreamMethod(PORTS, reject = 'agent not connected')
+        self.assertRaises(RpcMethodError, cvbn_walk.walk, method, 'agent', 1,
+                          'networking.vswitch.domain.ports', self.filters, support)
+        self.assertEqual(support.state('networking.vswitch.domain.ports'), cvbn_walk.UNKNOWN)
+
+class CountingAgent(object):
+    '''switch agent with GRE ports gre-0..gre-19, each member of own domain'''
+    def __init__(self):
+        self.requests = []
+
+    def method(self, name):
+        return CountingMethod(self, name)
+
+class CountingMethod(object):
+    def __init__(self, agent, name):
+        self.agent = agent
+        self.name = name
+
+    def invoke(self, agent, cid, params):
+        self.agent.requests.append((self.name, params['tid']))
+        tid = params['tid']
+        if tid == 'compute.vswitch':
+            return {'tid': tid, 'id': params.get('id')}
+        if tid == 'compute.server':
+            return {'children': [{'tid': tid, 'id': 'run-1', 'configuration': {'tid': 'compute.vswitch', 'id': 's1'}}]}
+        if tid == 'networking.vswitch.domain':
+            return {'children': [{'tid': tid, 'id': port['domain']['id']} for port in PORTS]}
+        if tid == 'networking.vswitch.domain.ports':
+            return {'children': PORTS}
+        if tid == 'networking.port.gre' and self.name == 'get':
+            return {'tid': tid, 'id': params['id']}
+        raise AssertionError("unexpected {} {}".format(self.name, tid))
+
+class PortGreDomainTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = CountingAgent()
+        self.vswitch = cvbn_vswitch.vswitch('cvbb', 'h', factory = self.agent)
+
+    def test_membership_checked_with_one_walk(self):
+        self.assertTrue(self.vswitch.isPortGreAnyDomain('s1', 'gre-19'))
+        memberships = [request for request in self.agent.requests if request[1] == 'networking.vswitch.domain.ports']
+        self.assertEqual(len(memberships), 1)
+        self.assertFalse(('walk', 'networking.vswitch.domain') in self.agent.requests)
+        del self.agent.requests[:]
+        self.assertFalse(self.vswitch.isPortGreAnyDomain('s1', 'gre-99'))
+        self.assertEqual(len(self.agent.requests), 3)
+
+    def test_member_port_not_deleted(self):
+        self.assertFalse(self.vswitch.deletePortGre('s1', 'gre-3'))
+        self.assertEqual([request for request in self.agent.requests if request[0] == 'delete'], [])
+        self.assertEqual(len([request for request in self.agent.requests if request[1] == 'compute.server']), 1)
+
+if __name__ == '__main__':
+    unittest.main()